@@ -5,17 +5,54 @@ from app.auth.routes import auth_bp
 from app.users.routes import users_bp
 from app.approvals.routes import approvals_bp
 from app.models import db, FormTemplate
+from app.migrations import upgrade as upgrade_schema
 from app.utils.forms_config import FORM_TEMPLATES
+from app.utils.render_queue import init_render_queue
+from app.auth.directory_sync import init_directory_sync
+from app.auth.msal_client import init_msal_client
+from app.auth.session_store import init_session_store
+from app.utils.template_engine import template_engine
+from app.cli import register_commands
 
 def seed_form_templates():
-    """Insert form templates if they don't exist yet."""
+    """Insert form templates if they don't exist yet, and give existing ones their default routing."""
     for f in FORM_TEMPLATES:
-        if not FormTemplate.query.filter_by(form_code=f["form_code"]).first():
+        existing = FormTemplate.query.filter_by(form_code=f["form_code"]).first()
+        if not existing:
             db.session.add(FormTemplate(**f))
+            continue
+        if existing.routing_json is None and f.get("routing_json"):
+            existing.routing_json = f["routing_json"]
     db.session.commit()
 
-def create_app():
-    """Application factory pattern for Flask app."""
+# app.extensions entries holding background threads (see start/stop_background_workers)
+BACKGROUND_WORKERS = ("session_purger", "render_queue", "directory_sync")
+
+
+def start_background_workers(app):
+    """Start the app's background threads (create_app(start_workers=False) leaves them stopped)."""
+    for name in BACKGROUND_WORKERS:
+        worker = app.extensions.get(name)
+        if worker:
+            worker.start()
+
+
+def stop_background_workers(app, timeout=None):
+    """Stop the background threads, waiting up to `timeout` seconds for each to finish its current work."""
+    for name in BACKGROUND_WORKERS:
+        worker = app.extensions.get(name)
+        if worker:
+            worker.stop(timeout)
+
+
+def create_app(start_workers=True, config=None):
+    """
+    Application factory pattern for Flask app. start_workers=False sets up the
+    background threads without starting them, for servers that load the app
+    before forking (wsgi.py / gunicorn.conf.py start them in each worker).
+    `config` overrides the settings read from the environment (e.g. a scratch
+    SQLALCHEMY_DATABASE_URI for benchmarks and tests).
+    """
     load_dotenv()
     app = Flask(__name__,
                 template_folder='ui/templates',
@@ -26,10 +63,24 @@ def create_app():
     app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
     #Add database config (new lines)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///app.db"
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///app.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Server-side sessions ("cookie" keeps Flask's signed cookie sessions)
+    app.config["SESSION_BACKEND"] = os.getenv("SESSION_BACKEND", "db")
+    app.config["SESSION_TTL"] = float(os.getenv("SESSION_TTL", str(12 * 3600)))
+    app.config["SESSION_PURGE_INTERVAL"] = float(os.getenv("SESSION_PURGE_INTERVAL", "600"))
     # Uploads
     app.config["UPLOAD_FOLDER"] = "uploads/signatures"
+    # Background PDF rendering (0 workers = jobs stay queued until drained elsewhere)
+    app.config["RENDER_WORKERS"] = int(os.getenv("RENDER_WORKERS", "2"))
+    app.config["RENDER_POLL_INTERVAL"] = float(os.getenv("RENDER_POLL_INTERVAL", "2.0"))
+    # Stamp each approval onto the previous step's PDF instead of re-rendering everything
+    app.config["PDF_INCREMENTAL_STAMPING"] = os.getenv("PDF_INCREMENTAL_STAMPING", "1") == "1"
+    # Jobs still 'rendering' after this many seconds are assumed orphaned and requeued at startup
+    app.config["RENDER_JOB_TIMEOUT"] = float(os.getenv("RENDER_JOB_TIMEOUT", "600"))
+    # Microsoft Graph directory sync every N seconds (0 = only via `flask sync-directory`)
+    app.config["DIRECTORY_SYNC_INTERVAL"] = float(os.getenv("DIRECTORY_SYNC_INTERVAL", "0"))
+    app.config.update(config or {})
     db.init_app(app)
 
     #Register existing blueprints
@@ -37,14 +88,23 @@ def create_app():
     app.register_blueprint(users_bp, url_prefix='/users')
     app.register_blueprint(approvals_bp, url_prefix='/approvals')
 
-    # Create tables and ensure upload directory when the app starts
+    register_commands(app)
+
+    # Apply schema migrations and ensure upload directory when the app starts
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         seed_form_templates()
+        # Precompile every registered form's LaTeX template
+        template_engine.warm(t.latex_template_path for t in FormTemplate.query.all())
         # Ensure upload directory exists (relative to project root)
         base_dir = os.path.abspath(os.path.join(app.root_path, os.pardir, app.config["UPLOAD_FOLDER"]))
         os.makedirs(base_dir, exist_ok=True)
 
+    init_session_store(app, start=start_workers)
+    init_msal_client(app)
+    init_render_queue(app, start=start_workers)
+    init_directory_sync(app, start=start_workers)
+
     # Home page route
     @app.route('/')
     def index():
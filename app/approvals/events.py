@@ -0,0 +1,147 @@
+# app/approvals/events.py
+"""
+Append-only approval event log.
+
+Every workflow transition (submit, approve, skip, return, final approval)
+adds a row to approval_events in the same transaction as the transition
+itself. Rows are never updated or deleted (SQLite triggers enforce it), and
+they carry their own copies of the actor's name / email and the form code,
+so the history survives a return resetting the steps or the request and its
+users being deleted, and the audit export never reads the live tables.
+
+A request's timeline reads (request_id, id); the export pages through a
+date range on (at, id).
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import and_, insert, literal, or_, select
+
+from app.models import db, User, Request, FormTemplate, ApprovalStep, ApprovalEvent
+
+EXPORT_BATCH = 1000
+
+
+def log_event(req_obj: Request, event: str, actor: Optional[User] = None, step: Optional[ApprovalStep] = None,
+              comments: Optional[str] = None, at: Optional[datetime] = None) -> None:
+    """Append one event for `req_obj`; the caller commits."""
+    db.session.execute(insert(ApprovalEvent).values(
+        request_id=req_obj.id,
+        form_code=req_obj.form_template.form_code if req_obj.form_template else None,
+        step_id=step.id if step else None,
+        sequence=step.sequence if step else None,
+        event=event,
+        actor_id=actor.id if actor else None,
+        actor_name=actor.name if actor else None,
+        actor_email=actor.email if actor else None,
+        comments=comments,
+        at=at or datetime.utcnow(),
+    ))
+
+
+def log_skipped(req_obj: Request, sequence: int, at: datetime) -> None:
+    """'skipped' events for the stage's still-pending steps, written before they are marked skipped."""
+    db.session.execute(insert(ApprovalEvent).from_select(
+        ["request_id", "form_code", "step_id", "sequence", "event", "actor_id", "actor_name", "actor_email", "at"],
+        select(literal(req_obj.id), literal(req_obj.form_template.form_code if req_obj.form_template else None),
+               ApprovalStep.id, ApprovalStep.sequence, literal("skipped"), User.id, User.name, User.email,
+               literal(at))
+        .join(User, User.id == ApprovalStep.approver_id)
+        .where(ApprovalStep.request_id == req_obj.id, ApprovalStep.sequence == sequence,
+               ApprovalStep.status == "pending")
+        .order_by(ApprovalStep.id)))
+
+
+def log_system_event(request_ids: List[int], event: str, comments: Optional[str], at: datetime) -> None:
+    """One actor-less `event` for each of these requests, in a single INSERT ... SELECT."""
+    db.session.execute(insert(ApprovalEvent).from_select(
+        ["request_id", "form_code", "event", "comments", "at"],
+        select(Request.id, FormTemplate.form_code, literal(event), literal(comments), literal(at))
+        .outerjoin(FormTemplate, FormTemplate.id == Request.form_template_id)
+        .where(Request.id.in_(request_ids))
+        .order_by(Request.id)))
+
+
+def request_timeline(request_id: int) -> List[ApprovalEvent]:
+    """Every event of one request, oldest first."""
+    return list(db.session.scalars(select(ApprovalEvent).where(ApprovalEvent.request_id == request_id)
+                                   .order_by(ApprovalEvent.id)))
+
+
+def iter_events(start: datetime, end: datetime, batch: int = EXPORT_BATCH) -> Iterator[List[dict]]:
+    """Events with start <= at < end in (at, id) order, one list of dicts per keyset batch."""
+    cols = ApprovalEvent.__table__.c
+    after = None
+    while True:
+        query = select(cols).where(cols.at >= start, cols.at < end)
+        if after:
+            query = query.where(or_(cols.at > after[0], and_(cols.at == after[0], cols.id > after[1])))
+        with db.engine.connect() as conn:
+            rows = [dict(r._mapping) for r in conn.execute(query.order_by(cols.at, cols.id).limit(batch))]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch:
+            return
+        after = rows[-1]["at"], rows[-1]["id"]
+
+
+def event_dict(row: dict) -> dict:
+    """Export shape of one event row."""
+    return dict(row, at=row["at"].isoformat() if row["at"] else None)
+
+
+def backfill_events(conn) -> int:
+    """
+    Reconstruct events for requests that predate the log: submission,
+    actioned steps and final approval, in time order. Only what still
+    exists can be recovered (a return has already cleared earlier steps).
+    """
+    if conn.execute(select(ApprovalEvent.id).limit(1)).first():
+        return 0
+    form_code = (select(FormTemplate.form_code).where(FormTemplate.id == Request.form_template_id)
+                 .scalar_subquery())
+    rows = []
+    for r in conn.execute(select(Request.id, form_code.label("form_code"), Request.status, Request.submitted_at,
+                                 Request.updated_at, User.id.label("actor_id"), User.name, User.email)
+                          .outerjoin(User, User.id == Request.requester_id)
+                          .where(Request.submitted_at.is_not(None))):
+        rows.append({"request_id": r.id, "form_code": r.form_code, "step_id": None, "sequence": None,
+                     "event": "submitted", "actor_id": r.actor_id, "actor_name": r.name, "actor_email": r.email,
+                     "comments": None, "at": r.submitted_at})
+        if r.status == "approved":
+            rows.append({"request_id": r.id, "form_code": r.form_code, "step_id": None, "sequence": None,
+                         "event": "completed", "actor_id": None, "actor_name": None, "actor_email": None,
+                         "comments": None, "at": r.updated_at or r.submitted_at})
+    for s in conn.execute(select(ApprovalStep.id, ApprovalStep.request_id, ApprovalStep.sequence,
+                                 ApprovalStep.status, ApprovalStep.comments, ApprovalStep.actioned_at,
+                                 form_code.label("form_code"), User.id.label("actor_id"), User.name, User.email)
+                          .join(Request, Request.id == ApprovalStep.request_id)
+                          .outerjoin(User, User.id == ApprovalStep.approver_id)
+                          .where(ApprovalStep.actioned_at.is_not(None),
+                                 ApprovalStep.status.in_(("approved", "skipped", "returned", "rejected")))):
+        rows.append({"request_id": s.request_id, "form_code": s.form_code, "step_id": s.id, "sequence": s.sequence,
+                     "event": s.status, "actor_id": s.actor_id, "actor_name": s.name, "actor_email": s.email,
+                     "comments": s.comments, "at": s.actioned_at})
+    # a request was completed by its last approval
+    last_approval = {}
+    for e in rows:
+        if e["event"] == "approved":
+            last_approval[e["request_id"]] = max(e["at"], last_approval.get(e["request_id"], e["at"]))
+    for e in rows:
+        if e["event"] == "completed":
+            e["at"] = last_approval.get(e["request_id"], e["at"])
+    rows.sort(key=lambda e: (e["at"], e["event"] == "completed", e["step_id"] or 0))
+    for i in range(0, len(rows), 500):
+        conn.execute(insert(ApprovalEvent), rows[i:i + 500])
+    return len(rows)
+
+
+def create_append_only_triggers(conn) -> None:
+    """Reject UPDATE / DELETE on approval_events (SQLite only; elsewhere use grants)."""
+    if conn.dialect.name != "sqlite":
+        return
+    for op in ("UPDATE", "DELETE"):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS approval_events_no_{op.lower()} BEFORE {op} ON approval_events "
+            f"BEGIN SELECT RAISE(ABORT, 'approval_events is append-only'); END")
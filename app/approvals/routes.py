@@ -1,11 +1,20 @@
 # app/approvals/routes.py
 import os
+import uuid
 from datetime import datetime
-from flask import (Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory, session )
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory, session, jsonify,
+                   Response, stream_with_context)
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 from app.models import db, User, Signature, Request, FormTemplate, ApprovalStep
-from app.utils.pdf_generator import generate_request_pdf
-from app.users.routes import require_login, current_db_user
+from app.approvals.events import iter_events, event_dict, log_event, request_timeline
+from app.approvals.routing import RoutingError, route_request
+from app.approvals.workflow import (actionable_step, approve_step, current_stage, needed_approvals, record_outcome,
+                                    replayed_outcome, return_step, stage_summary)
+from app.utils.render_queue import (enqueue_base_render, enqueue_step_render, notify_render_workers,
+                                    signature_paths_for_step)
+from app.utils.search_index import SEARCH_PAGE_SIZE, index_request, search_requests
+from app.users.routes import require_login, require_admin, current_db_user
 from datetime import datetime
 import json
 
@@ -16,6 +25,18 @@ ALLOWED_MIMETYPES = {"image/png", "image/jpeg"}
 MAX_BYTES = 2 * 1024 * 1024  # 2MB
 
 
+def _route_submitted(req_obj: Request) -> bool:
+    """Log the submission and create its approval chain; False (and a warning) if it can't be routed."""
+    log_event(req_obj, "submitted", actor=req_obj.requester, at=req_obj.submitted_at)
+    try:
+        route_request(req_obj)
+        return True
+    except RoutingError as e:
+        current_app.logger.warning("request %s left unrouted: %s", req_obj.id, e)
+        flash("No approver could be assigned yet; an administrator will route your request.", "warning")
+        return False
+
+
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -132,7 +153,7 @@ def submit_request(form_code):
     user_email = user_info.get("preferred_username") if user_info else None
     user_name = user_info.get("name") if user_info else "Unknown User"
 
-    user = User.query.filter_by(email=user_email).first()
+    user = current_db_user()
 
     
     if not user and user_email:
@@ -158,10 +179,17 @@ def submit_request(form_code):
         requester_id=user.id,
         form_data_json=form_data,
         status="draft" if action == "draft" else "pending",
+        submitted_at=None if action == "draft" else datetime.utcnow(),
     )
 
     db.session.add(new_request)
+    db.session.flush()
+    index_request(new_request)
+    if new_request.status == "pending":
+        enqueue_base_render(new_request)
+        _route_submitted(new_request)
     db.session.commit()
+    notify_render_workers(current_app)
 
     flash("Form saved as draft!" if action == "draft" else "Form submitted for approval!", "success")
     return redirect(url_for("approvals_bp.list_forms"))
@@ -183,7 +211,7 @@ def fill_form(form_code):
         return redirect(url_for("auth.login"))
 
     
-    db_user = User.query.filter_by(email=user["preferred_username"]).first()
+    db_user = current_db_user()
     if not db_user:
         flash("User not found in database.", "danger")
         return redirect(url_for("auth.login"))
@@ -222,7 +250,13 @@ def fill_form(form_code):
         )
 
         db.session.add(new_request)
+        db.session.flush()
+        index_request(new_request)
+        if status == "pending":
+            enqueue_base_render(new_request)
+            _route_submitted(new_request)
         db.session.commit()
+        notify_render_workers(current_app)
 
         flash(message, "success")
         return redirect(url_for("approvals_bp.list_my_requests"))
@@ -245,7 +279,7 @@ def edit_request(request_id):
         flash("You must be logged in to edit requests.", "warning")
         return redirect(url_for("auth.login"))
 
-    db_user = User.query.filter_by(email=user["preferred_username"]).first()
+    db_user = current_db_user()
     if not db_user:
         flash("User not found in database.", "danger")
         return redirect(url_for("auth.login"))
@@ -288,9 +322,13 @@ def edit_request(request_id):
         else:
             req.status = "pending"
             req.submitted_at = datetime.utcnow()
+            enqueue_base_render(req)
+            _route_submitted(req)
             flash("Form submitted for approval!", "success")
 
+        index_request(req)
         db.session.commit()
+        notify_render_workers(current_app)
         return redirect(url_for("approvals_bp.list_my_requests"))
 
     return render_template(
@@ -310,22 +348,44 @@ def list_my_requests():
         flash("You must be logged in to view your requests.", "warning")
         return redirect(url_for("auth.login"))
 
-    db_user = User.query.filter_by(email=user["preferred_username"]).first()
+    db_user = current_db_user()
     if not db_user:
         flash("User not found in database.", "danger")
         return redirect(url_for("auth.login"))
 
-    requester_id = db_user.id
+    status = (request.args.get("status") or "").lower()
+    cursor = request.args.get("after") or None
+    rows, next_cursor = _my_requests_page(db_user.id, status, cursor)
+    return render_template("my_requests.html", requests=rows, counts=_my_request_counts(db_user.id),
+                           status=status, next_cursor=next_cursor, is_first_page=not cursor)
+
 
-    requests = Request.query.filter_by(requester_id=requester_id).order_by(Request.created_at.desc()).all()
 
-    return render_template("my_requests.html", requests=requests)
+from sqlalchemy import String, and_, case, cast, func, or_, select
+from sqlalchemy.orm import aliased, contains_eager, joinedload
 
+def _stage_progress(steps) -> dict:
+    """(request_id, sequence) -> 'approved/needed' for the parallel stages of these steps."""
+    keys = {(s.request_id, s.sequence) for s in steps}
+    if not keys:
+        return {}
+    rows = db.session.execute(
+        select(ApprovalStep.request_id, ApprovalStep.sequence, func.count(),
+               func.sum(case((ApprovalStep.status == "approved", 1), else_=0)), func.max(ApprovalStep.quorum))
+        .where(ApprovalStep.request_id.in_({request_id for request_id, _ in keys}))
+        .group_by(ApprovalStep.request_id, ApprovalStep.sequence))
+    return {(request_id, sequence): f"{approved}/{needed_approvals(quorum, members)}"
+            for request_id, sequence, members, approved, quorum in rows
+            if members > 1 and (request_id, sequence) in keys}
 
 
-from sqlalchemy.orm import joinedload
+def _waiting_on(req_obj: Request) -> str:
+    if req_obj.current_approver is not None:
+        return req_obj.current_approver.name
+    return f"stage {req_obj.current_stage} (parallel)" if req_obj.current_stage else "—"
 
-def _dto_row_for_approver(req_obj: Request, step: ApprovalStep):
+
+def _dto_row_for_approver(req_obj: Request, step: ApprovalStep, stage_progress: str | None = None):
     return {
         "id": req_obj.id,
         "student_name": req_obj.requester.name if req_obj.requester else "—",
@@ -333,40 +393,76 @@ def _dto_row_for_approver(req_obj: Request, step: ApprovalStep):
         "state": req_obj.status.upper(),
         "step_number": step.sequence if step else None,
         "step_status": step.status.upper() if step else None,
+        "stage_progress": stage_progress,
+        "waiting_on": _waiting_on(req_obj),
+        "waiting_on_id": req_obj.current_approver_id,
+        "pdf_status": step.pdf_status.upper() if step and step.pdf_status else None,
         "updated_at": req_obj.updated_at.strftime("%Y-%m-%d %H:%M") if req_obj.updated_at else ""
     }
 
-def _dto_row_for_student(req_obj: Request, current_step: ApprovalStep | None):
+MY_REQUESTS_PAGE_SIZE = 50
+
+
+def _my_requests_page(requester_id: int, status: str = "", cursor: str | None = None,
+                      limit: int = MY_REQUESTS_PAGE_SIZE):
+    """
+    One keyset page of the requester's list as plain rows: only the columns
+    the page shows (no form_data_json), the form name by join and the
+    denormalized current stage, so it is one statement whatever the row count.
+    """
+    query = (select(Request.id, FormTemplate.name.label("form_name"), Request.status,
+                    Request.current_stage.label("step_number"),
+                    Request.created_at, Request.updated_at, Request.submitted_at)
+             .join(FormTemplate, Request.form_template_id == FormTemplate.id)
+             .where(Request.requester_id == requester_id))
+    if status:
+        query = query.where(Request.status == status)
+    after = _decode_cursor(cursor) if cursor else None
+    if after:
+        ts, request_id = after
+        query = query.where(or_(Request.created_at < ts, and_(Request.created_at == ts, Request.id < request_id))
+                            if ts else and_(Request.created_at.is_(None), Request.id < request_id))
+    rows = db.session.execute(query.order_by(Request.created_at.desc().nulls_last(), Request.id.desc())
+                              .limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [_dto_row_for_student(r) for r in rows], next_cursor
+
+
+def _my_request_counts(requester_id: int) -> dict:
+    counts = dict(db.session.execute(select(Request.status, func.count())
+                                     .where(Request.requester_id == requester_id)
+                                     .group_by(Request.status)).all())
+    counts["all"] = sum(counts.values())
+    return counts
+
+
+def _dto_row_for_student(row):
     return {
-        "id": req_obj.id,
-        "form_name": req_obj.form_template.name if req_obj.form_template else "—",
-        "state": req_obj.status.upper(),
-        "step_number": current_step.sequence if current_step else None,
-        "step_status": current_step.status.upper() if current_step else None,
-        "updated_at": req_obj.updated_at.strftime("%Y-%m-%d %H:%M") if req_obj.updated_at else ""
+        "id": row.id,
+        "form_name": row.form_name or "—",
+        "state": row.status.upper(),
+        "step_number": row.step_number,
+        "submitted_at": row.submitted_at.strftime("%Y-%m-%d %H:%M") if row.submitted_at else "",
+        "updated_at": row.updated_at.strftime("%Y-%m-%d %H:%M") if row.updated_at else ""
     }
 
 def _detail_dto(req_obj: Request):
-    # current step = first 'pending' else last step
-    pending = next((s for s in req_obj.approval_steps if s.status == "pending"), None)
-    last    = req_obj.approval_steps[-1] if req_obj.approval_steps else None
-    current = pending or last
-
-    # history timeline
-    history = []
-    if req_obj.submitted_at:
-        history.append({
-            "at": req_obj.submitted_at.strftime("%Y-%m-%d %H:%M"),
-            "event": "SUBMITTED",
-            "by": req_obj.requester.name if req_obj.requester else "System"
-        })
-    for s in req_obj.approval_steps:
-        if s.status in ("approved", "rejected", "returned") and s.actioned_at:
-            history.append({
-                "at": s.actioned_at.strftime("%Y-%m-%d %H:%M"),
-                "event": s.status.upper(),
-                "by": s.approver.name if s.approver else "Approver"
-            })
+    # current stage = the request's current_stage pointer, else the last one
+    stages = stage_summary(req_obj)
+    stage_no = current_stage(req_obj)
+    current = next((st for st in stages if st["number"] == stage_no), stages[-1] if stages else None)
+
+    # history timeline, from the append-only event log
+    history = [{
+        "at": e.at.strftime("%Y-%m-%d %H:%M"),
+        "event": e.event.upper(),
+        "by": e.actor_name or "System",
+        "stage": e.sequence,
+        "comments": e.comments,
+    } for e in request_timeline(req_obj.id)]
 
     # PDFs from signed_pdf_path on steps
     pdfs = []
@@ -376,7 +472,16 @@ def _detail_dto(req_obj: Request):
                 "name": os.path.basename(s.signed_pdf_path),
                 "url": f"/{s.signed_pdf_path.lstrip('/')}",
                 "stateAtGen": s.status.upper(),
-                "stepNumber": s.sequence
+                "stepNumber": s.sequence,
+                "renderStatus": (s.pdf_status or "rendered").upper()
+            })
+        elif s.pdf_status in ("rendering", "failed"):
+            pdfs.append({
+                "name": None,
+                "url": None,
+                "stateAtGen": s.status.upper(),
+                "stepNumber": s.sequence,
+                "renderStatus": s.pdf_status.upper()
             })
 
     # flatten form_data_json
@@ -395,10 +500,13 @@ def _detail_dto(req_obj: Request):
             "email": req_obj.requester.email if req_obj.requester else "—",
         },
         "state": req_obj.status.upper(),
+        "version": req_obj.version,
         "current_step": {
-            "number": current.sequence if current else None,
-            "assignee": current.approver.name if current and current.approver else None 
-},
+            "number": current["number"] if current else None,
+            "assignee": ", ".join(s.approver.name for s in current["pending"] if s.approver) if current else None,
+            "quorum": current["quorum"] if current else "",
+            "progress": f'{current["approved"]}/{current["needed"]} approved' if current else "",
+        },
         "submitted_at": req_obj.submitted_at.strftime("%Y-%m-%d %H:%M") if req_obj.submitted_at else "",
         "updated_at": req_obj.updated_at.strftime("%Y-%m-%d %H:%M") if req_obj.updated_at else "",
         "fields": fields,
@@ -408,6 +516,74 @@ def _detail_dto(req_obj: Request):
 
 # -------- Approver Dashboard--------
 
+DASHBOARD_PAGE_SIZE = 50
+
+
+def _encode_cursor(updated_at, step_id) -> str:
+    return f"{updated_at.isoformat() if updated_at else ''}|{step_id}"
+
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, step_id = cursor.rsplit("|", 1)
+        return (datetime.fromisoformat(ts) if ts else None), int(step_id)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _approver_dashboard_query(approver_id: int, state: str, q: str, waiting_on: int | None = None):
+    """Steps assigned to the approver with the state and search filters applied in SQL."""
+    requester = aliased(User)
+    waiting = aliased(User)
+    query = (ApprovalStep.query
+             .join(Request, ApprovalStep.request_id == Request.id)
+             .join(requester, Request.requester_id == requester.id)
+             .join(FormTemplate, Request.form_template_id == FormTemplate.id)
+             .outerjoin(waiting, Request.current_approver_id == waiting.id)
+             .filter(ApprovalStep.approver_id == approver_id))
+    # default: show pending step assignments; if state filter given (approved/rejected/returned),
+    # apply to the Request.status instead
+    if state:
+        query = query.filter(Request.status == state)
+    else:
+        # awaiting action: my pending steps in the request's current stage
+        query = query.filter(ApprovalStep.status == "pending", Request.status == "pending",
+                             ApprovalStep.sequence == Request.current_stage)
+    if waiting_on:
+        query = query.filter(Request.current_approver_id == waiting_on)
+    if q:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(or_(cast(Request.id, String).like(pattern, escape="\\"),
+                                 func.lower(requester.name).like(pattern, escape="\\"),
+                                 func.lower(FormTemplate.name).like(pattern, escape="\\")))
+    return query.options(contains_eager(ApprovalStep.request).contains_eager(Request.requester.of_type(requester)),
+                         contains_eager(ApprovalStep.request).contains_eager(Request.form_template),
+                         contains_eager(ApprovalStep.request).contains_eager(Request.current_approver.of_type(waiting)))
+
+
+def _approver_dashboard_page(approver_id: int, state: str, q: str, cursor: str | None = None,
+                             limit: int = DASHBOARD_PAGE_SIZE, waiting_on: int | None = None):
+    """One keyset page ordered by (Request.updated_at, step id) descending, plus the total count."""
+    query = _approver_dashboard_query(approver_id, state, q, waiting_on)
+    total = query.order_by(None).count()
+    after = _decode_cursor(cursor) if cursor else None
+    if after:
+        ts, step_id = after
+        if ts is None:
+            query = query.filter(Request.updated_at.is_(None), ApprovalStep.id < step_id)
+        else:
+            query = query.filter(or_(Request.updated_at < ts,
+                                     and_(Request.updated_at == ts, ApprovalStep.id < step_id),
+                                     Request.updated_at.is_(None)))
+    steps = (query.order_by(Request.updated_at.desc().nulls_last(), ApprovalStep.id.desc())
+             .limit(limit + 1).all())
+    next_cursor = None
+    if len(steps) > limit:
+        steps = steps[:limit]
+        next_cursor = _encode_cursor(steps[-1].request.updated_at, steps[-1].id)
+    return steps, next_cursor, total
+
+
 @approvals_bp.get("/approver/dashboard")
 @require_login
 def approver_dashboard():
@@ -418,34 +594,54 @@ def approver_dashboard():
 
     state = (request.args.get("state") or "").lower()  # default empty shows pending by step
     q = (request.args.get("q") or "").strip().lower()
+    cursor = request.args.get("after") or None
+    waiting_on = request.args.get("waiting_on", type=int)
 
-    steps_q = (ApprovalStep.query
-               .filter(ApprovalStep.approver_id == me.id)
-               .join(Request, ApprovalStep.request_id == Request.id)
-               .options(joinedload(ApprovalStep.request)
-                        .joinedload(Request.form_template),
-                        joinedload(ApprovalStep.request)
-                        .joinedload(Request.requester))
-               .order_by(Request.updated_at.desc()))
+    steps, next_cursor, total = _approver_dashboard_page(me.id, state, q, cursor, waiting_on=waiting_on)
+    progress = _stage_progress(steps)
+    rows = [_dto_row_for_approver(s.request, s, progress.get((s.request_id, s.sequence))) for s in steps]
 
-    # default: show pending step assignments; if state filter given (approved/rejected/returned),
-    # apply to the Request.status instead
-    rows = []
-    for s in steps_q.limit(200).all():
-        req = s.request
-        if state:
-            if req.status != state:
-                continue
-        else:
-            if s.status != "pending":
-                continue
-        if q and (q not in str(req.id).lower()
-                  and q not in (req.requester.name or "").lower()
-                  and q not in (req.form_template.name or "").lower()):
-            continue
-        rows.append(_dto_row_for_approver(req, s))
+    return render_template("approver_dashboard.html", requests=rows, total=total,
+                           next_cursor=next_cursor, is_first_page=not cursor)
+
+@approvals_bp.get("/approver/search")
+@require_login
+def approver_search():
+    """Ranked full-text search over form data; admins see everything, approvers their own requests."""
+    me = current_db_user()
+    if not me or me.status != "active":
+        return jsonify({"error": "Forbidden"}), 403
+
+    q = (request.args.get("q") or "").strip()
+    page = request.args.get("page", 1, type=int)
+    per_page = min(max(request.args.get("per_page", SEARCH_PAGE_SIZE, type=int), 1), 100)
+    hits, total = search_requests(q, me, page=page, per_page=per_page)
+    return jsonify({
+        "q": q,
+        "page": max(page, 1),
+        "per_page": per_page,
+        "total": total,
+        "results": [dict(_dto_row_for_approver(r, None), snippet=snippet) for r, snippet in hits],
+    })
+
+def _load_for_detail(request_id: int):
+    return (Request.query
+            .options(joinedload(Request.form_template),
+                     joinedload(Request.requester),
+                     joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
+            .filter_by(id=request_id)
+            .first())
+
+
+def _render_approver_detail(req_obj: Request, me: User, conflict: str | None = None):
+    d = _detail_dto(req_obj)
+    # only a pending step in the current stage can be acted on
+    has_pending_for_me = actionable_step(req_obj, me.id) is not None
+    # one key per rendered form: a resubmit of the same form replays instead of acting twice
+    action_keys = {"approve": uuid.uuid4().hex, "return": uuid.uuid4().hex}
+    return render_template("request_detail.html", d=d, view="approver", has_pending_for_me=has_pending_for_me,
+                           action_keys=action_keys, conflict=conflict)
 
-    return render_template("approver_dashboard.html", requests=rows)
 
 @approvals_bp.get("/approver/requests/<int:request_id>")
 @require_login
@@ -455,13 +651,7 @@ def approver_request_detail(request_id: int):
         flash("You must be logged in.", "warning")
         return redirect(url_for("auth.login"))
 
-    req_obj = (Request.query
-               .options(joinedload(Request.form_template),
-                        joinedload(Request.requester),
-                        
-joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
-               .filter_by(id=request_id)
-               .first())
+    req_obj = _load_for_detail(request_id)
     if not req_obj:
         flash("Request not found.", "warning")
         return redirect(url_for("approvals_bp.approver_dashboard"))
@@ -472,10 +662,51 @@ joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
         flash("You are not authorized to view this request.", "warning")
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
-    d = _detail_dto(req_obj)
-    # determine if current user has a pending step
-    has_pending_for_me = any(s.approver_id == me.id and s.status == "pending" for s in req_obj.approval_steps)
-    return render_template("request_detail.html", d=d, view="approver", has_pending_for_me=has_pending_for_me)
+    return _render_approver_detail(req_obj, me)
+
+
+ACTION_MESSAGES = {
+    "request_approved": "Request fully approved ✅",
+    "stage_complete": "Approved and forwarded to next approver ➡️",
+    "recorded": "Approved; waiting for the other approvers of this stage.",
+    "returned": "Request returned to student for revision 🔙",
+}
+
+
+def _wants_json() -> bool:
+    return request.is_json or request.accept_mimetypes.best == "application/json"
+
+
+def _action_params():
+    """(expected request version, idempotency key) from the form, JSON body or Idempotency-Key header."""
+    body = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        version = int(body.get("version")) if body.get("version") not in (None, "") else None
+    except (TypeError, ValueError):
+        version = None
+    key = (request.headers.get("Idempotency-Key") or body.get("idempotency_key") or "").strip()[:64] or None
+    return version, key, body.get("comments")
+
+
+def _action_done(request_id: int, outcome: str, replayed: bool = False):
+    if _wants_json():
+        version = db.session.scalar(select(Request.version).where(Request.id == request_id))
+        return jsonify({"ok": True, "outcome": outcome, "replayed": replayed, "version": version})
+    flash(ACTION_MESSAGES[outcome], "success")
+    return redirect(url_for("approvals_bp.approver_dashboard"))
+
+
+def _action_conflict(request_id: int, me: User, action: str, key: str | None, message: str):
+    """409 with the current state, unless a twin submit of the same form won the race (then replay it)."""
+    db.session.rollback()
+    outcome = replayed_outcome(key, me.id, request_id, action)
+    if outcome:
+        return _action_done(request_id, outcome, replayed=True)
+    if _wants_json():
+        version = db.session.scalar(select(Request.version).where(Request.id == request_id))
+        return jsonify({"error": "conflict", "message": message, "version": version}), 409
+    return _render_approver_detail(_load_for_detail(request_id), me, conflict=message), 409
+
 
 @approvals_bp.post("/approver/requests/<int:request_id>/approve")
 @require_login
@@ -485,6 +716,11 @@ def approver_request_approve(request_id: int):
         flash("You must be logged in.", "warning")
         return redirect(url_for("auth.login"))
 
+    version, key, comments = _action_params()
+    outcome = replayed_outcome(key, me.id, request_id, "approve")
+    if outcome:
+        return _action_done(request_id, outcome, replayed=True)
+
     req_obj = (Request.query
                .options(joinedload(Request.approval_steps),
                         joinedload(Request.requester),
@@ -495,11 +731,10 @@ def approver_request_approve(request_id: int):
         flash("Request not found.", "warning")
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
-    # current pending step for this approver
-    step = next((s for s in req_obj.approval_steps if s.approver_id == me.id and s.status == "pending"), None)
+    # this approver's pending step in the current stage
+    step = actionable_step(req_obj, me.id)
     if not step:
-        flash("No pending step for you", "warning")
-        return redirect(url_for("approvals_bp.approver_dashboard"))
+        return _action_conflict(request_id, me, "approve", key, "There is no pending step for you on this request.")
 
     # ensure signature exists
     sig = Signature.query.filter_by(user_id=me.id).first()
@@ -507,36 +742,24 @@ def approver_request_approve(request_id: int):
         flash("Please upload a signature first", "warning")
         return redirect(url_for("approvals_bp.signature_upload_get"))
 
-    # Collect signature paths: all previously approved steps + current approver, in sequence order
-    signature_paths = []
-    for s in sorted(req_obj.approval_steps, key=lambda x: x.sequence):
-        if s.status == "approved" or s.id == step.id:
-            other_sig = Signature.query.filter_by(user_id=s.approver_id).first()
-            if other_sig and other_sig.image_path:
-                signature_paths.append(other_sig.image_path)
+    outcome = approve_step(req_obj, step, comments, expected_version=version)
+    if outcome is None:
+        return _action_conflict(request_id, me, "approve", key,
+                                "This request changed since you opened it; review it and try again.")
 
-    # Generate PDF and store relative path
+    # Collect signature paths: every approval so far, in approval order
+    signature_paths = signature_paths_for_step(req_obj, step)
+
+    # Queue PDF generation; the render workers fill in signed_pdf_path
+    enqueue_step_render(step, signature_paths)
+    record_outcome(key, me.id, request_id, "approve", outcome)
     try:
-        pdf_rel_path = generate_request_pdf(req_obj, signature_paths)
-        step.signed_pdf_path = pdf_rel_path
-    except Exception as e:
-        flash(f"Failed to generate PDF: {e}", "danger")
-        return redirect(url_for("approvals_bp.approver_request_detail", request_id=req_obj.id))
-
-    # Update step
-    step.status = "approved"
-    step.actioned_at = datetime.utcnow()
-    step.comments = request.form.get("comments")
-
-    # If all steps approved, mark request approved
-    if all(s.status == "approved" for s in req_obj.approval_steps):
-        req_obj.status = "approved"
-        flash("Request fully approved ✅", "success")
-    else:
-        flash("Approved and forwarded to next approver ➡️", "success")
+        db.session.commit()
+    except IntegrityError:  # the same form was submitted twice at once and the twin committed first
+        return _action_conflict(request_id, me, "approve", key, "This form was already submitted.")
+    notify_render_workers(current_app)
+    return _action_done(request_id, outcome)
 
-    db.session.commit()
-    return redirect(url_for("approvals_bp.approver_dashboard"))
 
 @approvals_bp.post("/approver/requests/<int:request_id>/return")
 @require_login
@@ -546,6 +769,11 @@ def approver_request_return(request_id: int):
         flash("You must be logged in.", "warning")
         return redirect(url_for("auth.login"))
 
+    version, key, comments = _action_params()
+    outcome = replayed_outcome(key, me.id, request_id, "return")
+    if outcome:
+        return _action_done(request_id, outcome, replayed=True)
+
     req_obj = (Request.query
                .options(joinedload(Request.approval_steps),
                         joinedload(Request.requester),
@@ -556,30 +784,22 @@ def approver_request_return(request_id: int):
         flash("Request not found.", "warning")
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
-    # current pending step for this approver
-    step = next((s for s in req_obj.approval_steps if s.approver_id == me.id and s.status == "pending"), None)
+    # this approver's pending step in the current stage
+    step = actionable_step(req_obj, me.id)
     if not step:
-        flash("No pending step", "warning")
-        return redirect(url_for("approvals_bp.approver_dashboard"))
+        return _action_conflict(request_id, me, "return", key, "There is no pending step for you on this request.")
 
-    # Update current step
-    step.status = "returned"
-    step.actioned_at = datetime.utcnow()
-    step.comments = request.form.get("comments")
+    # Return the request and reset all other steps
+    if not return_step(req_obj, step, comments, expected_version=version):
+        return _action_conflict(request_id, me, "return", key,
+                                "This request changed since you opened it; review it and try again.")
 
-    # Update request
-    req_obj.status = "returned"
-
-    # Reset all other steps
-    for s in req_obj.approval_steps:
-        if s.id != step.id:
-            s.status = "pending"
-            s.actioned_at = None
-            s.signed_pdf_path = None
-
-    db.session.commit()
-    flash("Request returned to student for revision 🔙", "success")
-    return redirect(url_for("approvals_bp.approver_dashboard"))
+    record_outcome(key, me.id, request_id, "return", "returned")
+    try:
+        db.session.commit()
+    except IntegrityError:
+        return _action_conflict(request_id, me, "return", key, "This form was already submitted.")
+    return _action_done(request_id, "returned")
 
 # -------- Student Request Detail --------
 
@@ -609,3 +829,34 @@ joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
     d = _detail_dto(req_obj)
     return render_template("request_detail.html", d=d, view="student")
 
+
+# -------- Audit Export --------
+
+def _parse_day(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+@approvals_bp.get("/audit/events")
+@require_login
+@require_admin
+def audit_events_export():
+    """
+    Stream approval events with start <= at < end as NDJSON, read from the
+    event log alone in keyset batches. start is required; end defaults to now.
+    Dates are ISO 8601 (YYYY-MM-DD or a full timestamp, UTC).
+    """
+    try:
+        start = _parse_day(request.args.get("start"))
+        end = _parse_day(request.args.get("end")) or datetime.utcnow()
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO 8601 dates"}), 400
+    if start is None or start >= end:
+        return jsonify({"error": "start is required and must be before end"}), 400
+
+    def generate():
+        for rows in iter_events(start, end):
+            yield "".join(json.dumps(event_dict(row)) + "\n" for row in rows)
+
+    filename = f"approval_events_{start:%Y%m%d}_{end:%Y%m%d}.ndjson"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
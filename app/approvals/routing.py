@@ -0,0 +1,215 @@
+# app/approvals/routing.py
+"""
+Approval routing: turn a submitted request into its chain of ApprovalSteps.
+
+Each FormTemplate carries routing rules in routing_json, a list tried in
+order; the first rule whose `when` matches the form data supplies the steps:
+
+    [
+      {"when": {"petition_reason_number": {"startswith": ["15.", "16."]}},
+       "steps": [{"role": "admin"}, {"user": "graduate.studies@uh.edu"}]},
+      {"when": {"campus": ["Clear Lake", "Victoria"]}, "steps": [{"user": "regional@uh.edu"}]},
+      {"steps": [{"role": "admin"}]}
+    ]
+
+A `when` maps field names to a value, a list of values, or an operator dict
+({"in": [...]}, {"not_in": [...]}, {"startswith": "..." or [...]}); every
+field must match, and multi-select fields match if any chosen option does.
+A rule without `when` always matches. Steps name a user by email or a role;
+a role resolves to its active member with the fewest pending steps, not
+repeating anyone already in the chain. The requester never approves their
+own request, and routing fails rather than reuse an approver when a role
+runs out of distinct members. A step can also be a parallel stage whose
+members act concurrently until its quorum is met:
+
+    {"parallel": [{"user": "registrar@uh.edu"}, {"user": "finaid@uh.edu"}],
+     "quorum": "all" | "any" | N}
+
+Rules are compiled once per template and cached until routing_json changes.
+"""
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+
+from app.approvals.workflow import sync_progress
+from app.models import db, User, Request, FormTemplate, ApprovalStep
+
+_OPERATORS = ("in", "not_in", "startswith")
+_PROGRESS_ATTRS = ["current_stage", "current_approver_id", "steps_total", "steps_approved", "updated_at"]
+
+# ([(kind, value), ...], quorum): one stage of the chain; quorum None means all members
+Stage = Tuple[List[Tuple[str, str]], Optional[int]]
+
+
+class RoutingError(ValueError):
+    """Routing rules are malformed, or no approver could be resolved for a request."""
+
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [str(v).strip() for v in values if v is not None]
+
+
+def _compile_condition(field: str, spec) -> Callable[[dict], bool]:
+    if not isinstance(spec, dict):
+        spec = {"in": _as_list(spec)}
+    unknown = set(spec) - set(_OPERATORS)
+    if unknown:
+        raise RoutingError(f"unknown operator(s) for {field!r}: {', '.join(sorted(unknown))}")
+    allowed = set(_as_list(spec["in"])) if "in" in spec else None
+    denied = set(_as_list(spec.get("not_in")))
+    prefixes = tuple(_as_list(spec.get("startswith")))
+
+    def matches(data: dict) -> bool:
+        values = _as_list(data.get(field))
+        if allowed is not None and not any(v in allowed for v in values):
+            return False
+        if denied and any(v in denied for v in values):
+            return False
+        if prefixes and not any(v.startswith(prefixes) for v in values):
+            return False
+        return True
+
+    return matches
+
+
+def _compile_member(spec) -> Tuple[str, str]:
+    if isinstance(spec, dict) and len(spec) == 1:
+        (kind, value), = spec.items()
+        if kind in ("user", "role") and isinstance(value, str) and value.strip():
+            value = value.strip()
+            return kind, value.lower() if kind == "user" else value
+    raise RoutingError(f"a step must be {{'user': email}} or {{'role': name}}, got {spec!r}")
+
+
+def _compile_stage(spec) -> Stage:
+    if not (isinstance(spec, dict) and "parallel" in spec):
+        return [_compile_member(spec)], None
+    members = spec["parallel"]
+    if not isinstance(members, list) or not members or set(spec) - {"parallel", "quorum"}:
+        raise RoutingError(f"a parallel stage needs a non-empty 'parallel' list and optional 'quorum', got {spec!r}")
+    quorum = spec.get("quorum", "all")
+    if quorum == "all":
+        quorum = None
+    elif quorum == "any":
+        quorum = 1
+    elif not (isinstance(quorum, int) and 1 <= quorum <= len(members)):
+        raise RoutingError(f"quorum must be 'all', 'any' or 1..{len(members)}, got {quorum!r}")
+    return [_compile_member(m) for m in members], quorum
+
+
+class CompiledRoute:
+    """Routing rules of one template, as predicates plus step specs."""
+
+    def __init__(self, rules: Optional[list]):
+        if rules is not None and not isinstance(rules, list):
+            raise RoutingError("routing rules must be a list")
+        self.rules: List[Tuple[List[Callable[[dict], bool]], List[Stage]]] = []
+        for rule in rules or []:
+            if not isinstance(rule, dict) or not rule.get("steps"):
+                raise RoutingError(f"each rule needs a non-empty 'steps' list, got {rule!r}")
+            conditions = [_compile_condition(field, spec) for field, spec in (rule.get("when") or {}).items()]
+            self.rules.append((conditions, [_compile_stage(s) for s in rule["steps"]]))
+
+    def stages_for(self, form_data: dict) -> List[Stage]:
+        """Stages of the first matching rule ([] when nothing matches)."""
+        data = form_data or {}
+        for conditions, steps in self.rules:
+            if all(cond(data) for cond in conditions):
+                return steps
+        return []
+
+
+_compiled: Dict[int, Tuple[str, CompiledRoute]] = {}
+_compiled_lock = threading.Lock()
+
+
+def compiled_route(form_template: FormTemplate) -> CompiledRoute:
+    """The template's compiled rules, recompiled only when routing_json changed."""
+    fingerprint = json.dumps(form_template.routing_json, sort_keys=True)
+    cached = _compiled.get(form_template.id)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    route = CompiledRoute(form_template.routing_json)
+    with _compiled_lock:
+        _compiled[form_template.id] = (fingerprint, route)
+    return route
+
+
+def invalidate_routing_cache() -> None:
+    with _compiled_lock:
+        _compiled.clear()
+
+
+def _resolve_approvers(stages: List[Stage], requester_id: Optional[int] = None
+                       ) -> List[Tuple[List[int], Optional[int]]]:
+    """User ids for every stage: one query for named users, one per role; never the requester or a repeat."""
+    members = [m for stage_members, _ in stages for m in stage_members]
+    emails = [value for kind, value in members if kind == "user"]
+    by_email = {}
+    if emails:
+        by_email = {email.lower(): user_id for user_id, email in db.session.execute(
+            select(User.id, User.email).where(func.lower(User.email).in_(emails), User.status == "active"))}
+
+    candidates: Dict[str, List[int]] = {}
+    pending = (select(ApprovalStep.approver_id, func.count().label("n"))
+               .where(ApprovalStep.status == "pending")
+               .group_by(ApprovalStep.approver_id).subquery())
+    for role in {value for kind, value in members if kind == "role"}:
+        candidates[role] = list(db.session.scalars(
+            select(User.id)
+            .outerjoin(pending, pending.c.approver_id == User.id)
+            .where(User.role == role, User.status == "active", User.id != requester_id)
+            .order_by(func.coalesce(pending.c.n, 0), User.id)))
+
+    chain: List[int] = []
+    resolved = []
+    for stage_members, quorum in stages:
+        stage: List[int] = []
+        for kind, value in stage_members:
+            if kind == "user":
+                user_id = by_email.get(value)
+                if user_id is None:
+                    raise RoutingError(f"approver {value} does not exist or is deactivated")
+                if user_id == requester_id:
+                    raise RoutingError(f"approver {value} is the requester")
+            else:
+                user_id = next((m for m in candidates[value] if m not in chain and m not in stage), None)
+                if user_id is None:
+                    raise RoutingError(f"not enough distinct active users with the role {value!r} "
+                                       f"(the requester can't approve their own request)")
+            if user_id in stage:
+                raise RoutingError(f"not enough distinct approvers for a parallel stage ({kind} {value})")
+            stage.append(user_id)
+        chain.extend(stage)
+        resolved.append((stage, quorum if len(stage) > 1 else None))
+    return resolved
+
+
+def route_request(req_obj: Request) -> int:
+    """
+    Create the request's approval steps with one batched insert and return
+    how many were created. Requests that already have steps are left alone;
+    raises RoutingError when no rule matches or an approver can't be resolved.
+    The caller commits.
+    """
+    if db.session.scalar(select(ApprovalStep.id).where(ApprovalStep.request_id == req_obj.id).limit(1)):
+        sync_progress([req_obj.id])
+        db.session.expire(req_obj, _PROGRESS_ATTRS)
+        return 0
+    stages = compiled_route(req_obj.form_template).stages_for(req_obj.form_data_json)
+    if not stages:
+        raise RoutingError(f"no routing rule of {req_obj.form_template.form_code!r} matches this request")
+    rows = [{"request_id": req_obj.id, "approver_id": approver_id, "sequence": sequence,
+             "quorum": quorum, "status": "pending"}
+            for sequence, (approvers, quorum)
+            in enumerate(_resolve_approvers(stages, req_obj.requester_id), start=1)
+            for approver_id in approvers]
+    db.session.execute(insert(ApprovalStep), rows)
+    sync_progress([req_obj.id])
+    db.session.expire(req_obj, ["approval_steps"] + _PROGRESS_ATTRS)
+    return len(rows)
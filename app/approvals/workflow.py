@@ -0,0 +1,281 @@
+# app/approvals/workflow.py
+"""
+Approval stage state machine.
+
+Steps that share a `sequence` form one stage, acted on concurrently; the
+stage is complete once `quorum` of them are approved (all of them when
+quorum is None) and its remaining pending steps become 'skipped'. Only the
+lowest stage with pending steps is current, and the request is approved when
+no pending steps are left.
+
+Transitions are compare-and-swap UPDATEs: the request's version is bumped
+first (optionally only if it still matches the version the approver saw),
+which takes the row lock, and the step must still be pending, at the
+version it was read at, in the current stage. Two approvers clicking at
+the same time can neither both complete a stage nor act on a stage that has
+already moved on; the loser gets None / False and reports a conflict.
+Repeated submits of one form are answered from idempotency_keys instead.
+Each transition also appends to the approval event log (app.approvals.events).
+
+Request.current_stage / current_approver_id / steps_total / steps_approved
+denormalize that position so lookups and dashboards don't scan steps.
+sync_progress() recomputes them in SQL and runs in the same transaction as
+every transition; `flask check-request-progress` verifies them.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, case, delete, exists, func, null, or_, select, update
+from sqlalchemy.orm import aliased
+
+from app.approvals.events import log_event, log_skipped, log_system_event
+from app.models import db, Request, ApprovalStep, IdempotencyKey
+
+
+def current_stage(req_obj: Request) -> Optional[int]:
+    """Sequence number of the stage awaiting action, or None."""
+    return req_obj.current_stage if req_obj.status == "pending" else None
+
+
+def actionable_step(req_obj: Request, user_id: int) -> Optional[ApprovalStep]:
+    """The user's pending step in the current stage of a pending request."""
+    stage = current_stage(req_obj)
+    if stage is None:
+        return None
+    return (ApprovalStep.query
+            .filter_by(request_id=req_obj.id, approver_id=user_id, sequence=stage, status="pending")
+            .first())
+
+
+def needed_approvals(quorum: Optional[int], members: int) -> int:
+    return min(quorum, members) if quorum else members
+
+
+def stage_summary(req_obj: Request) -> List[Dict]:
+    """Per-stage view for the detail page: members, quorum and progress."""
+    stages: Dict[int, List[ApprovalStep]] = {}
+    for s in req_obj.approval_steps:
+        stages.setdefault(s.sequence, []).append(s)
+    out = []
+    for sequence in sorted(stages):
+        steps = stages[sequence]
+        quorum = steps[0].quorum
+        approved = sum(1 for s in steps if s.status == "approved")
+        out.append({
+            "number": sequence,
+            "members": len(steps),
+            "needed": needed_approvals(quorum, len(steps)),
+            "approved": approved,
+            "quorum": quorum_label(quorum, len(steps)),
+            "pending": [s for s in steps if s.status == "pending"],
+        })
+    return out
+
+
+def quorum_label(quorum: Optional[int], members: int) -> str:
+    if members == 1:
+        return ""
+    needed = needed_approvals(quorum, members)
+    if needed == members:
+        return f"all {members}"
+    return f"any 1 of {members}" if needed == 1 else f"{needed} of {members}"
+
+
+def _progress_values() -> dict:
+    """Correlated SQL for the denormalized progress columns, derived from approval_steps."""
+    stage_step, member, step = aliased(ApprovalStep), aliased(ApprovalStep), aliased(ApprovalStep)
+    pending_stage = (select(func.min(stage_step.sequence))
+                     .where(stage_step.request_id == Request.id, stage_step.status == "pending")
+                     .correlate(Request).scalar_subquery())
+    sole_approver = (select(case((func.count() == 1, func.max(member.approver_id)), else_=null()))
+                     .where(member.request_id == Request.id, member.status == "pending",
+                            member.sequence == pending_stage)
+                     .correlate(Request).scalar_subquery())
+    return {
+        "current_stage": case((Request.status == "pending", pending_stage), else_=null()),
+        "current_approver_id": case((Request.status == "pending", sole_approver), else_=null()),
+        "steps_total": select(func.count()).where(step.request_id == Request.id)
+                       .correlate(Request).scalar_subquery(),
+        "steps_approved": select(func.count()).where(step.request_id == Request.id, step.status == "approved")
+                          .correlate(Request).scalar_subquery(),
+    }
+
+
+def sync_progress(request_ids: Optional[Iterable[int]] = None, conn=None, touch: bool = True) -> None:
+    """
+    Recompute the progress columns of these requests (all when None) with
+    set-based UPDATEs. touch=False keeps updated_at as it was. Runs on
+    `conn` if given, else in the current session's transaction.
+    """
+    values = _progress_values()
+    if not touch:
+        values["updated_at"] = Request.updated_at
+    executor = conn if conn is not None else db.session
+    if request_ids is None:
+        executor.execute(update(Request).values(**values).execution_options(synchronize_session=False))
+        return
+    ids = sorted(set(request_ids))
+    for i in range(0, len(ids), 500):
+        executor.execute(update(Request).where(Request.id.in_(ids[i:i + 500])).values(**values)
+                         .execution_options(synchronize_session=False))
+
+
+def progress_mismatches(limit: Optional[int] = None) -> List[dict]:
+    """Requests whose stored progress columns differ from what their steps imply."""
+    expected = _progress_values()
+    query = (select(Request.id, *(getattr(Request, col) for col in expected),
+                    *(expr.label(f"expected_{col}") for col, expr in expected.items()))
+             .where(or_(*(getattr(Request, col).is_distinct_from(expr) for col, expr in expected.items())))
+             .order_by(Request.id))
+    if limit:
+        query = query.limit(limit)
+    return [dict(row._mapping) for row in db.session.execute(query)]
+
+
+def _claim_request(req_obj: Request, expected_version: Optional[int], now: datetime) -> bool:
+    """Bump the request's version if it is pending (and still at expected_version); locks the row."""
+    query = update(Request).where(Request.id == req_obj.id, Request.status == "pending")
+    if expected_version is not None:
+        query = query.where(Request.version == expected_version)
+    return bool(db.session.execute(query.values(version=Request.version + 1, updated_at=now)
+                                   .execution_options(synchronize_session=False)).rowcount)
+
+
+def _still_actionable(step: ApprovalStep):
+    return and_(ApprovalStep.id == step.id,
+                ApprovalStep.status == "pending",
+                ApprovalStep.version == step.version,
+                exists().where(Request.id == step.request_id, Request.status == "pending",
+                               Request.current_stage == step.sequence))
+
+
+def _refresh(req_obj: Request) -> None:
+    for s in req_obj.approval_steps:
+        db.session.expire(s)
+    db.session.expire(req_obj)
+
+
+def approve_step(req_obj: Request, step: ApprovalStep, comments: Optional[str],
+                 expected_version: Optional[int] = None) -> Optional[str]:
+    """
+    Approve `step` and advance the workflow. Returns None on a conflict (the
+    request moved past expected_version or the step is no longer actionable;
+    the caller rolls back), else 'recorded' (stage still waiting for others),
+    'stage_complete' or 'request_approved'. The caller commits.
+    """
+    now = datetime.utcnow()
+    approved = _claim_request(req_obj, expected_version, now) and db.session.execute(
+        update(ApprovalStep).where(_still_actionable(step))
+        .values(status="approved", actioned_at=now, comments=comments, version=ApprovalStep.version + 1)
+        .execution_options(synchronize_session=False)).rowcount
+    if not approved:
+        _refresh(req_obj)
+        return None
+    log_event(req_obj, "approved", actor=step.approver, step=step, comments=comments, at=now)
+
+    members, done, quorum = db.session.execute(
+        select(func.count(), func.sum(case((ApprovalStep.status == "approved", 1), else_=0)),
+               func.max(ApprovalStep.quorum))
+        .where(ApprovalStep.request_id == req_obj.id, ApprovalStep.sequence == step.sequence)).one()
+    outcome = "recorded"
+    if done >= needed_approvals(quorum, members):
+        log_skipped(req_obj, step.sequence, now)
+        db.session.execute(
+            update(ApprovalStep)
+            .where(ApprovalStep.request_id == req_obj.id, ApprovalStep.sequence == step.sequence,
+                   ApprovalStep.status == "pending")
+            .values(status="skipped", actioned_at=now, version=ApprovalStep.version + 1)
+            .execution_options(synchronize_session=False))
+        outcome = "stage_complete"
+        remaining = db.session.scalar(
+            select(func.count()).where(ApprovalStep.request_id == req_obj.id, ApprovalStep.status == "pending"))
+        if not remaining:
+            db.session.execute(update(Request).where(Request.id == req_obj.id, Request.status == "pending")
+                               .values(status="approved", updated_at=now)
+                               .execution_options(synchronize_session=False))
+            log_event(req_obj, "completed", at=now)
+            outcome = "request_approved"
+    sync_progress([req_obj.id])
+    _refresh(req_obj)
+    return outcome
+
+
+def return_step(req_obj: Request, step: ApprovalStep, comments: Optional[str],
+                expected_version: Optional[int] = None) -> bool:
+    """
+    Return the request to the student from `step`; every other step goes back
+    to pending. False on a conflict (the caller rolls back). The caller commits.
+    """
+    now = datetime.utcnow()
+    returned = _claim_request(req_obj, expected_version, now) and db.session.execute(
+        update(ApprovalStep).where(_still_actionable(step))
+        .values(status="returned", actioned_at=now, comments=comments, version=ApprovalStep.version + 1)
+        .execution_options(synchronize_session=False)).rowcount
+    if not returned:
+        _refresh(req_obj)
+        return False
+    log_event(req_obj, "returned", actor=step.approver, step=step, comments=comments, at=now)
+    db.session.execute(
+        update(ApprovalStep).where(ApprovalStep.request_id == req_obj.id, ApprovalStep.id != step.id)
+        .values(status="pending", actioned_at=None, signed_pdf_path=None, pdf_status=None,
+                version=ApprovalStep.version + 1)
+        .execution_options(synchronize_session=False))
+    db.session.execute(update(Request).where(Request.id == req_obj.id)
+                       .values(status="returned")
+                       .execution_options(synchronize_session=False))
+    sync_progress([req_obj.id])
+    _refresh(req_obj)
+    return True
+
+
+def return_stranded(request_ids: Iterable[int], comments: str) -> List[int]:
+    """
+    Return the pending requests among `request_ids` that have no pending step
+    left (their approver was deleted) to the student, as return_step does but
+    with a system 'returned' event. Returns their ids; the caller commits.
+    """
+    ids = sorted(set(request_ids))
+    stranded: List[int] = []
+    for i in range(0, len(ids), 500):
+        stranded += db.session.scalars(
+            select(Request.id).where(Request.id.in_(ids[i:i + 500]), Request.status == "pending",
+                                     ~exists().where(ApprovalStep.request_id == Request.id,
+                                                     ApprovalStep.status == "pending")))
+    if not stranded:
+        return []
+    now = datetime.utcnow()
+    for i in range(0, len(stranded), 500):
+        chunk = stranded[i:i + 500]
+        log_system_event(chunk, "returned", comments, now)
+        db.session.execute(
+            update(ApprovalStep).where(ApprovalStep.request_id.in_(chunk))
+            .values(status="pending", actioned_at=None, signed_pdf_path=None, pdf_status=None,
+                    version=ApprovalStep.version + 1)
+            .execution_options(synchronize_session=False))
+        db.session.execute(update(Request).where(Request.id.in_(chunk))
+                           .values(status="returned", version=Request.version + 1, updated_at=now)
+                           .execution_options(synchronize_session=False))
+    sync_progress(stranded)
+    return stranded
+
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+
+def replayed_outcome(key: Optional[str], user_id: int, request_id: int, action: str) -> Optional[str]:
+    """Outcome recorded for this idempotency key by the same user and action, if any."""
+    if not key:
+        return None
+    receipt = db.session.get(IdempotencyKey, key)
+    if receipt and (receipt.user_id, receipt.request_id, receipt.action) == (user_id, request_id, action):
+        return receipt.outcome
+    return None
+
+
+def record_outcome(key: Optional[str], user_id: int, request_id: int, action: str, outcome: str) -> None:
+    """Store the outcome with the transition (same transaction) and drop the user's expired keys."""
+    if not key:
+        return
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id,
+                                                    IdempotencyKey.created_at < datetime.utcnow() - IDEMPOTENCY_TTL))
+    db.session.add(IdempotencyKey(key=key, user_id=user_id, request_id=request_id, action=action, outcome=outcome))
@@ -0,0 +1,346 @@
+# app/auth/directory_sync.py
+"""
+Incremental Microsoft Graph directory sync.
+
+Pulls /users/delta page by page and upserts User rows by oid (falling back
+to lower(email) to adopt accounts first created at login). The deltaLink from
+the last page is stored in directory_sync_state, so later runs only fetch
+what changed. Users removed or disabled in the directory are deactivated; after
+a full sync, users with an oid the directory no longer returns are too. Those
+rows are marked deactivated_by='directory' and are reactivated when the
+directory enables them again; a user an admin deactivated stays deactivated.
+
+GRAPH_BASE_URL and GRAPH_ACCESS_TOKEN can point the sync at a local stub
+server instead of graph.microsoft.com.
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, or_, select, update
+
+from app.models import db, User, DirectorySyncState
+
+DEFAULT_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_SCOPE = ["https://graph.microsoft.com/.default"]
+USER_SELECT = "id,displayName,mail,userPrincipalName,accountEnabled"
+SYNC_BATCH_SIZE = 500
+SYNC_PAGE_SIZE = 999  # Graph's maximum for users
+MAX_RETRIES = 5
+HTTP_TIMEOUT = 30
+
+
+class DeltaExpired(Exception):
+    """Graph no longer accepts the stored delta link (HTTP 410); a full sync is needed."""
+
+
+class GraphError(Exception):
+    pass
+
+
+def graph_token() -> str:
+    """App-only Graph token via client credentials (or GRAPH_ACCESS_TOKEN for stubs)."""
+    token = os.getenv("GRAPH_ACCESS_TOKEN")
+    if token:
+        return token
+    from app.auth.msal_client import msal_client
+    with msal_client() as client:
+        # served from the shared token cache until it is close to expiry
+        result = client.acquire_token_for_client(scopes=GRAPH_SCOPE)
+    if "access_token" not in result:
+        raise GraphError(f"token request failed: {result.get('error_description') or result.get('error')}")
+    return result["access_token"]
+
+
+def _get_json(url: str, token: str, page_size: int) -> dict:
+    """GET a Graph page, honouring Retry-After on 429/503."""
+    req = urllib.request.Request(url, headers={
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+        "Prefer": f"odata.maxpagesize={page_size}",
+    })
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise DeltaExpired(url) from e
+            if e.code in (429, 503, 504) and attempt < MAX_RETRIES:
+                time.sleep(float(e.headers.get("Retry-After") or 2 ** attempt))
+                continue
+            raise GraphError(f"GET {url} failed: HTTP {e.code}") from e
+        except urllib.error.URLError as e:
+            if attempt < MAX_RETRIES:
+                time.sleep(2 ** attempt)
+                continue
+            raise GraphError(f"GET {url} failed: {e.reason}") from e
+    raise GraphError(f"GET {url} failed after {MAX_RETRIES} retries")
+
+
+def _entry(item: dict) -> dict:
+    """Directory user -> the User columns it carries (delta pages may omit unchanged properties)."""
+    out = {"oid": item["id"]}
+    if item.get("displayName"):
+        out["name"] = item["displayName"].strip()
+    email = item.get("mail") or item.get("userPrincipalName")
+    if email:
+        out["email"] = email.strip()
+    if item.get("accountEnabled") is False:
+        out["status"] = "deactivated"
+    elif item.get("accountEnabled") is True:
+        out["status"] = "active"
+    return out
+
+
+class DirectorySync:
+    """One sync run; `metrics` is filled in as it goes."""
+
+    def __init__(self, base_url: Optional[str] = None, token_provider: Callable[[], str] = graph_token,
+                 batch_size: int = SYNC_BATCH_SIZE, page_size: int = SYNC_PAGE_SIZE):
+        self.base_url = (base_url or os.getenv("GRAPH_BASE_URL") or DEFAULT_GRAPH_BASE_URL).rstrip("/")
+        self.token_provider = token_provider
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.metrics: Dict[str, object] = {}
+        self._revoke: List[str] = []  # emails of users deactivated in this run
+
+    # ----- paging -----
+
+    def _pages(self, start_url: str) -> Iterator[Tuple[List[dict], Optional[str]]]:
+        """Yield (items, delta_link); delta_link is only set on the last page."""
+        token = self.token_provider()
+        url = start_url
+        while url:
+            page = _get_json(url, token, self.page_size)
+            self.metrics["pages"] += 1
+            url = page.get("@odata.nextLink")
+            yield page.get("value", []), (None if url else page.get("@odata.deltaLink"))
+
+    # ----- writes -----
+
+    def _upsert(self, entries: List[dict]) -> None:
+        oids = [e["oid"] for e in entries]
+        emails = [e["email"].lower() for e in entries if "email" in e]
+        existing = User.query.filter(or_(User.oid.in_(oids),
+                                         func.lower(User.email).in_(emails) if emails else False)).all()
+        by_oid = {u.oid: u for u in existing if u.oid}
+        by_email = {u.email.lower(): u for u in existing}
+
+        inserts: Dict[str, dict] = {}  # oid -> new row (a page can repeat an oid)
+        new_emails: Dict[str, str] = {}  # lower(email) -> oid, for rows not inserted yet
+        updates = []
+        for e in entries:
+            if e["oid"] in inserts:
+                inserts[e["oid"]].update(e)
+                continue
+            user = by_oid.get(e["oid"])
+            email = e["email"].lower() if "email" in e else None
+            email_owner = by_email.get(email) if email else None
+            if user is None and email_owner is not None and not email_owner.oid:
+                user = email_owner  # adopt the row created at first login
+            elif ((email_owner is not None and email_owner is not user)
+                  or new_emails.get(email, e["oid"]) != e["oid"]):
+                self.metrics["conflicts"] += 1  # email already belongs to another directory user
+                continue
+            if user is None:
+                if not email:
+                    self.metrics["skipped"] += 1
+                    continue
+                inserts[e["oid"]] = dict({"name": e["email"].split("@")[0], "role": "basicuser",
+                                          "status": "active"}, **e)
+                new_emails[email] = e["oid"]
+                continue
+            if e.get("status") == "active" and user.deactivated_by != "directory":
+                e = {k: v for k, v in e.items() if k != "status"}  # only undo our own deactivations
+            changes = {k: v for k, v in e.items() if getattr(user, k) != v}
+            if changes:
+                if changes.get("status") == "deactivated":
+                    changes["deactivated_by"] = "directory"
+                    self.metrics["deactivated"] += 1
+                    self._revoke.append(user.email)
+                elif changes.get("status") == "active":
+                    changes["deactivated_by"] = None
+                    self.metrics["reactivated"] += 1
+                updates.append(dict(changes, id=user.id))
+            else:
+                self.metrics["unchanged"] += 1
+
+        if inserts:
+            rows = [dict(row, deactivated_by="directory" if row["status"] == "deactivated" else None)
+                    for row in inserts.values()]
+            db.session.execute(insert(User), rows)
+        if updates:
+            db.session.execute(update(User), updates)
+        db.session.commit()
+        db.session.expunge_all()
+        self.metrics["created"] += len(inserts)
+        self.metrics["updated"] += len(updates)
+
+    def _deactivate(self, oids) -> None:
+        oids = list(oids)
+        for i in range(0, len(oids), self.batch_size):
+            chunk = oids[i:i + self.batch_size]
+            self._revoke.extend(db.session.scalars(
+                select(User.email).where(User.oid.in_(chunk), User.status != "deactivated")))
+            result = db.session.execute(update(User)
+                                        .where(User.oid.in_(chunk), User.status != "deactivated")
+                                        .values(status="deactivated", deactivated_by="directory")
+                                        .execution_options(synchronize_session=False))
+            self.metrics["deactivated"] += result.rowcount
+        db.session.commit()
+
+    def _deactivate_missing(self, seen: Set[str]) -> None:
+        """After a full sync: deactivate active users whose oid the directory did not return."""
+        stale = [oid for (oid,) in db.session.query(User.oid)
+                 .filter(User.oid.isnot(None), User.status == "active") if oid not in seen]
+        self._deactivate(stale)
+
+    # ----- driver -----
+
+    def _consume(self, start_url: str, full: bool) -> Optional[str]:
+        seen: Set[str] = set()
+        batch: List[dict] = []
+        removed: List[str] = []
+        delta_link = None
+        for items, link in self._pages(start_url):
+            for item in items:
+                self.metrics["received"] += 1
+                if "@removed" in item:
+                    removed.append(item["id"])
+                    continue
+                seen.add(item["id"])
+                batch.append(_entry(item))
+                if len(batch) >= self.batch_size:
+                    self._upsert(batch)
+                    batch = []
+            delta_link = link or delta_link
+        if batch:
+            self._upsert(batch)
+        if removed:
+            self._deactivate(removed)
+        if full:
+            self._deactivate_missing(seen)
+        return delta_link
+
+    def run(self, full: bool = False) -> Dict[str, object]:
+        """Run a delta sync (or a full one if forced or no delta link is stored); returns metrics."""
+        from app.auth.session_store import revoke_user_sessions
+        from app.users.routes import invalidate_user_cache
+
+        state = get_sync_state()
+        full = full or not state.delta_link
+        self.metrics = {"mode": "full" if full else "delta", "pages": 0, "received": 0, "created": 0,
+                        "updated": 0, "unchanged": 0, "deactivated": 0, "reactivated": 0, "skipped": 0,
+                        "conflicts": 0}
+        self._revoke = []
+        started = time.perf_counter()
+        start_url = state.delta_link
+        try:
+            try:
+                if full:
+                    start_url = f"{self.base_url}/users/delta?$select={USER_SELECT}"
+                delta_link = self._consume(start_url, full)
+            except DeltaExpired:
+                self.metrics["mode"] = "full (delta link expired)"
+                full = True
+                delta_link = self._consume(f"{self.base_url}/users/delta?$select={USER_SELECT}", True)
+        except Exception as e:
+            db.session.rollback()
+            state = get_sync_state()
+            state.last_run_at = datetime.utcnow()
+            state.last_status = "failed"
+            state.last_error = str(e)[:2000]
+            db.session.commit()
+            raise
+        finally:
+            self.metrics["duration_s"] = round(time.perf_counter() - started, 3)
+            invalidate_user_cache()
+            revoke_user_sessions(self._revoke)  # batches already committed stay deactivated
+
+        state = get_sync_state()
+        state.delta_link = delta_link or state.delta_link
+        now = datetime.utcnow()
+        state.last_run_at = now
+        if full:
+            state.last_full_sync_at = now
+        state.last_status = "ok"
+        state.last_error = None
+        state.last_metrics = dict(self.metrics)
+        db.session.commit()
+        return self.metrics
+
+
+def get_sync_state(resource: str = "users") -> DirectorySyncState:
+    state = DirectorySyncState.query.filter_by(resource=resource).first()
+    if state is None:
+        state = DirectorySyncState(resource=resource)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def _claim_run(interval: float) -> bool:
+    """Let only one process start a scheduled run per interval."""
+    get_sync_state()
+    db.session.commit()
+    cutoff = datetime.utcnow() - timedelta(seconds=interval)
+    claimed = (DirectorySyncState.query
+               .filter(DirectorySyncState.resource == "users",
+                       or_(DirectorySyncState.last_run_at.is_(None), DirectorySyncState.last_run_at < cutoff))
+               .update({"last_run_at": datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    return bool(claimed)
+
+
+class DirectorySyncWorker:
+    """Background thread running a delta sync every DIRECTORY_SYNC_INTERVAL seconds."""
+
+    def __init__(self, app, interval: float):
+        self.app = app
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name="directory-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    if _claim_run(self.interval):
+                        metrics = DirectorySync().run()
+                        self.app.logger.info("directory sync: %s", metrics)
+                except Exception:
+                    self.app.logger.exception("directory sync failed")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            self._stop.wait(self.interval)
+
+
+def init_directory_sync(app, start: bool = True) -> Optional[DirectorySyncWorker]:
+    """Set up (and unless start=False, start) the sync worker when DIRECTORY_SYNC_INTERVAL > 0 (off by default)."""
+    interval = float(app.config.get("DIRECTORY_SYNC_INTERVAL", 0))
+    if interval <= 0:
+        return None
+    worker = DirectorySyncWorker(app, interval)
+    if start:
+        worker.start()
+    app.extensions["directory_sync"] = worker
+    return worker
@@ -0,0 +1,336 @@
+# app/auth/msal_client.py
+"""
+Long-lived MSAL ConfidentialClientApplications per process, with a persistent
+token cache for app tokens.
+
+Building a client performs authority / OpenID metadata discovery, so clients
+are created once and reused by every login, callback and Graph token request.
+The app-token client's SerializableTokenCache is backed by a store picked with MSAL_TOKEN_CACHE:
+
+    memory        (default) kept in this process only
+    file[:path]   JSON file shared by workers on one host, fcntl-locked
+    db            msal_token_cache table shared by every worker
+
+Use it through msal_client(): the cache is refreshed from the store before
+the call and changed entries are merged back into the store afterwards,
+under the store's lock, so concurrent workers don't overwrite each other.
+Entries the call removed and expired access tokens are dropped from the
+store on the way, so it does not grow without bound.
+Calls through one process's client are serialized, so a refresh never
+swaps the cache under a call in progress.
+
+The persistent cache only holds app tokens (client credentials). Sign-ins
+go through msal_login_client(), a second long-lived client whose cache is
+in memory only and forgets the user's tokens as soon as the code exchange
+is done: nothing reads them back, and a shared cache would otherwise grow
+with every user's refresh token.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import FrozenSet, Iterator, Optional, Tuple
+
+import msal
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+AUTHORITY_HOST = "https://login.microsoftonline.com"
+
+
+def _cache_keys(state: Optional[str]) -> FrozenSet[Tuple[str, str]]:
+    """(section, key) of every entry in a serialized cache."""
+    if not state:
+        return frozenset()
+    return frozenset((section, key) for section, entries in json.loads(state).items()
+                     if isinstance(entries, dict) for key in entries)
+
+
+def _merge_cache_state(base: Optional[str], ours: str,
+                       removed: FrozenSet[Tuple[str, str]] = frozenset()) -> str:
+    """
+    base overlaid with our entries (ours win on key clashes), without the
+    entries we removed since we last read the store and without access tokens
+    that have expired, so the shared store only keeps live entries.
+    """
+    merged = json.loads(base) if base else {}
+    for section, entries in json.loads(ours).items():
+        if isinstance(entries, dict):
+            merged.setdefault(section, {}).update(entries)
+        else:
+            merged[section] = entries
+    for section, key in removed:
+        merged.get(section, {}).pop(key, None)
+    now = time.time()
+    tokens = merged.get("AccessToken", {})
+    for key in [k for k, at in tokens.items() if float(at.get("expires_on") or 0) < now]:
+        del tokens[key]
+    return json.dumps(merged)
+
+
+class TokenCacheStore:
+    """Where the serialized token cache lives between processes / restarts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[str]:
+        raise NotImplementedError
+
+    def save(self, state: str, removed: FrozenSet[Tuple[str, str]] = frozenset()) -> None:
+        """Store state; `removed` are entries the caller deleted, for stores that re-merge on a conflict."""
+        raise NotImplementedError
+
+    def version(self):
+        """Cheap change marker, so an unchanged store isn't re-read on every call."""
+        return None
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._lock:
+            yield
+
+
+class MemoryTokenCacheStore(TokenCacheStore):
+    def __init__(self):
+        super().__init__()
+        self._state: Optional[str] = None
+        self._version = 0
+
+    def load(self) -> Optional[str]:
+        return self._state
+
+    def save(self, state: str, removed: FrozenSet[Tuple[str, str]] = frozenset()) -> None:
+        self._state = state
+        self._version += 1
+
+    def version(self):
+        return self._version
+
+
+class FileTokenCacheStore(TokenCacheStore):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def load(self) -> Optional[str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                return fh.read() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: str, removed: FrozenSet[Tuple[str, str]] = frozenset()) -> None:
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(state)
+        os.chmod(tmp, 0o600)  # refresh tokens are secrets
+        os.replace(tmp, self.path)
+
+    def version(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + ".lock", "a") as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+
+class DbTokenCacheStore(TokenCacheStore):
+    """Row in msal_token_cache; the version column turns saves into compare-and-swap."""
+
+    def __init__(self, app, name: str = "default"):
+        super().__init__()
+        self.app = app
+        self.name = name
+        self._seen_version = None
+
+    def _row(self):
+        from app.models import MsalTokenCache
+        return MsalTokenCache.query.filter_by(name=self.name).first()
+
+    def load(self) -> Optional[str]:
+        from app.models import db
+        with self.app.app_context():
+            row = self._row()
+            self._seen_version = row.version if row else None
+            state = row.state if row else None
+            db.session.remove()
+        return state
+
+    def save(self, state: str, removed: FrozenSet[Tuple[str, str]] = frozenset()) -> None:
+        from app.models import db, MsalTokenCache
+        with self.app.app_context():
+            for _ in range(3):
+                if self._seen_version is None:
+                    db.session.add(MsalTokenCache(name=self.name, state=state, version=1,
+                                                  updated_at=datetime.utcnow()))
+                    updated = 1
+                else:
+                    updated = (MsalTokenCache.query
+                               .filter_by(name=self.name, version=self._seen_version)
+                               .update({"state": state, "version": self._seen_version + 1,
+                                        "updated_at": datetime.utcnow()}, synchronize_session=False))
+                try:
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    updated = 0
+                if updated:
+                    self._seen_version = (self._seen_version or 0) + 1
+                    break
+                # another worker saved first: merge on top of its state and retry
+                row = self._row()
+                self._seen_version = row.version if row else None
+                state = _merge_cache_state(row.state if row else None, state, removed)
+            db.session.remove()
+
+    def version(self):
+        from app.models import db, MsalTokenCache
+        with self.app.app_context():
+            v = db.session.query(MsalTokenCache.version).filter_by(name=self.name).scalar()
+            db.session.remove()
+        return v
+
+
+def make_token_cache_store(spec: Optional[str] = None, app=None) -> TokenCacheStore:
+    """Build the store named by MSAL_TOKEN_CACHE ('memory', 'file[:path]' or 'db')."""
+    spec = spec or os.getenv("MSAL_TOKEN_CACHE", "memory")
+    kind, _, arg = spec.partition(":")
+    if kind == "file":
+        return FileTokenCacheStore(arg or os.path.join(app.instance_path if app else "instance", "msal_token_cache.json"))
+    if kind == "db":
+        if app is None:
+            raise ValueError("the db token cache store needs the Flask app")
+        return DbTokenCacheStore(app)
+    if kind == "memory":
+        return MemoryTokenCacheStore()
+    raise ValueError(f"unknown MSAL_TOKEN_CACHE {spec!r}")
+
+
+class SharedMsalClient:
+    """Lazily built ConfidentialClientApplication plus its cache store."""
+
+    def __init__(self, store: TokenCacheStore, client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, authority: Optional[str] = None, **msal_kwargs):
+        self.store = store
+        # read at construction, after create_app has loaded .env
+        self.client_id = client_id or os.getenv("CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("CLIENT_SECRET")
+        self.authority = (authority or os.getenv("MSAL_AUTHORITY")
+                          or f"{AUTHORITY_HOST}/{os.getenv('TENANT_ID')}")
+        self.msal_kwargs = msal_kwargs
+        self.cache = msal.SerializableTokenCache()
+        self._app: Optional[msal.ConfidentialClientApplication] = None
+        self._login_app: Optional[msal.ConfidentialClientApplication] = None
+        self._build_lock = threading.Lock()
+        self._call_lock = threading.RLock()
+        self._loaded_version = object()
+        self._synced_keys: FrozenSet[Tuple[str, str]] = frozenset()  # cache entries at the last load / save
+
+    def _build(self, cache: msal.TokenCache) -> msal.ConfidentialClientApplication:
+        return msal.ConfidentialClientApplication(
+            self.client_id, authority=self.authority, client_credential=self.client_secret,
+            token_cache=cache, **self.msal_kwargs)
+
+    def _client(self) -> msal.ConfidentialClientApplication:
+        if self._app is None:
+            with self._build_lock:
+                if self._app is None:
+                    self._app = self._build(self.cache)
+        return self._app
+
+    def _login_client(self) -> msal.ConfidentialClientApplication:
+        if self._login_app is None:
+            with self._build_lock:
+                if self._login_app is None:
+                    self._login_app = self._build(msal.TokenCache())  # in memory, never persisted
+        return self._login_app
+
+    def _refresh_cache(self) -> None:
+        version = self.store.version()
+        if version is not None and version == self._loaded_version:
+            return
+        with self.store.locked():
+            state = self.store.load()
+            self._loaded_version = self.store.version()
+        if state:
+            self.cache.deserialize(state)
+            self._synced_keys = _cache_keys(state)
+
+    def _persist_cache(self) -> None:
+        if not self.cache.has_state_changed:
+            return
+        ours = self.cache.serialize()
+        removed = self._synced_keys - _cache_keys(ours)
+        with self.store.locked():
+            self.store.save(_merge_cache_state(self.store.load(), ours, removed), removed)
+            self._loaded_version = self.store.version()
+        self._synced_keys = _cache_keys(ours)
+        self.cache.has_state_changed = False
+
+    @contextmanager
+    def session(self) -> Iterator[msal.ConfidentialClientApplication]:
+        with self._call_lock:
+            self._refresh_cache()
+            try:
+                yield self._client()
+            finally:
+                self._persist_cache()
+
+    @contextmanager
+    def login_session(self) -> Iterator[msal.ConfidentialClientApplication]:
+        client = self._login_client()
+        try:
+            yield client
+        finally:
+            for account in client.get_accounts():  # the caller already has the tokens it needs
+                client.remove_account(account)
+
+
+_shared: Optional[SharedMsalClient] = None
+_shared_lock = threading.Lock()
+
+
+def init_msal_client(app=None, store: Optional[TokenCacheStore] = None, **client_kwargs) -> SharedMsalClient:
+    """(Re)configure the process-wide client; create_app calls this once."""
+    global _shared
+    with _shared_lock:
+        _shared = SharedMsalClient(store or make_token_cache_store(app=app), **client_kwargs)
+        if app is not None:
+            app.extensions["msal_client"] = _shared
+    return _shared
+
+
+@contextmanager
+def msal_client() -> Iterator[msal.ConfidentialClientApplication]:
+    """The shared MSAL client, with its token cache synced to the store around the call."""
+    shared = _shared or init_msal_client()
+    with shared.session() as client:
+        yield client
+
+
+@contextmanager
+def msal_login_client() -> Iterator[msal.ConfidentialClientApplication]:
+    """Client for the sign-in flow; user tokens it acquires are dropped when the block exits."""
+    shared = _shared or init_msal_client()
+    with shared.login_session() as client:
+        yield client
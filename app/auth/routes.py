@@ -1,32 +1,21 @@
 from flask import Blueprint, render_template, redirect, request, session, url_for
-from msal import ConfidentialClientApplication
-import os
 from sqlalchemy import func
+from app.auth.msal_client import msal_login_client
+from app.auth.session_store import rotate_session
 from app.models import db, User
 
 auth_bp = Blueprint('auth', __name__)
 
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-TENANT_ID = os.getenv("TENANT_ID")
-
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 REDIRECT_PATH = "/auth/callback"
 SCOPE = ["User.Read"]
 
-
-def _build_msal_app(cache=None):
-    return ConfidentialClientApplication(
-        CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET, token_cache=cache
-    )
-
 @auth_bp.route("/login")
 def login():
     """Redirects user to Microsoft login page."""
-    msal_app = _build_msal_app()
-    auth_url = msal_app.get_authorization_request_url(
-        SCOPE, redirect_uri=url_for("auth.authorized", _external=True)
-    )
+    with msal_login_client() as msal_app:
+        auth_url = msal_app.get_authorization_request_url(
+            SCOPE, redirect_uri=url_for("auth.authorized", _external=True)
+        )
     print("Redirect URI used:", url_for("auth.authorized", _external=True))
     return redirect(auth_url)
 
@@ -37,13 +26,14 @@ def authorized():
     if not code:
         return "Login failed or canceled."
 
-    msal_app = _build_msal_app()
-    result = msal_app.acquire_token_by_authorization_code(
-        code, scopes=SCOPE, redirect_uri=url_for("auth.authorized", _external=True)
-    )
+    with msal_login_client() as msal_app:
+        result = msal_app.acquire_token_by_authorization_code(
+            code, scopes=SCOPE, redirect_uri=url_for("auth.authorized", _external=True)
+        )
 
     if "access_token" in result:
         claims = result["id_token_claims"]
+        rotate_session(session)
         session["user"] = claims
 
         # Auto-provision or update DB user for current session user
@@ -71,5 +61,4 @@ def profile():
     if "user" not in session:
         return redirect(url_for("auth.login"))
     user = session["user"]
-    print(session)
     return render_template("profile.html", user=user)
@@ -0,0 +1,183 @@
+# app/auth/session_store.py
+"""
+Server-side sessions stored in the user_sessions table.
+
+The cookie carries only a random token; the row is keyed by its sha256, so
+the table alone can't be used to hijack a session. Rows expire after
+SESSION_TTL seconds of inactivity (the expiry is pushed forward at most once
+per half TTL, not on every request), a background thread purges expired rows,
+and revoke_user_sessions() logs a user out everywhere.
+
+Reads and writes use their own short connection rather than db.session, so
+saving the session never commits (or rolls back) a view's pending changes.
+"""
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, func, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from app.models import db, UserSession
+
+_serializer = TaggedJSONSerializer()
+_sessions = UserSession.__table__
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode("ascii")).hexdigest()
+
+
+def _session_email(data: dict) -> Optional[str]:
+    user = data.get("user") or {}
+    email = (user.get("email") or user.get("preferred_username") or "").strip().lower()
+    return email or None
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, token: Optional[str] = None, expires_at: Optional[datetime] = None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.token = token
+        self.expires_at = expires_at
+        self.new = token is None
+        self.modified = False
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, ttl: float):
+        self.ttl = timedelta(seconds=ttl)
+
+    def open_session(self, app, request) -> ServerSession:
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token:
+            return ServerSession()
+        with db.engine.connect() as conn:
+            row = conn.execute(select(_sessions.c.data, _sessions.c.expires_at)
+                               .where(_sessions.c.id == _hash(token))).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return ServerSession()  # unknown, expired or revoked: start over
+        try:
+            data = _serializer.loads(row.data)
+        except ValueError:
+            return ServerSession()
+        return ServerSession(data, token=token, expires_at=row.expires_at)
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and session.token:  # cleared: drop the row and the cookie
+                with db.engine.begin() as conn:
+                    conn.execute(delete(_sessions).where(_sessions.c.id == _hash(session.token)))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        if session.new or session.modified:
+            payload = {"data": _serializer.dumps(dict(session)), "user_email": _session_email(session),
+                       "expires_at": expires_at}
+            with db.engine.begin() as conn:
+                if session.new:
+                    session.token = secrets.token_urlsafe(32)
+                    conn.execute(insert(_sessions).values(id=_hash(session.token), created_at=now, **payload))
+                else:
+                    conn.execute(update(_sessions).where(_sessions.c.id == _hash(session.token)).values(**payload))
+        elif session.expires_at - now < self.ttl / 2:
+            with db.engine.begin() as conn:
+                conn.execute(update(_sessions).where(_sessions.c.id == _hash(session.token))
+                             .values(expires_at=expires_at))
+        else:
+            return  # nothing changed and the expiry is still fresh: no write, no Set-Cookie
+
+        response.set_cookie(name, session.token, expires=expires_at, domain=domain, path=path,
+                            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        response.vary.add("Cookie")
+
+
+def rotate_session(session) -> None:
+    """Give the session a fresh token (call on login to prevent session fixation)."""
+    if not isinstance(session, ServerSession) or session.new:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(delete(_sessions).where(_sessions.c.id == _hash(session.token)))
+    session.token = None
+    session.new = True
+    session.modified = True
+
+
+def revoke_user_sessions(emails: Iterable[str]) -> int:
+    """Delete every session belonging to these users; returns how many were removed."""
+    emails = sorted({(e or "").strip().lower() for e in emails} - {""})
+    if not emails:
+        return 0
+    removed = 0
+    with db.engine.begin() as conn:
+        for i in range(0, len(emails), 500):
+            removed += conn.execute(delete(_sessions)
+                                    .where(_sessions.c.user_email.in_(emails[i:i + 500]))).rowcount
+    return removed
+
+
+def purge_expired_sessions() -> int:
+    with db.engine.begin() as conn:
+        return conn.execute(delete(_sessions).where(_sessions.c.expires_at <= datetime.utcnow())).rowcount
+
+
+def session_count() -> int:
+    with db.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(_sessions)).scalar()
+
+
+class SessionPurger:
+    """Background thread deleting expired sessions every SESSION_PURGE_INTERVAL seconds."""
+
+    def __init__(self, app, interval: float):
+        self.app = app
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()  # a stopped purger can be started again
+        self._thread = threading.Thread(target=self._loop, name="session-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    purge_expired_sessions()
+                except Exception:
+                    self.app.logger.exception("session purge failed")
+
+
+def init_session_store(app, start: bool = True) -> None:
+    """Install server-side sessions unless SESSION_BACKEND=cookie; start=False leaves the purger stopped."""
+    if app.config.get("SESSION_BACKEND", "db") == "cookie":
+        return
+    app.session_interface = ServerSessionInterface(ttl=float(app.config.get("SESSION_TTL", 12 * 3600)))
+    interval = float(app.config.get("SESSION_PURGE_INTERVAL", 600))
+    if interval > 0:
+        purger = SessionPurger(app, interval)
+        if start:
+            purger.start()
+        app.extensions["session_purger"] = purger
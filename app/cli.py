@@ -0,0 +1,312 @@
+# app/cli.py
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import click
+
+from app.models import db, Request, FormTemplate
+
+# Set in each batch worker process by _init_render_worker
+_worker_app = None
+
+
+def _init_render_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(start_workers=False, config={"RENDER_WORKERS": 0})  # no render queue in pool processes
+
+
+def _render_one(request_id: int) -> dict:
+    """Re-render one request and store the PDF on its latest approved step."""
+    from app.utils.pdf_generator import generate_request_pdf
+    from app.utils.render_queue import signature_paths_for_step
+
+    started = time.perf_counter()
+    with _worker_app.app_context():
+        try:
+            req_obj = db.session.get(Request, request_id)
+            if not req_obj:
+                return {"request_id": request_id, "ok": False, "error": "not found",
+                        "seconds": time.perf_counter() - started}
+            approved = sorted((s for s in req_obj.approval_steps if s.status == "approved"),
+                              key=lambda s: s.order_key)
+            step = approved[-1] if approved else None
+            signature_paths = signature_paths_for_step(req_obj, step) if step else []
+            pdf_rel_path = generate_request_pdf(req_obj, signature_paths)
+            if step:
+                step.signed_pdf_path = pdf_rel_path
+                step.pdf_status = "rendered"
+                db.session.commit()
+            return {"request_id": request_id, "ok": True, "path": pdf_rel_path,
+                    "seconds": time.perf_counter() - started}
+        except Exception as e:
+            db.session.rollback()
+            return {"request_id": request_id, "ok": False, "error": str(e),
+                    "seconds": time.perf_counter() - started}
+        finally:
+            db.session.remove()
+
+
+def _completed_ids(checkpoint_path: str, selection: dict) -> set:
+    done = set()
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r", encoding="utf-8") as fh:
+        for n, line in enumerate(fh):
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            if n == 0 and row.get("selection") != selection:
+                raise click.ClickException(f"{checkpoint_path} was written for a different selection "
+                                           f"({row.get('selection')}); rerun with --no-resume")
+            if row.get("ok"):
+                done.add(row["request_id"])
+    return done
+
+
+@click.command("render-pdfs")
+@click.option("--form-code", multiple=True, help="Only requests for these form codes (repeatable).")
+@click.option("--status", multiple=True, help="Only requests in these states (default: approved).")
+@click.option("--since", type=click.DateTime(), help="Submitted on/after this date.")
+@click.option("--until", type=click.DateTime(), help="Submitted before this date.")
+@click.option("--workers", type=int, default=os.cpu_count() or 2, show_default=True)
+@click.option("--checkpoint", default="render_pdfs.checkpoint.jsonl", show_default=True,
+              help="Per-request results; used to resume an interrupted run.")
+@click.option("--resume/--no-resume", default=False, show_default=True,
+              help="Skip requests already rendered according to a checkpoint of the same selection.")
+@click.option("--report", default="render_pdfs.report.json", show_default=True)
+def render_pdfs_command(form_code, status, since, until, workers, checkpoint, resume, report):
+    """Re-render request PDFs in bulk across a process pool."""
+    q = db.session.query(Request.id).join(FormTemplate, Request.form_template_id == FormTemplate.id)
+    if form_code:
+        q = q.filter(FormTemplate.form_code.in_(form_code))
+    q = q.filter(Request.status.in_(status or ("approved",)))
+    if since:
+        q = q.filter(Request.submitted_at >= since)
+    if until:
+        q = q.filter(Request.submitted_at < until)
+    ids = [rid for (rid,) in q.order_by(Request.id).all()]
+    selection = {"form_code": sorted(form_code), "status": sorted(status or ("approved",)),
+                 "since": since.isoformat() if since else None, "until": until.isoformat() if until else None}
+
+    if resume:
+        done = _completed_ids(checkpoint, selection)
+        skipped = sum(1 for rid in ids if rid in done)
+        ids = [rid for rid in ids if rid not in done]
+    else:
+        skipped = 0
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    db.session.remove()
+
+    click.echo(f"Rendering {len(ids)} request(s) with {workers} worker(s); {skipped} already done.")
+    started = time.perf_counter()
+    rendered, failures = 0, []
+    if ids:
+        with open(checkpoint, "a", encoding="utf-8") as ck, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                    initializer=_init_render_worker) as pool:
+            if ck.tell() == 0:
+                ck.write(json.dumps({"selection": selection}) + "\n")
+            futures = [pool.submit(_render_one, rid) for rid in ids]
+            for n, fut in enumerate(as_completed(futures), start=1):
+                row = fut.result()
+                ck.write(json.dumps(row) + "\n")
+                ck.flush()
+                if row["ok"]:
+                    rendered += 1
+                else:
+                    failures.append(row)
+                click.echo(f"[{n}/{len(ids)}] request {row['request_id']}: "
+                           f"{'ok' if row['ok'] else 'FAILED ' + (row['error'].splitlines() or [''])[0]}")
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "selected": len(ids) + skipped,
+        "skipped": skipped,
+        "rendered": rendered,
+        "failed": len(failures),
+        "elapsed_seconds": round(elapsed, 3),
+        "per_second": round(rendered / elapsed, 3) if elapsed > 0 else None,
+        "failures": [{"request_id": f["request_id"], "error": f["error"]} for f in failures],
+    }
+    with open(report, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    click.echo(f"Done: {rendered} rendered, {len(failures)} failed, {skipped} skipped "
+               f"in {elapsed:.1f}s ({summary['per_second']}/s). Report: {report}")
+
+
+@click.command("pdf-format")
+def pdf_format_command():
+    """Precompile pdflatex formats for the shared preambles of all form templates."""
+    from app.utils.latex_format import build_format, split_preamble
+    from app.utils.pdf_generator import _render_default
+    from app.utils.template_engine import template_engine
+
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    latex_dir = os.path.join(repo_root, "latex_templates")
+    renders = [_render_default] + [template_engine.get(t.latex_template_path)
+                                   for t in FormTemplate.query.all()]
+    preambles = {split_preamble(r({}))[0] for r in renders if r and split_preamble(r({}))}
+    for preamble in preambles:
+        fmt = build_format(latex_dir, preamble)
+        click.echo(f"{'built ' + fmt + '.fmt' if fmt else 'FAILED to build format'}")
+
+
+@click.command("form-pdf-backend")
+@click.argument("form_code")
+@click.argument("backend", type=click.Choice(["latex", "direct"]))
+def form_pdf_backend_command(form_code, backend):
+    """Choose the PDF backend for one form template (forms start on latex)."""
+    form = FormTemplate.query.filter_by(form_code=form_code).first()
+    if form is None:
+        raise click.ClickException(f"no form template {form_code!r}")
+    form.pdf_backend = backend
+    db.session.commit()
+    click.echo(f"{form_code}: {backend}")
+
+
+@click.command("db-upgrade")
+def db_upgrade_command():
+    """Apply pending schema migrations (also runs at app startup)."""
+    from app.migrations import MIGRATIONS, upgrade
+    applied = upgrade()
+    names = dict((v, n) for v, n, _ in MIGRATIONS)
+    for v in applied:
+        click.echo(f"applied {v:03d} {names[v]}")
+    click.echo(f"schema at version {max(v for v, _, _ in MIGRATIONS)}")
+
+
+@click.command("search-reindex")
+def search_reindex_command():
+    """Rebuild the request full-text search index from the requests table."""
+    from app.utils.search_index import create_fts_table, rebuild_index
+    with db.engine.begin() as conn:
+        if not create_fts_table(conn):
+            raise click.ClickException("SQLite FTS5 is not available; search falls back to LIKE")
+        started = time.perf_counter()
+        count = rebuild_index(conn)
+    click.echo(f"indexed {count} requests in {time.perf_counter() - started:.2f}s")
+
+
+@click.command("route-requests")
+def route_requests_command():
+    """Create approval steps for pending requests that have none (e.g. submitted before routing rules existed)."""
+    from app.approvals.routing import RoutingError, route_request
+    unrouted = (Request.query
+                .filter(Request.status == "pending", ~Request.approval_steps.any())
+                .order_by(Request.id).all())
+    routed = failed = 0
+    for req_obj in unrouted:
+        try:
+            route_request(req_obj)
+            routed += 1
+        except RoutingError as e:
+            failed += 1
+            click.echo(f"request {req_obj.id}: {e}", err=True)
+    db.session.commit()
+    click.echo(f"routed {routed} requests, {failed} could not be routed")
+
+
+@click.command("check-request-progress")
+@click.option("--fix", is_flag=True, help="Recompute the mismatched requests' progress columns.")
+@click.option("--limit", type=int, default=50, show_default=True, help="Mismatches to list.")
+def check_request_progress_command(fix, limit):
+    """Compare requests' denormalized current stage / approver / step counters with their approval steps."""
+    from app.approvals.workflow import progress_mismatches, sync_progress
+    mismatches = progress_mismatches()
+    for row in mismatches[:limit]:
+        diffs = ", ".join(f"{col} {row[col]!r} != {row['expected_' + col]!r}"
+                          for col in ("current_stage", "current_approver_id", "steps_total", "steps_approved")
+                          if row[col] != row["expected_" + col])
+        click.echo(f"request {row['id']}: {diffs}")
+    click.echo(f"{len(mismatches)} requests out of sync")
+    if mismatches and fix:
+        sync_progress([row["id"] for row in mismatches], touch=False)
+        db.session.commit()
+        click.echo(f"fixed {len(mismatches)} requests, {len(progress_mismatches())} still out of sync")
+    elif mismatches:
+        raise SystemExit(1)
+
+
+@click.command("export-events")
+@click.option("--start", type=click.DateTime(), required=True, help="Events at or after this date (UTC).")
+@click.option("--end", type=click.DateTime(), default=None, help="Events before this date (default: now).")
+@click.option("--out", type=click.Path(dir_okay=False, writable=True), default="-", show_default=True,
+              help="NDJSON file to write ('-' for stdout).")
+def export_events_command(start, end, out):
+    """Export approval events in a date range from the append-only event log, for compliance pulls."""
+    from datetime import datetime
+    from app.approvals.events import event_dict, iter_events
+    count = 0
+    with click.open_file(out, "w", encoding="utf-8") as fh:
+        for rows in iter_events(start, end or datetime.utcnow()):
+            fh.write("".join(json.dumps(event_dict(row)) + "\n" for row in rows))
+            count += len(rows)
+    click.echo(f"exported {count} events", err=True)
+
+
+@click.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+              help="Defaults from the file extension.")
+@click.option("--batch-size", type=int, default=1000, show_default=True)
+@click.option("--report", "report_path", type=click.Path(dir_okay=False), default=None,
+              help="Write the per-row results here as NDJSON.")
+def import_users_command(path, fmt, batch_size, report_path):
+    """Upsert users from a CSV or NDJSON file, keyed on oid / lower(email)."""
+    from app.users.importer import detect_format, import_users, parse_rows
+    fmt = fmt or detect_format(path, None)
+    started = time.perf_counter()
+    with open(path, "r", encoding="utf-8-sig", newline="") as fh:
+        report = import_users(parse_rows(fh, fmt), batch_size)
+    elapsed = time.perf_counter() - started
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as out:
+            for row in report.rows:
+                out.write(json.dumps(row) + "\n")
+    for row in report.rows:
+        if row["result"] == "error":
+            click.echo(f"row {row['row']} ({row['email'] or '?'}): {row['error']}", err=True)
+    c = report.counts
+    click.echo(f"{len(report.rows)} rows in {elapsed:.2f}s: {c['created']} created, {c['updated']} updated, "
+               f"{c['unchanged']} unchanged, {c['error']} errors")
+
+
+@click.command("sync-directory")
+@click.option("--full", is_flag=True, help="Ignore the stored delta link and re-read the whole directory.")
+def sync_directory_command(full):
+    """Pull users from Microsoft Graph (delta query) into the users table."""
+    from app.auth.directory_sync import DirectorySync, GraphError
+    try:
+        metrics = DirectorySync().run(full=full)
+    except GraphError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(metrics, indent=2))
+
+
+@click.command("purge-sessions")
+def purge_sessions_command():
+    """Delete expired server-side sessions (also done periodically by the app)."""
+    from app.auth.session_store import purge_expired_sessions, session_count
+    removed = purge_expired_sessions()
+    click.echo(f"purged {removed} expired sessions, {session_count()} remain")
+
+
+def register_commands(app):
+    """Attach the app's CLI commands (run with `flask --app run <command>`)."""
+    app.cli.add_command(render_pdfs_command)
+    app.cli.add_command(pdf_format_command)
+    app.cli.add_command(form_pdf_backend_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(search_reindex_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(sync_directory_command)
+    app.cli.add_command(route_requests_command)
+    app.cli.add_command(check_request_progress_command)
+    app.cli.add_command(export_events_command)
+    app.cli.add_command(purge_sessions_command)
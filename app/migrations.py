@@ -0,0 +1,221 @@
+# app/migrations.py
+"""
+Versioned schema migrations.
+
+Each migration runs once, in order, inside its own transaction, and is
+recorded in the schema_migrations table. Add new schema changes as a new
+entry at the end of MIGRATIONS instead of relying on db.create_all(),
+which never alters tables that already exist.
+"""
+from datetime import datetime
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.models import db
+from app.utils.search_index import create_fts_table, rebuild_index
+
+
+def _columns(conn, table):
+    return {c["name"]: c for c in inspect(conn).get_columns(table)}
+
+
+def _has_table(conn, table):
+    return inspect(conn).has_table(table)
+
+
+def _add_missing_columns(conn, table_name):
+    """ALTER TABLE ADD COLUMN for model columns the live table does not have yet."""
+    table = db.metadata.tables[table_name]
+    existing = _columns(conn, table_name)
+    for col in table.columns:
+        if col.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {col.name} {col.type.compile(conn.dialect)}"
+        default = col.default.arg if col.default is not None and not callable(col.default.arg) else None
+        if default is not None:
+            ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+            if not col.nullable:
+                ddl += " NOT NULL"
+        conn.execute(text(ddl))
+
+
+def _rebuild_table(conn, table_name):
+    """
+    Recreate a table from the model (SQLite cannot ALTER nullability or add
+    AUTOINCREMENT) and copy rows over, in SQLite's documented order: create
+    new_<table>, copy, drop the old table, rename new_<table>. Renaming the
+    old table out of the way instead would make SQLite rewrite other tables'
+    foreign keys to point at the renamed copy.
+    """
+    table = db.metadata.tables[table_name]
+    new_name = f"new_{table_name}"
+    conn.execute(text(f"DROP TABLE IF EXISTS {new_name}"))
+    scratch = MetaData()
+    for fk in table.foreign_keys:  # referenced tables only need to exist for the DDL to compile
+        if fk.column.table.name not in scratch.tables:
+            fk.column.table.to_metadata(scratch)
+    conn.execute(CreateTable(table.to_metadata(scratch, name=new_name)))
+    shared = [c for c in _columns(conn, table_name) if c in table.columns]
+    cols = ", ".join(shared)
+    conn.execute(text(f"INSERT INTO {new_name} ({cols}) SELECT {cols} FROM {table_name}"))
+    conn.execute(text(f"DROP TABLE {table_name}"))  # drops its indexes too
+    conn.execute(text(f"ALTER TABLE {new_name} RENAME TO {table_name}"))
+    for idx in table.indexes:
+        conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+# ----------------- Migrations -----------------
+
+def m001_baseline(conn):
+    """Create any tables that do not exist yet (fresh database or new models)."""
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def m002_pdf_render_columns(conn):
+    """Columns added for background, cached and incremental PDF rendering."""
+    for table_name in ("approval_steps", "form_templates", "requests", "pdf_render_jobs"):
+        _add_missing_columns(conn, table_name)
+    if not _columns(conn, "pdf_render_jobs")["step_id"]["nullable"]:
+        _rebuild_table(conn, "pdf_render_jobs")
+
+
+def m003_lookup_indexes(conn):
+    """Expression index on lower(email) plus the foreign key / filter indexes."""
+    # IF NOT EXISTS rather than checkfirst: SQLAlchemy cannot reflect expression indexes
+    for table_name in ("users", "signatures", "requests", "approval_steps"):
+        for idx in db.metadata.tables[table_name].indexes:
+            conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def m004_request_search(conn):
+    """FTS5 table for request search, backfilled from existing requests (skipped without FTS5)."""
+    if create_fts_table(conn):
+        rebuild_index(conn)
+
+
+def m005_users_listing_index(conn):
+    """(created_at, id) index behind the users list's keyset pagination."""
+    for idx in db.metadata.tables["users"].indexes:
+        conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def m006_cascade_indexes(conn):
+    """Foreign key indexes that set-based user deletes filter on."""
+    for table_name in ("approval_steps", "pdf_render_jobs"):
+        for idx in db.metadata.tables[table_name].indexes:
+            conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def m007_directory_sync_state(conn):
+    """Table holding the Graph delta link between directory sync runs."""
+    db.metadata.tables["directory_sync_state"].create(conn, checkfirst=True)
+
+
+def m008_msal_token_cache(conn):
+    """Table backing the shared MSAL token cache when MSAL_TOKEN_CACHE=db."""
+    db.metadata.tables["msal_token_cache"].create(conn, checkfirst=True)
+
+
+def m009_user_sessions(conn):
+    """Server-side session store."""
+    db.metadata.tables["user_sessions"].create(conn, checkfirst=True)
+
+
+def m010_form_routing(conn):
+    """Per-template approval routing rules."""
+    _add_missing_columns(conn, "form_templates")
+
+
+def m011_parallel_stages(conn):
+    """Quorum column for parallel approval stages."""
+    _add_missing_columns(conn, "approval_steps")
+
+
+def m012_my_requests_index(conn):
+    """(requester_id, created_at, id) index behind the My Requests keyset pagination."""
+    for idx in db.metadata.tables["requests"].indexes:
+        conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def m013_request_progress(conn):
+    """Denormalized current stage / approver / step counters on requests, backfilled from approval_steps."""
+    from app.approvals.workflow import sync_progress
+    _add_missing_columns(conn, "requests")
+    for idx in db.metadata.tables["requests"].indexes:
+        conn.execute(CreateIndex(idx, if_not_exists=True))
+    sync_progress(conn=conn, touch=False)
+
+
+def m014_optimistic_concurrency(conn):
+    """Version columns on requests / approval steps and the idempotency key table."""
+    for table_name in ("requests", "approval_steps"):
+        _add_missing_columns(conn, table_name)
+    db.metadata.tables["idempotency_keys"].create(conn, checkfirst=True)
+
+
+def m015_approval_events(conn):
+    """
+    Append-only approval event log, backfilled from the submissions and steps
+    that still exist. requests becomes AUTOINCREMENT so a deleted request's id
+    (and with it its events) is never handed to a new request.
+    """
+    from app.approvals.events import backfill_events, create_append_only_triggers
+    if conn.dialect.name == "sqlite":
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'requests'")).scalar()
+        if "AUTOINCREMENT" not in sql.upper():
+            _rebuild_table(conn, "requests")
+    db.metadata.tables["approval_events"].create(conn, checkfirst=True)
+    create_append_only_triggers(conn)
+    backfill_events(conn)
+
+
+def m016_user_deactivated_by(conn):
+    """users.deactivated_by, so the directory sync only reactivates users it deactivated itself."""
+    _add_missing_columns(conn, "users")
+
+
+MIGRATIONS = [
+    (1, "baseline", m001_baseline),
+    (2, "pdf render columns", m002_pdf_render_columns),
+    (3, "lookup indexes", m003_lookup_indexes),
+    (4, "request search", m004_request_search),
+    (5, "users listing index", m005_users_listing_index),
+    (6, "cascade indexes", m006_cascade_indexes),
+    (7, "directory sync state", m007_directory_sync_state),
+    (8, "msal token cache", m008_msal_token_cache),
+    (9, "user sessions", m009_user_sessions),
+    (10, "form routing", m010_form_routing),
+    (11, "parallel stages", m011_parallel_stages),
+    (12, "my requests index", m012_my_requests_index),
+    (13, "request progress", m013_request_progress),
+    (14, "optimistic concurrency", m014_optimistic_concurrency),
+    (15, "approval events", m015_approval_events),
+    (16, "user deactivated by", m016_user_deactivated_by),
+]
+
+
+def applied_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade(engine=None):
+    """Apply every pending migration; returns the versions that were applied."""
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) "
+                              "VALUES (:v, :n, :at)"),
+                         {"v": version, "n": name, "at": datetime.utcnow()})
+        applied.append(version)
+    return applied
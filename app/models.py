@@ -1,5 +1,6 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
 
 db = SQLAlchemy()
 
@@ -15,10 +16,12 @@ class User(db.Model):
     'admin'
     status = db.Column(db.String(40), nullable=False, default="active")   # 'active' | 
     'deactivated'
+    deactivated_by = db.Column(db.String(20), nullable=True)  # 'directory' when the directory sync deactivated it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     # Relationships
     signatures = db.relationship('Signature', back_populates='user', cascade='all, delete-orphan')
-    requests = db.relationship('Request', back_populates='requester', cascade='all, delete-orphan')
+    requests = db.relationship('Request', back_populates='requester', cascade='all, delete-orphan',
+                               foreign_keys='Request.requester_id')
     approval_steps = db.relationship('ApprovalStep', back_populates='approver', cascade='all, delete-orphan')
 
     def as_dict(self):
@@ -32,11 +35,17 @@ class User(db.Model):
             "created_at": self.created_at.isoformat()
         }
 
+# Every login/duplicate check filters on lower(email)
+db.Index("ix_users_email_lower", func.lower(User.email))
+# Users list / export pages newest-first on (created_at, id)
+db.Index("ix_users_created_at_id", User.created_at, User.id)
+
+
 class Signature(db.Model):
     __tablename__ = "signatures"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     image_path = db.Column(db.String(255), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -58,7 +67,9 @@ class FormTemplate(db.Model):
     name = db.Column(db.String(200), nullable=False)
     form_code = db.Column(db.String(50), unique=True, nullable=False)
     latex_template_path = db.Column(db.String(255), nullable=False)
+    pdf_backend = db.Column(db.String(20), nullable=False, default="latex")  # 'latex' | 'direct'
     fields_json = db.Column(db.JSON, nullable=False)
+    routing_json = db.Column(db.JSON, nullable=True)  # approval routing rules, see app/approvals/routing.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     requests = db.relationship('Request', back_populates='form_template', cascade='all, delete-orphan')
@@ -69,26 +80,40 @@ class FormTemplate(db.Model):
             "name": self.name,
             "form_code": self.form_code,
             "latex_template_path": self.latex_template_path,
+            "pdf_backend": self.pdf_backend,
             "fields_json": self.fields_json,
+            "routing_json": self.routing_json,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
 
 class Request(db.Model):
     __tablename__ = "requests"
+    # ids are never reused, so approval_events of a deleted request can't attach to a new one
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = db.Column(db.Integer, primary_key=True)
     form_template_id = db.Column(db.Integer, db.ForeignKey('form_templates.id'), nullable=False)
-    requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    status = db.Column(db.Enum('draft', 'pending', 'returned', 'approved', 'rejected', name='request_status'), nullable=False, default='draft')
+    requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.Enum('draft', 'pending', 'returned', 'approved', 'rejected', name='request_status'), nullable=False, default='draft', index=True)
     form_data_json = db.Column(db.JSON, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     submitted_at = db.Column(db.DateTime, nullable=True)
+    base_pdf_path = db.Column(db.String(255), nullable=True)  # unsigned form PDF rendered at submission
+    # Denormalized workflow position, kept in sync by app.approvals.workflow.sync_progress
+    current_stage = db.Column(db.Integer, nullable=True)  # sequence awaiting action; None unless pending
+    current_approver_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True,
+                                    index=True)  # sole pending approver of that stage; None for parallel stages
+    steps_total = db.Column(db.Integer, nullable=False, default=0)
+    steps_approved = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every approve/return (compare-and-swap)
 
     form_template = db.relationship('FormTemplate', back_populates='requests')
-    requester = db.relationship('User', back_populates='requests')
+    requester = db.relationship('User', back_populates='requests', foreign_keys=[requester_id])
+    current_approver = db.relationship('User', foreign_keys=[current_approver_id], viewonly=True)
     approval_steps = db.relationship('ApprovalStep', back_populates='request', order_by='ApprovalStep.sequence', cascade='all, delete-orphan')
+    render_jobs = db.relationship('PdfRenderJob', back_populates='request', cascade='all, delete-orphan')
 
     def as_dict(self):
         return {
@@ -100,23 +125,42 @@ class Request(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "submitted_at": self.submitted_at.isoformat() if self.submitted_at else None,
+            "base_pdf_path": self.base_pdf_path,
+            "current_stage": self.current_stage,
+            "current_approver_id": self.current_approver_id,
+            "steps_total": self.steps_total,
+            "steps_approved": self.steps_approved,
+            "version": self.version,
         }
 
+# My Requests pages one requester's rows newest-first on (created_at, id)
+db.Index("ix_requests_requester_created", Request.requester_id, Request.created_at, Request.id)
+
 
 class ApprovalStep(db.Model):
     __tablename__ = "approval_steps"
+    __table_args__ = (db.Index("ix_approval_steps_approver_status", "approver_id", "status"),)
 
     id = db.Column(db.Integer, primary_key=True)
-    request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False, index=True)
     approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    sequence = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.Enum('pending', 'approved', 'rejected', 'returned', name='approval_step_status'), nullable=False, default='pending')
+    sequence = db.Column(db.Integer, nullable=False)  # stage number; steps sharing it are approved in parallel
+    quorum = db.Column(db.Integer, nullable=True)  # approvals that complete the stage; None = all of them
+    status = db.Column(db.Enum('pending', 'approved', 'rejected', 'returned', 'skipped', name='approval_step_status'), nullable=False, default='pending')
     comments = db.Column(db.Text, nullable=True)
     signed_pdf_path = db.Column(db.String(255), nullable=True)
+    pdf_status = db.Column(db.String(20), nullable=True)  # None | 'rendering' | 'rendered' | 'failed'
     actioned_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every status change (compare-and-swap)
 
     request = db.relationship('Request', back_populates='approval_steps')
     approver = db.relationship('User', back_populates='approval_steps')
+    render_jobs = db.relationship('PdfRenderJob', back_populates='step', cascade='all, delete-orphan')
+
+    @property
+    def order_key(self):
+        """Order in which approvals happened: by stage, then by time within a parallel stage."""
+        return (self.sequence, self.actioned_at or datetime.max, self.id or 0)
 
     def as_dict(self):
         return {
@@ -124,8 +168,145 @@ class ApprovalStep(db.Model):
             "request_id": self.request_id,
             "approver_id": self.approver_id,
             "sequence": self.sequence,
+            "quorum": self.quorum,
             "status": self.status,
             "comments": self.comments,
             "signed_pdf_path": self.signed_pdf_path,
+            "pdf_status": self.pdf_status,
             "actioned_at": self.actioned_at.isoformat() if self.actioned_at else None,
+            "version": self.version,
+        }
+
+
+class PdfRenderJob(db.Model):
+    __tablename__ = "pdf_render_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False, index=True)
+    step_id = db.Column(db.Integer, db.ForeignKey('approval_steps.id'), nullable=True, index=True)  # None for 'base' jobs
+    kind = db.Column(db.String(20), nullable=False, default="full")  # 'full' | 'base' | 'stamp'
+    status = db.Column(db.String(20), nullable=False, default="queued")  # 'queued' | 'rendering' | 'rendered' | 'failed'
+    signature_paths = db.Column(db.JSON, nullable=False, default=list)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    request = db.relationship('Request', back_populates='render_jobs')
+    step = db.relationship('ApprovalStep', back_populates='render_jobs')
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "step_id": self.step_id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DirectorySyncState(db.Model):
+    """Where the Graph directory sync left off (one row per synced resource)."""
+    __tablename__ = "directory_sync_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    resource = db.Column(db.String(50), unique=True, nullable=False)  # 'users'
+    delta_link = db.Column(db.Text, nullable=True)  # None until a full sync has completed
+    last_full_sync_at = db.Column(db.DateTime, nullable=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # 'ok' | 'failed'
+    last_error = db.Column(db.Text, nullable=True)
+    last_metrics = db.Column(db.JSON, nullable=True)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "resource": self.resource,
+            "has_delta_link": bool(self.delta_link),
+            "last_full_sync_at": self.last_full_sync_at.isoformat() if self.last_full_sync_at else None,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_metrics": self.last_metrics,
+        }
+
+
+class MsalTokenCache(db.Model):
+    """Serialized MSAL token cache shared by every worker (MSAL_TOKEN_CACHE=db)."""
+    __tablename__ = "msal_token_cache"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    state = db.Column(db.Text, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every save (compare-and-swap)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UserSession(db.Model):
+    """Server-side session; the cookie only carries the token whose hash is `id`."""
+    __tablename__ = "user_sessions"
+
+    id = db.Column(db.String(64), primary_key=True)  # sha256 of the cookie token
+    user_email = db.Column(db.String(180), nullable=True, index=True)  # lower(email), for revocation
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class IdempotencyKey(db.Model):
+    """Outcome of an approve/return POST, so a repeated submit of the same form replays it instead of acting twice."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.Index("ix_idempotency_keys_user_created", "user_id", "created_at"),)
+
+    key = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    request_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # 'approve' | 'return'
+    outcome = db.Column(db.String(30), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ApprovalEvent(db.Model):
+    """
+    One workflow transition, append-only (see app.approvals.events). No foreign
+    keys: events outlive the requests and users they describe, so they carry
+    copies of the actor's name / email and the form code.
+    """
+    __tablename__ = "approval_events"
+    __table_args__ = (
+        db.Index("ix_approval_events_request_id", "request_id", "id"),  # per-request timeline
+        db.Index("ix_approval_events_at_id", "at", "id"),  # audit export by date range
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, nullable=False)
+    form_code = db.Column(db.String(50), nullable=True)
+    step_id = db.Column(db.Integer, nullable=True)
+    sequence = db.Column(db.Integer, nullable=True)  # stage of the step, None for request-level events
+    event = db.Column(db.String(20), nullable=False)  # 'submitted' | 'approved' | 'skipped' | 'returned' | 'completed'
+    actor_id = db.Column(db.Integer, nullable=True)  # None for system events (completed)
+    actor_name = db.Column(db.String(120), nullable=True)
+    actor_email = db.Column(db.String(180), nullable=True)
+    comments = db.Column(db.Text, nullable=True)
+    at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "form_code": self.form_code,
+            "step_id": self.step_id,
+            "sequence": self.sequence,
+            "event": self.event,
+            "actor_id": self.actor_id,
+            "actor_name": self.actor_name,
+            "actor_email": self.actor_email,
+            "comments": self.comments,
+            "at": self.at.isoformat() if self.at else None,
         }
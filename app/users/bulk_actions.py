@@ -0,0 +1,129 @@
+# app/users/bulk_actions.py
+"""
+Set-based admin actions over many users at once.
+
+Each action takes a list of user ids (the route resolves a users-list filter
+to ids first) and runs a handful of UPDATE / DELETE ... WHERE id IN (...)
+statements in one transaction. Deletes clear dependent rows (render jobs, approval steps,
+signatures, requests, search rows) with bulk statements instead of loading
+every ORM object for relationship cascades; other people's requests left
+without a pending step are returned to their students.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, or_, select, update
+
+from app.auth.session_store import revoke_user_sessions
+from app.models import db, User, Signature, Request, ApprovalStep, PdfRenderJob
+from app.users.importer import VALID_ROLES
+from app.utils.search_index import remove_requests
+
+BULK_ACTIONS = ("deactivate", "reactivate", "set_role", "delete")
+MAX_BULK_IDS = 10_000
+# Keep IN lists well under SQLite's bound-parameter limit
+_CHUNK = 500
+APPROVER_DELETED = "Returned automatically: the approver's account was deleted and no approver is left."
+
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for i in range(0, len(ids), _CHUNK):
+        yield ids[i:i + _CHUNK]
+
+
+def _load_targets(ids: List[int]) -> Dict[int, Tuple[str, str, str]]:
+    """id -> (role, status, email) for the ids that exist."""
+    found = {}
+    for chunk in _chunks(ids):
+        for user_id, role, status, email in db.session.execute(
+                select(User.id, User.role, User.status, User.email).where(User.id.in_(chunk))):
+            found[user_id] = (role, status, email)
+    return found
+
+
+def _update_status(ids: List[int], status: str) -> None:
+    for chunk in _chunks(ids):
+        db.session.execute(update(User).where(User.id.in_(chunk)).values(status=status, deactivated_by=None)
+                           .execution_options(synchronize_session=False))
+
+
+def _update_role(ids: List[int], role: str) -> None:
+    for chunk in _chunks(ids):
+        db.session.execute(update(User).where(User.id.in_(chunk)).values(role=role)
+                           .execution_options(synchronize_session=False))
+
+
+def _delete_users(ids: List[int]) -> None:
+    """Delete users and everything that hangs off them, children first."""
+    from app.approvals.workflow import return_stranded, sync_progress
+
+    for chunk in _chunks(ids):
+        request_ids = select(Request.id).where(Request.requester_id.in_(chunk))
+        step_ids = select(ApprovalStep.id).where(or_(ApprovalStep.approver_id.in_(chunk),
+                                                     ApprovalStep.request_id.in_(request_ids)))
+        doomed_requests = list(db.session.scalars(request_ids))
+        # other people's requests that lose a step and need their progress columns recomputed
+        touched_requests = set(db.session.scalars(
+            select(ApprovalStep.request_id).where(ApprovalStep.approver_id.in_(chunk)))) - set(doomed_requests)
+        statements = (
+            delete(PdfRenderJob).where(or_(PdfRenderJob.request_id.in_(request_ids),
+                                           PdfRenderJob.step_id.in_(step_ids))),
+            delete(ApprovalStep).where(or_(ApprovalStep.approver_id.in_(chunk),
+                                           ApprovalStep.request_id.in_(request_ids))),
+            delete(Signature).where(Signature.user_id.in_(chunk)),
+            delete(Request).where(Request.requester_id.in_(chunk)),
+        )
+        for stmt in statements:
+            db.session.execute(stmt.execution_options(synchronize_session=False))
+        sync_progress(touched_requests)
+        return_stranded(touched_requests, APPROVER_DELETED)
+        db.session.execute(delete(User).where(User.id.in_(chunk)).execution_options(synchronize_session=False))
+        remove_requests(doomed_requests)
+
+
+def run_bulk_action(action: str, ids: List[int], acting_user_id: Optional[int],
+                    role: Optional[str] = None) -> Dict[int, str]:
+    """
+    Apply `action` to every id in one transaction and return id -> outcome:
+    deactivated / reactivated / role_changed / deleted, unchanged, not_found,
+    or skipped_self (admins cannot deactivate, demote or delete themselves).
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"action must be one of: {', '.join(BULK_ACTIONS)}")
+    if action == "set_role" and role not in VALID_ROLES:
+        raise ValueError("role must be 'admin' or 'basicuser'")
+
+    ids = list(dict.fromkeys(ids))
+    existing = _load_targets(ids)
+    outcomes: Dict[int, str] = {}
+    todo: List[int] = []
+    for user_id in ids:
+        current = existing.get(user_id)
+        if current is None:
+            outcomes[user_id] = "not_found"
+        elif user_id == acting_user_id and not (action == "reactivate" or
+                                                 (action == "set_role" and role == "admin")):
+            outcomes[user_id] = "skipped_self"
+        elif ((action == "deactivate" and current[1] == "deactivated")
+              or (action == "reactivate" and current[1] == "active")
+              or (action == "set_role" and current[0] == role)):
+            outcomes[user_id] = "unchanged"
+        else:
+            todo.append(user_id)
+
+    if todo:
+        if action == "deactivate":
+            _update_status(todo, "deactivated")
+        elif action == "reactivate":
+            _update_status(todo, "active")
+        elif action == "set_role":
+            _update_role(todo, role)
+        else:
+            _delete_users(todo)
+    db.session.commit()  # also expires anything the bulk statements made stale
+    if action in ("deactivate", "delete"):
+        revoke_user_sessions(existing[user_id][2] for user_id in todo)
+
+    done = {"deactivate": "deactivated", "reactivate": "reactivated",
+            "set_role": "role_changed", "delete": "deleted"}[action]
+    outcomes.update((user_id, done) for user_id in todo)
+    return {user_id: outcomes[user_id] for user_id in ids}
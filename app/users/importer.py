@@ -0,0 +1,218 @@
+# app/users/importer.py
+"""
+Bulk user import: parse CSV / NDJSON rows and upsert them in batches.
+
+Rows are matched to existing users by oid first, then by lower(email). Each
+batch is looked up with one query per key and written with one executemany
+per operation, then committed, so a 50k-row file costs a few hundred
+statements instead of one round trip (and one duplicate query) per user.
+"""
+import csv
+import io
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from app.auth.session_store import revoke_user_sessions
+from app.models import db, User
+
+VALID_ROLES = ("admin", "basicuser")
+VALID_STATUSES = ("active", "deactivated")
+IMPORT_BATCH_SIZE = 1000
+
+
+def validate_user_fields(name: str, email: str, role: str, status: str) -> Optional[str]:
+    """The create-user rules; returns an error message or None."""
+    if not name or not email:
+        return "name and email required"
+    if role not in VALID_ROLES:
+        return "role must be 'admin' or 'basicuser'"
+    if status not in VALID_STATUSES:
+        return "status must be 'active' or 'deactivated'"
+    return None
+
+
+def parse_rows(stream, fmt: str) -> Iterator[dict]:
+    """Yield raw row dicts from a text stream in 'csv' or 'ndjson' format."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {"_error": f"invalid JSON: {e}"}
+            yield row if isinstance(row, dict) else {"_error": "each line must be a JSON object"}
+    else:
+        raise ValueError("format must be 'csv' or 'ndjson'")
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in ctype or "jsonl" in ctype:
+        return "ndjson"
+    return "csv"
+
+
+def _normalize(raw: dict) -> Tuple[dict, Optional[str]]:
+    if raw.get("_error"):
+        return {}, raw["_error"]
+    row = {
+        "name": str(raw.get("name") or "").strip(),
+        "email": str(raw.get("email") or "").strip(),
+        "oid": str(raw.get("oid") or "").strip() or None,
+        "role": str(raw.get("role") or "basicuser").strip().lower(),
+        "status": str(raw.get("status") or "active").strip().lower(),
+    }
+    return row, validate_user_fields(row["name"], row["email"], row["role"], row["status"])
+
+
+class ImportReport:
+    """Per-row results plus running totals."""
+
+    def __init__(self):
+        self.rows: List[dict] = []
+        self.counts: Dict[str, int] = {"created": 0, "updated": 0, "unchanged": 0, "error": 0}
+
+    def add(self, row_num: int, email: str, result: str, user_id: Optional[int] = None,
+            error: Optional[str] = None) -> None:
+        entry = {"row": row_num, "email": email, "result": result}
+        if user_id is not None:
+            entry["id"] = user_id
+        if error:
+            entry["error"] = error
+        self.rows.append(entry)
+        self.counts[result] += 1
+
+    def as_dict(self, include_rows: bool = True) -> dict:
+        out = dict(self.counts, total=len(self.rows))
+        if include_rows:
+            out["results"] = self.rows
+        return out
+
+
+def _write_batch(batch: List[Tuple[int, dict]], report: ImportReport, targets: Dict[int, int]) -> None:
+    """
+    Upsert one batch of validated rows inside a single transaction. `targets`
+    maps user ids already written by this import to the row that wrote them.
+    """
+    emails = {row["email"].lower() for _, row in batch}
+    oids = {row["oid"] for _, row in batch if row["oid"]}
+    existing = User.query.filter(func.lower(User.email).in_(emails)).all()
+    if oids:
+        existing += User.query.filter(User.oid.in_(oids)).all()
+    by_email = {u.email.lower(): u for u in existing}
+    by_oid = {u.oid: u for u in existing if u.oid}
+
+    inserts, updates, results = [], [], []
+    deactivated = []  # emails whose sessions end with this batch
+    for row_num, row in batch:
+        email_match = by_email.get(row["email"].lower())
+        oid_match = by_oid.get(row["oid"]) if row["oid"] else None
+        if oid_match and email_match and oid_match.id != email_match.id:
+            results.append((row_num, row, "error", None, "oid and email belong to different users"))
+            continue
+        user = oid_match or email_match
+        if user is not None and user.id in targets:
+            results.append((row_num, row, "error", None, f"duplicate of row {targets[user.id]}"))
+            continue
+        if user is None:
+            inserts.append(row)
+            results.append((row_num, row, "created", None, None))
+            continue
+        changes = {k: row[k] for k in ("name", "email", "role", "status")
+                   if getattr(user, k) != row[k]}
+        if "status" in changes:
+            changes["deactivated_by"] = None
+            if changes["status"] == "deactivated":
+                deactivated.append(user.email)
+        if row["oid"] and user.oid != row["oid"]:
+            changes["oid"] = row["oid"]
+        targets[user.id] = row_num
+        if changes:
+            updates.append(dict(changes, id=user.id))
+        results.append((row_num, row, "updated" if changes else "unchanged", user.id, None))
+
+    new_ids: Dict[str, int] = {}
+    if inserts:
+        created = db.session.execute(
+            insert(User).returning(User.id, User.email, sort_by_parameter_order=True), inserts)
+        new_ids = {email.lower(): user_id for user_id, email in created}
+    if updates:
+        db.session.execute(update(User), updates)
+    db.session.commit()
+    # the bulk statements bypass the identity map; drop what we loaded for this batch
+    db.session.expunge_all()
+    revoke_user_sessions(deactivated)
+
+    for row_num, row, result, user_id, error in results:
+        if result == "created":
+            user_id = new_ids.get(row["email"].lower())
+            targets[user_id] = row_num
+        report.add(row_num, row["email"], result, user_id, error)
+
+
+def _write_rows_individually(batch: List[Tuple[int, dict]], report: ImportReport,
+                             targets: Dict[int, int]) -> None:
+    """Fallback when a batch hits a constraint: retry row by row so one bad row fails alone."""
+    for row_num, row in batch:
+        try:
+            _write_batch([(row_num, row)], report, targets)
+        except IntegrityError as e:
+            db.session.rollback()
+            report.add(row_num, row["email"], "error", error=str(e.orig))
+
+
+def import_users(rows: Iterable[dict], batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Validate and upsert rows; returns the per-row report. Rows are numbered from 1."""
+    from app.users.routes import invalidate_user_cache
+
+    report = ImportReport()
+    seen: Dict[Tuple[str, str], int] = {}  # ("email" | "oid", normalized value) -> first row number
+    targets: Dict[int, int] = {}  # user id -> row that created or updated it
+    batch: List[Tuple[int, dict]] = []
+
+    def flush():
+        snapshot = dict(targets)
+        try:
+            _write_batch(batch, report, targets)
+        except IntegrityError:
+            db.session.rollback()
+            targets.clear()
+            targets.update(snapshot)
+            _write_rows_individually(batch, report, targets)
+        batch.clear()
+
+    for row_num, raw in enumerate(rows, start=1):
+        row, error = _normalize(raw)
+        if not error:
+            keys = [("email", row["email"].lower())] + ([("oid", row["oid"])] if row["oid"] else [])
+            dup = next((seen[k] for k in keys if k in seen), None)
+            if dup:
+                error = f"duplicate of row {dup}"
+            else:
+                seen.update((k, row_num) for k in keys)
+        if error:
+            report.add(row_num, row.get("email", ""), "error", error=error)
+            continue
+        batch.append((row_num, row))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if report.counts["updated"]:
+        invalidate_user_cache()
+    report.rows.sort(key=lambda r: r["row"])
+    return report
+
+
+def import_users_file(data: bytes, fmt: str, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    stream = io.StringIO(data.decode("utf-8-sig"))
+    return import_users(parse_rows(stream, fmt), batch_size)
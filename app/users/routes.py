@@ -1,25 +1,81 @@
 # app/users/routes.py
+import csv
+import json
+import os
+import threading
+import time
 from functools import wraps
+from datetime import datetime
 from flask import (
     Blueprint, request, jsonify, render_template, session,
-    redirect, url_for, flash
+    redirect, url_for, flash, g, Response, stream_with_context
 )
-from sqlalchemy import func
-from app.models import db, User
+from sqlalchemy import and_, func, or_
+from app.auth.session_store import revoke_user_sessions
+from app.models import db, User, DirectorySyncState
+from app.users.bulk_actions import APPROVER_DELETED, MAX_BULK_IDS, run_bulk_action
+from app.users.importer import VALID_ROLES, VALID_STATUSES, detect_format, import_users_file, validate_user_fields
 
 users_bp = Blueprint("users_bp", __name__)
 
 # ----------------- Helpers & Decorators -----------------
 
-def current_db_user():
-    """Return the DB user row for the currently signed-in O365 user (or None)."""
+# Cross-request cache of session identity -> users.id. Entries expire after
+# USER_CACHE_TTL seconds and are dropped when users_bp changes the user; other
+# processes only see such changes once their own entry expires.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+_user_id_cache = {}  # (oid, email) -> (user_id, expires_at)
+_user_id_cache_lock = threading.Lock()
+_MISSING = object()
+
+
+def _session_identity():
     info = session.get("user")
     if not info:
         return None
-    email = (info.get("email") or info.get("preferred_username") or "").strip()
+    email = (info.get("email") or info.get("preferred_username") or "").strip().lower()
     if not email:
         return None
-    return User.query.filter(func.lower(User.email) == email.lower()).first()
+    return (info.get("oid") or "", email)
+
+
+def invalidate_user_cache(user=None):
+    """Forget cached identities for one user (or everyone)."""
+    with _user_id_cache_lock:
+        if user is None:
+            _user_id_cache.clear()
+            return
+        for key, (user_id, _) in list(_user_id_cache.items()):
+            if user_id == user.id or key[1] == (user.email or "").lower():
+                _user_id_cache.pop(key, None)
+
+
+def current_db_user():
+    """Return the DB user row for the currently signed-in O365 user (or None).
+
+    Resolved once per request and kept on flask.g.
+    """
+    cached = g.get("_current_db_user", _MISSING)
+    if cached is not _MISSING:
+        return cached
+    g._current_db_user = _resolve_db_user()
+    return g._current_db_user
+
+
+def _resolve_db_user():
+    key = _session_identity()
+    if not key:
+        return None
+    hit = _user_id_cache.get(key)
+    if hit and hit[1] > time.monotonic():
+        u = db.session.get(User, hit[0])
+        if u is not None:
+            return u
+    u = User.query.filter(func.lower(User.email) == key[1]).first()
+    if u is not None:
+        with _user_id_cache_lock:
+            _user_id_cache[key] = (u.id, time.monotonic() + USER_CACHE_TTL)
+    return u
 
 def require_login(f):
     @wraps(f)
@@ -41,14 +97,88 @@ def require_admin(f):
         return f(*args, **kwargs)
     return wrapper
 
+# ----------------- Listing -----------------
+
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 500
+USERS_EXPORT_BATCH = 1000
+USER_FIELDS = ("id", "oid", "name", "email", "role", "status", "created_at")
+
+
+def _encode_user_cursor(u) -> str:
+    return f"{u.created_at.isoformat() if u.created_at else ''}|{u.id}"
+
+
+def _decode_user_cursor(cursor):
+    try:
+        ts, user_id = cursor.rsplit("|", 1)
+        return (datetime.fromisoformat(ts) if ts else None), int(user_id)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _users_query(args):
+    """Users matching the role / status / prefix filters in the query string."""
+    query = User.query
+    role = (args.get("role") or "").strip().lower()
+    if role:
+        query = query.filter(User.role == role)
+    status = (args.get("status") or "").strip().lower()
+    if status:
+        query = query.filter(User.status == status)
+    prefix = (args.get("q") or "").strip().lower()
+    if prefix:
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(or_(func.lower(User.name).like(pattern, escape="\\"),
+                                 func.lower(User.email).like(pattern, escape="\\")))
+    return query
+
+
+def _users_page(query, cursor=None, limit=USERS_PAGE_SIZE):
+    """One keyset page, newest first by (created_at, id); returns (users, next_cursor)."""
+    after = _decode_user_cursor(cursor) if cursor else None
+    if after:
+        ts, user_id = after
+        if ts is None:
+            query = query.filter(User.created_at.is_(None), User.id < user_id)
+        else:
+            query = query.filter(or_(User.created_at < ts,
+                                     and_(User.created_at == ts, User.id < user_id),
+                                     User.created_at.is_(None)))
+    users = (query.order_by(User.created_at.desc().nulls_last(), User.id.desc())
+             .limit(limit + 1).all())
+    if len(users) > limit:
+        users = users[:limit]
+        return users, _encode_user_cursor(users[-1])
+    return users, None
+
+
+def _projection(args):
+    """Requested ?fields=a,b subset of User.as_dict(), or None for every field."""
+    raw = (args.get("fields") or "").strip()
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in USER_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _project(u, fields):
+    d = u.as_dict()
+    return d if fields is None else {f: d[f] for f in fields}
+
+
 # ----------------- UI Page -----------------
 
 @users_bp.get("/")  # http://localhost:5000/users/
 @require_login
 @require_admin
 def users_page():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template("users.html", users=users)
+    cursor = request.args.get("after") or None
+    users, next_cursor = _users_page(_users_query(request.args), cursor)
+    return render_template("users.html", users=users, next_cursor=next_cursor, is_first_page=not cursor)
 
 # ----------------- JSON API -----------------
 
@@ -56,8 +186,44 @@ def users_page():
 @require_login
 @require_admin
 def list_users_api():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return jsonify([u.as_dict() for u in users])
+    """
+    Keyset-paginated user list. Query params: role, status, q (name/email
+    prefix), fields (comma-separated projection), limit, after (cursor from
+    the previous page). The body stays a JSON list; the next page's URL is in
+    a `Link: <...>; rel="next"` header. format=ndjson streams every matching
+    user instead.
+    """
+    try:
+        fields = _projection(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("format") == "ndjson":
+        return _export_users_ndjson(request.args.to_dict(), fields)
+
+    limit = request.args.get("limit", USERS_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), USERS_MAX_PAGE_SIZE)
+    users, next_cursor = _users_page(_users_query(request.args), request.args.get("after") or None, limit)
+    resp = jsonify([_project(u, fields) for u in users])
+    if next_cursor:
+        args = {**request.args.to_dict(), "after": next_cursor}
+        resp.headers["Link"] = f'<{url_for("users_bp.list_users_api", **args)}>; rel="next"'
+    return resp
+
+
+def _export_users_ndjson(args, fields):
+    """One JSON object per line, fetched in keyset batches so memory stays flat."""
+    def generate():
+        cursor = None
+        while True:
+            users, cursor = _users_page(_users_query(args), cursor, USERS_EXPORT_BATCH)
+            yield "".join(json.dumps(_project(u, fields)) + "\n" for u in users)
+            db.session.expunge_all()
+            if not cursor:
+                break
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=users.ndjson"})
 
 @users_bp.post("/api")
 @require_login
@@ -78,23 +244,12 @@ def create_user_api():
         status = (request.form.get("status") or "active").lower()
         wants_json = False
 
-    # Validate
-    if not name or not email:
+    # Validate (same rules as the bulk importer)
+    error = validate_user_fields(name, email, role, status)
+    if error:
         if wants_json:
-            return jsonify({"error": "name and email required"}), 400
-        flash("Name and email are required.", "error")
-        return redirect(url_for("users_bp.users_page"))
-
-    if role not in ("admin", "basicuser"):
-        if wants_json:
-            return jsonify({"error": "role must be 'admin' or 'basicuser'"}), 400
-        flash("Role must be admin or basicuser.", "error")
-        return redirect(url_for("users_bp.users_page"))
-
-    if status not in ("active", "deactivated"):
-        if wants_json:
-            return jsonify({"error": "status must be 'active' or 'deactivated'"}), 400
-        flash("Status must be active or deactivated.", "error")
+            return jsonify({"error": error}), 400
+        flash(error[0].upper() + error[1:] + ".", "error")
         return redirect(url_for("users_bp.users_page"))
 
     # Duplicate email (case-insensitive)
@@ -113,6 +268,75 @@ def create_user_api():
     flash("User created.", "success")
     return redirect(url_for("users_bp.users_page"))
 
+@users_bp.post("/api/bulk")
+@require_login
+@require_admin
+def bulk_import_users_api():
+    """
+    Upsert users from a CSV or NDJSON upload (multipart field "file") or raw
+    body. Columns: name, email, role, status, oid. Returns per-row results;
+    pass ?summary=1 to get only the totals.
+    """
+    upload = request.files.get("file")
+    if upload:
+        data, fmt = upload.read(), detect_format(upload.filename, upload.mimetype)
+    else:
+        data, fmt = request.get_data(), detect_format(None, request.content_type)
+    fmt = (request.args.get("format") or fmt).lower()
+    if not data:
+        return jsonify({"error": "no rows provided"}), 400
+    try:
+        report = import_users_file(data, fmt)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report.as_dict(include_rows=not request.args.get("summary")))
+
+@users_bp.post("/api/batch")
+@require_login
+@require_admin
+def bulk_user_action_api():
+    """
+    Apply one action to many users in a single transaction.
+
+    Body: {"action": "deactivate" | "reactivate" | "set_role" | "delete",
+           "ids": [...]} or {"action": ..., "filter": {"role", "status", "q"}},
+    plus "role" for set_role. Returns {"results": {id: outcome}, "counts": {...}}.
+    """
+    data = request.get_json(silent=True) or {}
+    action = (data.get("action") or "").lower()
+    if "ids" in data:
+        try:
+            ids = [int(i) for i in data["ids"]]
+        except (TypeError, ValueError):
+            return jsonify({"error": "ids must be a list of integers"}), 400
+    elif isinstance(data.get("filter"), dict) and data["filter"]:
+        ids = [row.id for row in _users_query(data["filter"]).with_entities(User.id)
+               .limit(MAX_BULK_IDS + 1)]
+    else:
+        return jsonify({"error": "ids or filter required"}), 400
+    if len(ids) > MAX_BULK_IDS:
+        return jsonify({"error": f"at most {MAX_BULK_IDS} users per batch"}), 400
+
+    me = current_db_user()
+    try:
+        results = run_bulk_action(action, ids, me.id if me else None, (data.get("role") or "").lower() or None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    invalidate_user_cache()
+
+    counts = {}
+    for outcome in results.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return jsonify({"action": action, "results": {str(k): v for k, v in results.items()}, "counts": counts})
+
+@users_bp.get("/api/directory-sync")
+@require_login
+@require_admin
+def directory_sync_status_api():
+    """Result and metrics of the last Graph directory sync."""
+    state = DirectorySyncState.query.filter_by(resource="users").first()
+    return jsonify(state.as_dict() if state else {"resource": "users", "last_run_at": None})
+
 @users_bp.put("/api/<int:user_id>")
 @require_login
 @require_admin
@@ -122,6 +346,7 @@ def update_user_api(user_id):
         return jsonify({"error": "not found"}), 404
 
     data = request.get_json(silent=True) or {}
+    old_email, old_status = u.email, u.status
 
     if "name" in data and data["name"]:
         u.name = data["name"]
@@ -137,16 +362,20 @@ def update_user_api(user_id):
         u.email = new_email
     if "role" in data and data["role"]:
         role = data["role"].lower()
-        if role not in ("admin", "basicuser"):
+        if role not in VALID_ROLES:
             return jsonify({"error": "role must be 'admin' or 'basicuser'"}), 400
         u.role = role
     if "status" in data and data["status"]:
         status = data["status"].lower()
-        if status not in ("active", "deactivated"):
+        if status not in VALID_STATUSES:
             return jsonify({"error": "status must be 'active' or 'deactivated'"}), 400
         u.status = status
+        u.deactivated_by = None
 
     db.session.commit()
+    invalidate_user_cache(u)
+    if u.status == "deactivated" and old_status != "deactivated":
+        revoke_user_sessions([old_email, u.email])
     return jsonify(u.as_dict())
 
 @users_bp.delete("/api/<int:user_id>")
@@ -156,8 +385,16 @@ def delete_user_api(user_id):
     u = User.query.get(user_id)
     if not u:
         return jsonify({"error": "not found"}), 404
+    from app.approvals.workflow import return_stranded, sync_progress
+
+    invalidate_user_cache(u)
+    touched_requests = {s.request_id for s in u.approval_steps if s.request.requester_id != u.id}
     db.session.delete(u)
+    db.session.flush()
+    sync_progress(touched_requests)
+    return_stranded(touched_requests, APPROVER_DELETED)
     db.session.commit()
+    revoke_user_sessions([u.email])
     return jsonify({"ok": True})
 
 @users_bp.post("/api/<int:user_id>/deactivate")
@@ -168,7 +405,10 @@ def deactivate_user_api(user_id):
     if not u:
         return jsonify({"error": "not found"}), 404
     u.status = "deactivated"
+    u.deactivated_by = None
     db.session.commit()
+    invalidate_user_cache(u)
+    revoke_user_sessions([u.email])
     return jsonify(u.as_dict())
 
 @users_bp.post("/api/<int:user_id>/reactivate")
@@ -179,7 +419,9 @@ def reactivate_user_api(user_id):
     if not u:
         return jsonify({"error": "not found"}), 404
     u.status = "active"
+    u.deactivated_by = None
     db.session.commit()
+    invalidate_user_cache(u)
     return jsonify(u.as_dict())
 
 
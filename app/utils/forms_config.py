@@ -3,6 +3,7 @@ FORM_TEMPLATES = [
         "name": "FERPA Authorization Form",
         "form_code": "ferpa_auth",
         "latex_template_path": "latex/ferpa_template.tex",
+        "pdf_backend": "latex",
         "fields_json": {
             "student_name": "text",
             "peoplesoft_id": "text",
@@ -14,12 +15,16 @@ FORM_TEMPLATES = [
             "purpose_of_disclosure": ["Family", "Educational Institution", "Employer", "Public or Media of Scholarship", "Other"],
             "phone_password": "text",
             "signature": "file"
-        }
+        },
+        "routing_json": [
+            {"steps": [{"role": "admin"}]}
+        ]
     },
     {
     "name": "General Petition Form",
     "form_code": "general_petition",
     "latex_template_path": "latex/general_petition_template.tex",
+    "pdf_backend": "latex",
     "fields_json": {
         "student_name": "text",
         "student_id": "text",
@@ -59,6 +64,12 @@ FORM_TEMPLATES = [
         "explanation_of_request": "textarea",
         "signature": "file",
         "date": "auto_date"
-    }
+    },
+    "routing_json": [
+        # exceptions, special problems, overloads and graduate studies need a second sign-off
+        {"when": {"petition_reason_number": {"startswith": ["12.", "13.", "14.", "15.", "16."]}},
+         "steps": [{"role": "admin"}, {"role": "admin"}]},
+        {"steps": [{"role": "admin"}]}
+    ]
 }
 ]
\ No newline at end of file
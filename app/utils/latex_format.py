@@ -0,0 +1,84 @@
+# app/utils/latex_format.py
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Optional, Set, Tuple
+
+# Set PDFLATEX_PRECOMPILED_FORMAT=0 to always compile with the stock format
+FORMAT_ENABLED = os.getenv("PDFLATEX_PRECOMPILED_FORMAT", "1") == "1"
+
+BEGIN_DOCUMENT = "\\begin{document}"
+
+_failed: Set[str] = set()
+_build_lock = threading.Lock()
+
+
+def split_preamble(latex: str) -> Optional[Tuple[str, str]]:
+    """Split a document into (preamble, rest) at \\begin{document}."""
+    idx = latex.find(BEGIN_DOCUMENT)
+    if idx < 0:
+        return None
+    return latex[:idx], latex[idx:]
+
+
+def format_name(preamble: str) -> str:
+    """Formats are named after the preamble's hash, so an edited preamble gets a fresh dump."""
+    return "preamble_" + hashlib.sha256(preamble.encode("utf-8")).hexdigest()[:16]
+
+
+def build_format(latex_dir: str, preamble: str) -> Optional[str]:
+    """
+    Dump a pdflatex format with the preamble's packages preloaded (via mylatexformat).
+
+    Returns the format path without the .fmt suffix, or None if the dump failed.
+    """
+    name = format_name(preamble)
+    formats_dir = os.path.join(latex_dir, "formats")
+    os.makedirs(formats_dir, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=formats_dir, prefix=f".{name}.")
+    try:
+        with open(os.path.join(scratch, f"{name}.tex"), "w", encoding="utf-8") as fh:
+            fh.write(preamble + BEGIN_DOCUMENT + "\n\\end{document}\n")
+        result = subprocess.run(
+            ["pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+             "&pdflatex", "mylatexformat.ltx", f"{name}.tex"],
+            cwd=scratch, capture_output=True, text=True)
+        built = os.path.join(scratch, f"{name}.fmt")
+        if result.returncode != 0 or not os.path.exists(built):
+            _failed.add(name)
+            return None
+        os.replace(built, os.path.join(formats_dir, f"{name}.fmt"))
+    except OSError:
+        _failed.add(name)
+        return None
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return os.path.join(formats_dir, name)
+
+
+def ensure_format(latex_dir: str, latex: str) -> Optional[str]:
+    """Return the precompiled format for this document's preamble, building it on first use."""
+    if not FORMAT_ENABLED:
+        return None
+    parts = split_preamble(latex)
+    if not parts:
+        return None
+    preamble = parts[0]
+    name = format_name(preamble)
+    if name in _failed:
+        return None
+    fmt_base = os.path.join(latex_dir, "formats", name)
+    if os.path.exists(fmt_base + ".fmt"):
+        return fmt_base
+    with _build_lock:
+        if os.path.exists(fmt_base + ".fmt"):
+            return fmt_base
+        return build_format(latex_dir, preamble)
+
+
+def mark_format_failed(fmt_base: str) -> None:
+    """Stop using a format that failed a compile the stock format passed (e.g. an incompatible dump)."""
+    _failed.add(os.path.basename(fmt_base))
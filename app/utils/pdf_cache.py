@@ -0,0 +1,128 @@
+# app/utils/pdf_cache.py
+import functools
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Iterable
+
+# Upper bound for the on-disk cache; least recently used PDFs are evicted past it
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Signature digests remembered; a replaced image gets a new (mtime, size) key, so old ones age out
+DIGEST_MEMO_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=DIGEST_MEMO_SIZE)
+def _digest(path: str, mtime: float, size: int) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    """sha256 of a file, memoized on (path, mtime, size) so unchanged images are hashed once."""
+    st = os.stat(path)
+    return _digest(path, st.st_mtime, st.st_size)
+
+
+def render_cache_key(latex_source: str, signature_files: Iterable[str]) -> str:
+    """Content address for a render: the LaTeX source plus the bytes of every signature image."""
+    h = hashlib.sha256(latex_source.encode("utf-8"))
+    for path in signature_files:
+        h.update(b"\0")
+        h.update(_file_digest(path).encode("ascii"))
+    return h.hexdigest()
+
+
+class PdfRenderCache:
+    """Size-bounded, content-addressed store of compiled PDFs."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def fetch(self, key: str, dest: str) -> bool:
+        """
+        Copy the cached PDF for key to dest; False on a miss. The entry is opened
+        first, so an eviction racing with it (in any worker or process) is either
+        seen as a miss or happens after the copy has the file open.
+        """
+        path = self._path(key)
+        try:
+            src = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with src:
+            try:
+                os.utime(path)  # mark as recently used for eviction
+            except OSError:
+                pass
+            tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(src, out)
+                os.replace(tmp, dest)
+            except Exception:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key: str, pdf_path: str) -> str:
+        """Copy a freshly compiled PDF into the cache and evict if over budget."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        dest = self._path(key)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, dest)
+        self.evict()
+        return dest
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".pdf")]
+        except FileNotFoundError:
+            return 0
+        entries = []
+        total = 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # already evicted elsewhere, or held open by a reader on Windows
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "max_bytes": self.max_bytes}
@@ -0,0 +1,215 @@
+# app/utils/pdf_direct.py
+"""Minimal in-process PDF writer: wrapped Helvetica text plus JPEG/PNG images."""
+import struct
+import zlib
+from typing import List, Optional, Tuple
+
+PAGE_W, PAGE_H = 612, 792  # US Letter in points
+MARGIN = 72
+
+
+class UnencodableTextError(ValueError):
+    """Text the built-in Helvetica font (WinAnsi encoding) has no glyph for."""
+
+
+def _pdf_string(s: str) -> bytes:
+    try:
+        raw = s.encode("cp1252")
+    except UnicodeEncodeError as e:  # refuse rather than print '?' into the document
+        raise UnencodableTextError(f"{s[e.start:e.end]!r} cannot be drawn with the built-in PDF font") from None
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _wrap(text: str, size: float, width: float) -> List[str]:
+    # Helvetica averages roughly half an em per glyph; good enough for form text
+    max_chars = max(1, int(width / (size * 0.5)))
+    lines: List[str] = []
+    for para in str(text).splitlines() or [""]:
+        line = ""
+        for word in para.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if len(candidate) <= max_chars:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            while len(word) > max_chars:
+                lines.append(word[:max_chars])
+                word = word[max_chars:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def _jpeg_info(data: bytes) -> Optional[Tuple[int, int, int]]:
+    """(width, height, components) from the first SOF marker."""
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in (0xC0, 0xC1, 0xC2):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height, data[i + 9]
+        i += 2 + seg_len
+    return None
+
+
+def _png_unfilter(raw: bytes, width: int, height: int, bpp: int) -> bytearray:
+    stride = width * bpp
+    out = bytearray(height * stride)
+    prev = bytearray(stride)
+    pos = 0
+    for row in range(height):
+        ftype = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        for x in range(stride):
+            a = line[x - bpp] if x >= bpp else 0
+            b = prev[x]
+            c = prev[x - bpp] if x >= bpp else 0
+            if ftype == 1:
+                line[x] = (line[x] + a) & 0xFF
+            elif ftype == 2:
+                line[x] = (line[x] + b) & 0xFF
+            elif ftype == 3:
+                line[x] = (line[x] + ((a + b) >> 1)) & 0xFF
+            elif ftype == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                pred = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                line[x] = (line[x] + pred) & 0xFF
+        out[row * stride:(row + 1) * stride] = line
+        prev = line
+    return out
+
+
+def _load_image(path: str) -> Optional[dict]:
+    """Return a PDF image XObject description, or None for unsupported files."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if data[:2] == b"\xff\xd8":
+        info = _jpeg_info(data)
+        if not info:
+            return None
+        w, h, comps = info
+        colorspace = {1: "/DeviceGray", 4: "/DeviceCMYK"}.get(comps, "/DeviceRGB")
+        return {"w": w, "h": h, "dict": f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode",
+                "data": data}
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        pos, idat, ihdr = 8, [], None
+        while pos < len(data):
+            length, ctype = struct.unpack(">I4s", data[pos:pos + 8])
+            chunk = data[pos + 8:pos + 8 + length]
+            if ctype == b"IHDR":
+                ihdr = struct.unpack(">IIBBBBB", chunk)
+            elif ctype == b"IDAT":
+                idat.append(chunk)
+            pos += 12 + length
+        if not ihdr:
+            return None
+        w, h, depth, color, _, _, interlace = ihdr
+        if depth != 8 or interlace or color not in (0, 2, 4, 6):
+            return None
+        channels = {0: 1, 2: 3, 4: 2, 6: 4}[color]
+        colors = 1 if color in (0, 4) else 3
+        colorspace = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+        compressed = b"".join(idat)
+        if color in (0, 2):
+            # PDF understands PNG predictors, so the IDAT stream embeds as-is
+            return {"w": w, "h": h,
+                    "dict": (f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /FlateDecode "
+                             f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {w} >>"),
+                    "data": compressed}
+        # Alpha channel: unfilter, composite onto white, re-deflate
+        pixels = _png_unfilter(zlib.decompress(compressed), w, h, channels)
+        flat = bytearray()
+        for i in range(0, len(pixels), channels):
+            alpha = pixels[i + channels - 1]
+            for c in pixels[i:i + colors]:
+                flat.append((c * alpha + 255 * (255 - alpha)) // 255)
+        return {"w": w, "h": h, "dict": f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /FlateDecode",
+                "data": zlib.compress(bytes(flat))}
+    return None
+
+
+class SimplePdf:
+    """Lays out a vertical flow of text lines and images over as many pages as needed."""
+
+    def __init__(self):
+        self.pages: List[List[bytes]] = [[]]
+        self.images: List[dict] = []
+        self.y = PAGE_H - MARGIN
+
+    def _ensure_room(self, height: float) -> None:
+        if self.y - height < MARGIN:
+            self.pages.append([])
+            self.y = PAGE_H - MARGIN
+
+    def text(self, text: str, size: float = 11, bold: bool = False, indent: float = 0) -> None:
+        font = b"/F2" if bold else b"/F1"
+        for line in _wrap(text, size, PAGE_W - 2 * MARGIN - indent):
+            self._ensure_room(size * 1.4)
+            self.y -= size * 1.4
+            self.pages[-1].append(b"BT " + font + b" %g Tf %g %g Td " % (size, MARGIN + indent, self.y)
+                                  + _pdf_string(line) + b" Tj ET")
+
+    def space(self, height: float) -> None:
+        self.y -= height
+
+    def image(self, path: str, width: float) -> bool:
+        img = _load_image(path)
+        if not img:
+            return False
+        height = width * img["h"] / img["w"]
+        self._ensure_room(height + 6)
+        self.y -= height + 6
+        self.images.append(img)
+        name = b"/Im%d" % len(self.images)
+        self.pages[-1].append(b"q %g 0 0 %g %g %g cm " % (width, height, MARGIN, self.y) + name + b" Do Q")
+        return True
+
+    def tobytes(self) -> bytes:
+        objects: List[bytes] = []
+
+        def add(body: bytes) -> int:
+            objects.append(body)
+            return len(objects)
+
+        catalog = add(b"")  # filled in once the page tree id is known
+        pages_id = add(b"")
+        f1 = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        f2 = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        image_ids = []
+        for img in self.images:
+            image_ids.append(add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d " % (img["w"], img["h"])
+                                 + img["dict"].encode("ascii")
+                                 + b" /Length %d >>\nstream\n" % len(img["data"]) + img["data"] + b"\nendstream"))
+        xobjects = b" ".join(b"/Im%d %d 0 R" % (i + 1, oid) for i, oid in enumerate(image_ids))
+        resources = (b"<< /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << " % (f1, f2) + xobjects + b" >> >>")
+        page_ids = []
+        for ops in self.pages:
+            content = zlib.compress(b"\n".join(ops))
+            content_id = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+            page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources " % (pages_id, PAGE_W, PAGE_H)
+                                + resources + b" /Contents %d 0 R >>" % content_id))
+        objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+        objects[pages_id - 1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % p for p in page_ids)
+                                 + b"] /Count %d >>" % len(page_ids))
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for i, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for off in offsets:
+            out += b"%010d 00000 n \n" % off
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+        return bytes(out)
@@ -1,35 +1,132 @@
 # app/utils/pdf_generator.py
 import json
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an in-process limit only
+    fcntl = None
 
 from app.models import Request  # type: ignore
+from app.utils.pdf_cache import PdfRenderCache, render_cache_key
+from app.utils.pdf_direct import MARGIN, PAGE_W, SimplePdf, UnencodableTextError
+from app.utils.pdf_stamp import stamp_signature_page
+from app.utils.latex_format import ensure_format, mark_format_failed
+from app.utils.template_engine import LatexRaw, compile_template, latex_escape as _latex_escape, template_engine
+
+_render_caches: Dict[str, PdfRenderCache] = {}
+# PDF_RENDER_CACHE=0 always recompiles (also toggled off by `python -m scripts.bench pdf-backends`)
+RENDER_CACHE_ENABLED = os.getenv("PDF_RENDER_CACHE", "1") == "1"
+
+# Maximum number of pdflatex processes running at once (across threads and,
+# where fcntl is available, across processes sharing the latex dir)
+PDFLATEX_MAX_CONCURRENCY = max(1, int(os.getenv("PDFLATEX_MAX_CONCURRENCY", "2")))
+_compile_semaphore = threading.BoundedSemaphore(PDFLATEX_MAX_CONCURRENCY)
+
+MAKEFILE_CONTENTS = (
+    "PDFLATEX=pdflatex\n"
+    ".SUFFIXES: .tex .pdf\n"
+    "FMTFLAGS=\n"
+    "%.pdf: %.tex\n\t$(PDFLATEX) $(FMTFLAGS) -interaction=nonstopmode -halt-on-error $< > build.log 2>&1\n"
+    "\nclean:\n\trm -f *.aux *.log *.out *.toc build.log\n"
+)
+
+# Used for forms whose latex_template_path is missing on disk. Per-request
+# values stay out of the preamble so it can be served from a precompiled format.
+DEFAULT_TEMPLATE = r"""\documentclass[11pt]{article}
+\usepackage[margin=1in]{geometry}
+\usepackage{graphicx}
+\usepackage{hyperref}
+\usepackage[T1]{fontenc}
+\usepackage[utf8]{inputenc}
+\begin{document}
+\title{<<title>> Request}
+\date{<<submitted_date>>}
+\maketitle
+\section*{Submitter}
+\textbf{Name}: <<submitter_name>> \\
+\section*{Form Data}
+<<fields_block>>
+\section*{Signatures}
+<<signatures_block>>
+\end{document}
+"""
+_render_default = compile_template(DEFAULT_TEMPLATE)
+
+
+def get_render_cache(latex_dir: str) -> PdfRenderCache:
+    """Process-wide render cache living under <latex_dir>/cache."""
+    cache = _render_caches.get(latex_dir)
+    if cache is None:
+        cache = _render_caches.setdefault(latex_dir, PdfRenderCache(os.path.join(latex_dir, "cache")))
+    return cache
 
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def _latex_escape(s: str) -> str:
-    # Minimal LaTeX escaping
-    replacements = {
-        "\\": r"\textbackslash{}",
-        "{": r"\{",
-        "}": r"\}",
-        "#": r"\#",
-        "$": r"\$",
-        "%": r"\%",
-        "&": r"\&",
-        "_": r"\_",
-        "~": r"\textasciitilde{}",
-        "^": r"\textasciicircum{}",
-    }
-    out = []
-    for ch in s:
-        out.append(replacements.get(ch, ch))
-    return "".join(out)
+def _ensure_makefile(latex_dir: str) -> str:
+    """Write the shared Makefile when missing or stale; concurrent writers race harmlessly via os.replace."""
+    makefile_path = os.path.join(latex_dir, "Makefile")
+    try:
+        with open(makefile_path, "r", encoding="utf-8") as mf:
+            current = mf.read()
+    except FileNotFoundError:
+        current = None
+    if current != MAKEFILE_CONTENTS:
+        fd, tmp = tempfile.mkstemp(dir=latex_dir, prefix=".Makefile.")
+        with os.fdopen(fd, "w", encoding="utf-8") as mf:
+            mf.write(MAKEFILE_CONTENTS)
+        os.replace(tmp, makefile_path)
+    return makefile_path
+
+
+@contextmanager
+def _compile_slot(latex_dir: str):
+    """Hold one of PDFLATEX_MAX_CONCURRENCY compile slots for the duration of a build."""
+    with _compile_semaphore:
+        if fcntl is None:
+            yield
+            return
+        slots_dir = os.path.join(latex_dir, ".slots")
+        _ensure_dir(slots_dir)
+        while True:
+            for i in range(PDFLATEX_MAX_CONCURRENCY):
+                fh = open(os.path.join(slots_dir, f"slot{i}.lock"), "a")
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    fh.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                    fh.close()
+                return
+            time.sleep(0.05)
+
+
+def _promote(src: str, dest: str) -> None:
+    """Atomically place a finished PDF at dest (readers never see a partial file)."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".promote.", suffix=".pdf")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 
 def _render_form_fields(fields: Dict[str, Any]) -> str:
@@ -42,27 +139,80 @@ def _render_form_fields(fields: Dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
-def generate_request_pdf(request: Request, signature_paths: List[str]) -> str:
+def _run_make(scratch_dir: str, makefile_path: str, base_name: str, fmt_base: Optional[str]):
+    cmd = ["make", "-C", scratch_dir, "-f", makefile_path, f"{base_name}.pdf"]
+    if fmt_base:
+        cmd.append(f"FMTFLAGS=-fmt={fmt_base}")
+    with _compile_slot(os.path.dirname(makefile_path)):
+        return subprocess.run(cmd, capture_output=True, text=True)
+
+
+def compile_latex(latex: str, base_name: str, pdf_path: str, use_format: bool = True) -> str:
     """
-    Generate a PDF for a Request using LaTeX and Makefile integration.
+    Compile a LaTeX source to pdf_path in a private scratch directory.
 
-    Returns absolute path to the generated PDF.
+    When use_format is set, the document is compiled against a precompiled
+    format of its preamble (see app/utils/latex_format.py); if that fails the
+    compile is retried with the stock format, and the precompiled one is
+    dropped only if the retry succeeds.
     Raises RuntimeError if LaTeX compilation fails.
     """
-    # Determine repo root and latex dir
-    utils_dir = os.path.dirname(__file__)
-    repo_root = os.path.abspath(os.path.join(utils_dir, os.pardir, os.pardir))
-    latex_dir = os.path.join(repo_root, "latex_templates")
-    _ensure_dir(latex_dir)
+    latex_dir = os.path.dirname(pdf_path)
+    build_root = os.path.join(latex_dir, ".build")
+    _ensure_dir(build_root)
+    makefile_path = _ensure_makefile(latex_dir)
+    fmt_base = ensure_format(latex_dir, latex) if use_format else None
+
+    scratch_dir = tempfile.mkdtemp(dir=build_root, prefix=f"{base_name}.")
+    try:
+        with open(os.path.join(scratch_dir, f"{base_name}.tex"), "w", encoding="utf-8") as f:
+            f.write(latex)
+
+        # Run make against the shared Makefile inside the scratch dir
+        built_pdf = os.path.join(scratch_dir, f"{base_name}.pdf")
+        result = _run_make(scratch_dir, makefile_path, base_name, fmt_base)
+        if fmt_base and (result.returncode != 0 or not os.path.exists(built_pdf)):
+            result = _run_make(scratch_dir, makefile_path, base_name, None)
+            if result.returncode == 0 and os.path.exists(built_pdf):
+                # only the format failed; a document that fails both ways is bad input
+                mark_format_failed(fmt_base)
+
+        if result.returncode != 0 or not os.path.exists(built_pdf):
+            stderr = result.stderr or ""
+            stdout = result.stdout or ""
+            # Try to read build.log if present for better error output
+            build_log = os.path.join(scratch_dir, "build.log")
+            log_content = ""
+            if os.path.exists(build_log):
+                try:
+                    with open(build_log, "r", encoding="utf-8", errors="ignore") as lf:
+                        log_content = lf.read()
+                except Exception:
+                    pass
+            raise RuntimeError(
+                "LaTeX compilation failed.\n"
+                f"stdout:\n{stdout}\n"
+                f"stderr:\n{stderr}\n"
+                f"build.log:\n{log_content}\n"
+            )
+
+        _promote(built_pdf, pdf_path)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return pdf_path
 
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+
+
+def _request_context(request: Request, suffix: str = "") -> Dict[str, Any]:
+    """Backend-independent values pulled off a Request: names, form data, submitter, date."""
     # Build names
     form_type = (getattr(getattr(request, "form_template", None), "form_code", None) or
                  getattr(getattr(request, "form_template", None), "name", None) or
                  "form").upper().replace(" ", "_")
     req_id = getattr(request, "id", "unknown")
-    base_name = f"{form_type}_{req_id}"
-    tex_path = os.path.join(latex_dir, f"{base_name}.tex")
-    pdf_path = os.path.join(latex_dir, f"{base_name}.pdf")
 
     # Resolve form data from our model (supports .form_data_json or .form_data)
     form_data_raw = None
@@ -79,85 +229,204 @@ def generate_request_pdf(request: Request, signature_paths: List[str]) -> str:
         form_data = {}
 
     # Submitter and date
-    submitter_name = _latex_escape(getattr(getattr(request, "requester", None), "name", "Unknown"))
     submitted_at = getattr(request, "submitted_at", None)
     submitted_date = submitted_at.strftime("%Y-%m-%d %H:%M UTC") if isinstance(submitted_at, datetime) and submitted_at else datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
 
-    # Prepare relative signature paths from latex_dir
-    rel_sigs: List[str] = []
-    for p in signature_paths or []:
-        if not p:
-            continue
-        abs_p = p
-        if not os.path.isabs(abs_p):
-            abs_p = os.path.join(repo_root, p)
-        if os.path.exists(abs_p):
-            rel = os.path.relpath(abs_p, latex_dir)
-            rel_sigs.append(rel)
-
-    # Write Makefile if missing
-    makefile_path = os.path.join(latex_dir, "Makefile")
-    if not os.path.exists(makefile_path):
-        makefile_contents = (
-            "PDFLATEX=pdflatex\n"
-            ".SUFFIXES: .tex .pdf\n"
-            "%.pdf: %.tex\n\t$(PDFLATEX) -interaction=nonstopmode -halt-on-error $< > build.log 2>&1\n"
-            "\nclean:\n\trm -f *.aux *.log *.out *.toc build.log\n"
-        )
-        with open(makefile_path, "w", encoding="utf-8") as mf:
-            mf.write(makefile_contents)
-
-    # Compose LaTeX document
-    fields_block = _render_form_fields(form_data)
-    signatures_block = "\n".join(
-        [f"\\includegraphics[width=0.35\\textwidth]{{{_latex_escape(sig)}}}" for sig in rel_sigs]
-    ) if rel_sigs else "\\emph{No signatures provided}"
-
-    latex = f"""\\documentclass[11pt]{{article}}
-\\usepackage[margin=1in]{{geometry}}
-\\usepackage{{graphicx}}
-\\usepackage{{hyperref}}
-\\usepackage[T1]{{fontenc}}
-\\usepackage[utf8]{{inputenc}}
-\\title{{{_latex_escape(form_type.replace('_', ' '))} Request}}
-\\date{{{_latex_escape(submitted_date)}}}
-\\begin{{document}}
-\\maketitle
-\\section*{{Submitter}}
-\\textbf{{Name}}: {submitter_name} \\\\
-\\section*{{Form Data}}
-{fields_block}
-\\section*{{Signatures}}
-{signatures_block}
-\\end{{document}}
-"""
+    return {
+        "form_type": form_type,
+        "base_name": f"{form_type}_{req_id}{suffix}",
+        "form_data": form_data,
+        "submitter_name": getattr(getattr(request, "requester", None), "name", "Unknown"),
+        "submitted_date": submitted_date,
+    }
+
+
+class PdfBackend:
+    """Turns a Request plus signature images into a PDF under latex_templates/."""
+
+    name = ""
+
+    def render(self, request: Request, signature_paths: List[str], suffix: str = "") -> str:
+        """Return the project-root-relative path of the generated PDF (<FORM>_<id><suffix>.pdf)."""
+        raise NotImplementedError
+
+
+class LatexBackend(PdfBackend):
+    """Renders the form's .tex template and compiles it with make/pdflatex."""
+
+    name = "latex"
+
+    def render(self, request: Request, signature_paths: List[str], suffix: str = "") -> str:
+        """
+        Generate a PDF for a Request using LaTeX and Makefile integration.
+
+        Each compile runs in its own scratch directory under latex_templates/.build
+        and the finished PDF is atomically moved into latex_templates/.
+
+        Raises RuntimeError if LaTeX compilation fails.
+        """
+        # Determine repo root and latex dir
+        repo_root = _repo_root()
+        latex_dir = os.path.join(repo_root, "latex_templates")
+        build_root = os.path.join(latex_dir, ".build")
+        _ensure_dir(build_root)
+
+        ctx = _request_context(request, suffix)
+        form_type, base_name, form_data = ctx["form_type"], ctx["base_name"], ctx["form_data"]
+        pdf_path = os.path.join(latex_dir, f"{base_name}.pdf")
+
+        # Prepare relative signature paths from a build directory. Every scratch dir
+        # sits at the same depth under build_root, so the paths (and the cache key)
+        # are identical for every render.
+        rel_sigs: List[str] = []
+        abs_sigs: List[str] = []
+        for p in signature_paths or []:
+            if not p:
+                continue
+            abs_p = p
+            if not os.path.isabs(abs_p):
+                abs_p = os.path.join(repo_root, p)
+            if os.path.exists(abs_p):
+                rel = os.path.relpath(abs_p, os.path.join(build_root, "scratch"))
+                rel_sigs.append(rel)
+                abs_sigs.append(abs_p)
+
+        # Compose LaTeX document from the form's registered template (or the generic one)
+        signatures_block = "\n".join(
+            [f"\\includegraphics[width=0.35\\textwidth]{{{_latex_escape(sig)}}}" for sig in rel_sigs]
+        ) if rel_sigs else "\\emph{No signatures provided}"
+
+        context: Dict[str, Any] = dict(form_data)
+        context.update({
+            "title": form_type.replace("_", " "),
+            "submitted_date": ctx["submitted_date"],
+            "submitter_name": ctx["submitter_name"],
+            "fields_block": LatexRaw(_render_form_fields(form_data)),
+            "signatures_block": LatexRaw(signatures_block),
+        })
+        template_path = getattr(getattr(request, "form_template", None), "latex_template_path", None)
+        render = template_engine.get(template_path) or _render_default
+        latex = render(context)
+
+        # Same source + same signature images => same PDF; skip the compile
+        cache = get_render_cache(latex_dir)
+        cache_key = render_cache_key(latex, abs_sigs)
+        if RENDER_CACHE_ENABLED and cache.fetch(cache_key, pdf_path):
+            return os.path.relpath(pdf_path, repo_root)
+
+        compile_latex(latex, base_name, pdf_path)
+        if RENDER_CACHE_ENABLED:
+            cache.put(cache_key, pdf_path)
+
+        # Return project-root-relative path as specified
+        return os.path.relpath(pdf_path, repo_root)
+
+
+class DirectPdfBackend(PdfBackend):
+    """Writes the PDF in-process: no template, no subprocess. Meant for simple forms."""
+
+    name = "direct"
+
+    def render(self, request: Request, signature_paths: List[str], suffix: str = "") -> str:
+        repo_root = _repo_root()
+        latex_dir = os.path.join(repo_root, "latex_templates")
+        _ensure_dir(latex_dir)
+        ctx = _request_context(request, suffix)
+        pdf_path = os.path.join(latex_dir, f"{ctx['base_name']}.pdf")
+
+        doc = SimplePdf()
+        doc.text(f"{ctx['form_type'].replace('_', ' ')} Request", size=18, bold=True)
+        doc.text(ctx["submitted_date"], size=10)
+        doc.space(12)
+        doc.text("Submitter", size=13, bold=True)
+        doc.text(f"Name: {ctx['submitter_name']}")
+        doc.space(8)
+        doc.text("Form Data", size=13, bold=True)
+        for k, v in ctx["form_data"].items():
+            val = ", ".join(str(x) for x in v) if isinstance(v, list) else (
+                json.dumps(v) if isinstance(v, dict) else str(v))
+            doc.text(f"{k}: {val}", indent=12)
+        doc.space(8)
+        doc.text("Signatures", size=13, bold=True)
+        placed = 0
+        for p in signature_paths or []:
+            if not p:
+                continue
+            abs_p = p if os.path.isabs(p) else os.path.join(repo_root, p)
+            if os.path.exists(abs_p) and doc.image(abs_p, width=0.35 * (PAGE_W - 2 * MARGIN)):
+                placed += 1
+        if not placed:
+            doc.text("No signatures provided")
+
+        fd, tmp = tempfile.mkstemp(dir=latex_dir, prefix=".direct.", suffix=".pdf")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(doc.tobytes())
+        os.replace(tmp, pdf_path)
+        return os.path.relpath(pdf_path, repo_root)
+
+
+PDF_BACKENDS: Dict[str, PdfBackend] = {b.name: b for b in (LatexBackend(), DirectPdfBackend())}
+
+
+def get_pdf_backend(form_template: Any) -> PdfBackend:
+    """Backend configured on the FormTemplate (pdf_backend column), defaulting to LaTeX."""
+    name = getattr(form_template, "pdf_backend", None) or "latex"
+    return PDF_BACKENDS.get(name, PDF_BACKENDS["latex"])
+
+
+def generate_request_pdf(request: Request, signature_paths: List[str],
+                         backend: Optional[str] = None, suffix: str = "") -> str:
+    """
+    Generate a PDF for a Request with the backend its FormTemplate selects
+    (or the one named by `backend`). `suffix` is appended to the file name.
+
+    Returns project-root-relative path to the generated PDF.
+    Raises RuntimeError if rendering fails, and UnencodableTextError if the
+    named backend is 'direct' and the request has text its font cannot draw
+    (a form configured for 'direct' falls back to LaTeX instead).
+    """
+    if backend:
+        return PDF_BACKENDS[backend].render(request, signature_paths, suffix)
+    renderer = get_pdf_backend(getattr(request, "form_template", None))
+    try:
+        return renderer.render(request, signature_paths, suffix)
+    except UnencodableTextError:
+        if renderer is PDF_BACKENDS["latex"]:
+            raise
+        return PDF_BACKENDS["latex"].render(request, signature_paths, suffix)
+
+
+def stamp_step_pdf(request: Request, prev_pdf_path: str, step: Any,
+                   signature_path: Optional[str]) -> str:
+    """
+    Append `step`'s approval page (caption + signature) to prev_pdf_path,
+    writing <FORM>_<id>_step<sequence>_<step id>.pdf (steps of a parallel
+    stage share a sequence, so the step id keeps their files apart). Only
+    the newest revision of prev_pdf_path is parsed, however many steps came
+    before; what remains is the OS copying its bytes into the step's file.
+
+    Returns project-root-relative path to the stamped PDF.
+    """
+    repo_root = _repo_root()
+    latex_dir = os.path.join(repo_root, "latex_templates")
+    _ensure_dir(latex_dir)
+    ctx = _request_context(request, f"_step{step.sequence}_{step.id}")
+    pdf_path = os.path.join(latex_dir, f"{ctx['base_name']}.pdf")
+    src = prev_pdf_path if os.path.isabs(prev_pdf_path) else os.path.join(repo_root, prev_pdf_path)
+    sig = None
+    if signature_path:
+        sig = signature_path if os.path.isabs(signature_path) else os.path.join(repo_root, signature_path)
+        if not os.path.exists(sig):
+            sig = None
 
-    with open(tex_path, "w", encoding="utf-8") as f:
-        f.write(latex)
-
-    # Run make to build PDF
-    result = subprocess.run([
-        "make", "-C", latex_dir, f"{base_name}.pdf"
-    ], capture_output=True, text=True)
-
-    if result.returncode != 0 or not os.path.exists(pdf_path):
-        stderr = result.stderr or ""
-        stdout = result.stdout or ""
-        # Try to read build.log if present for better error output
-        build_log = os.path.join(latex_dir, "build.log")
-        log_content = ""
-        if os.path.exists(build_log):
-            try:
-                with open(build_log, "r", encoding="utf-8", errors="ignore") as lf:
-                    log_content = lf.read()
-            except Exception:
-                pass
-        raise RuntimeError(
-            "LaTeX compilation failed.\n"
-            f"stdout:\n{stdout}\n"
-            f"stderr:\n{stderr}\n"
-            f"build.log:\n{log_content}\n"
-        )
-
-    # Return project-root-relative path as specified
+    approver = getattr(getattr(step, "approver", None), "name", None) or "Approver"
+    actioned_at = getattr(step, "actioned_at", None) or datetime.utcnow()
+    caption = [f"Approved - step {step.sequence}",
+               f"Approver: {approver}",
+               f"Date: {actioned_at.strftime('%Y-%m-%d %H:%M UTC')}"]
+    if getattr(step, "comments", None):
+        caption.append(f"Comments: {step.comments}")
+    if not sig:
+        caption.append("No signature provided")
+    stamp_signature_page(src, pdf_path, sig, caption)
     return os.path.relpath(pdf_path, repo_root)
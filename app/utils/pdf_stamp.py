@@ -0,0 +1,265 @@
+# app/utils/pdf_stamp.py
+"""
+Append an approval page to an existing PDF with an incremental update.
+
+The original bytes are copied untouched (by the OS, shutil.copyfile) and a new
+revision (image, content stream, page, page tree root, catalog, xref,
+trailer) is appended to the copy, so nothing already in the document is
+re-rendered or even read. The source is memory-mapped and xref sections are
+read newest first, only until the objects a stamp needs are found: a stamp
+re-issues the catalog and page tree root in its own section, so stamping a
+stamped PDF parses one xref section however many stamps came before.
+"""
+import mmap
+import os
+import re
+import shutil
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.pdf_direct import MARGIN, PAGE_H, PAGE_W, _load_image, _pdf_string, _png_unfilter, _wrap
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_REF_RE = r"/%s\s+(\d+)\s+(\d+)\s+R"
+
+
+def _dict_int(d: bytes, key: str) -> Optional[int]:
+    m = re.search(rb"/" + key.encode() + rb"\s+(\d+)", d)
+    return int(m.group(1)) if m else None
+
+
+def _dict_ref(d: bytes, key: str) -> Optional[int]:
+    m = re.search((_REF_RE % key).encode(), d)
+    return int(m.group(1)) if m else None
+
+
+class PdfReader:
+    """
+    Just enough of a PDF parser to find objects via xref tables or xref streams.
+    `data` is bytes or an mmap; xref sections are read lazily, newest first.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offsets: Dict[int, Tuple[int, int, int]] = {}  # num -> (type, a, b)
+        self._objstm_cache: Dict[int, Dict[int, bytes]] = {}
+        matches = list(_STARTXREF_RE.finditer(data[-2048:]))
+        if not matches:
+            raise ValueError("startxref not found")
+        self.startxref = int(matches[-1].group(1))
+        self._next_xref: Optional[int] = self.startxref
+        self._seen = set()
+        self.trailer: bytes = b""
+        self._read_next_xref()
+
+    def _index(self, sub: bytes, start: int) -> int:
+        pos = self.data.find(sub, start)
+        if pos < 0:
+            raise ValueError(f"{sub!r} not found after offset {start}")
+        return pos
+
+    def _read_next_xref(self) -> bool:
+        """Read the next older xref section; False once the /Prev chain is exhausted."""
+        offset = self._next_xref
+        if offset is None or offset in self._seen:
+            return False
+        self._seen.add(offset)
+        if self.data[offset:offset + 4] == b"xref":
+            trailer, prev = self._read_xref_table(offset)
+        else:
+            trailer, prev = self._read_xref_stream(offset)
+        if not self.trailer:
+            self.trailer = trailer
+        self._next_xref = prev
+        return True
+
+    def entry(self, num: int) -> Tuple[int, int, int]:
+        """(type, a, b) xref entry of object `num`, reading older sections only if needed."""
+        while num not in self.offsets:
+            if not self._read_next_xref():
+                raise KeyError(num)
+        return self.offsets[num]
+
+    def size(self) -> int:
+        """One past the highest object number in use."""
+        size = _dict_int(self.trailer, "Size")
+        if size is None:
+            while self._read_next_xref():
+                pass
+            size = max(self.offsets) + 1
+        return size
+
+    def _read_xref_table(self, offset: int):
+        end = self._index(b"trailer", offset)
+        lines = self.data[offset + 4:end].split(b"\n")
+        i = 0
+        tokens = b" ".join(lines).split()
+        while i < len(tokens):
+            start, count = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for n in range(count):
+                off, gen, kind = tokens[i:i + 3]
+                i += 3
+                num = start + n
+                if kind == b"n" and num not in self.offsets:
+                    self.offsets[num] = (1, int(off), int(gen))
+        tr_start = self._index(b"<<", end)
+        tr_end = self._index(b"startxref", tr_start)
+        trailer = self.data[tr_start:tr_end]
+        return trailer, _dict_int(trailer, "Prev")
+
+    def _read_xref_stream(self, offset: int):
+        d, raw = self._stream_at(offset)
+        w = [int(x) for x in re.search(rb"/W\s*\[([\d\s]+)\]", d).group(1).split()]
+        size = _dict_int(d, "Size")
+        idx = re.search(rb"/Index\s*\[([\d\s]+)\]", d)
+        ranges = [int(x) for x in idx.group(1).split()] if idx else [0, size]
+        pos = 0
+        for r in range(0, len(ranges), 2):
+            start, count = ranges[r], ranges[r + 1]
+            for n in range(count):
+                fields = []
+                for width in w:
+                    fields.append(int.from_bytes(raw[pos:pos + width], "big") if width else 1)
+                    pos += width
+                num = start + n
+                if num not in self.offsets and fields[0] in (1, 2):
+                    self.offsets[num] = (fields[0], fields[1], fields[2])
+        return d, _dict_int(d, "Prev")
+
+    def _stream_at(self, offset: int) -> Tuple[bytes, bytes]:
+        """(dictionary, decoded stream bytes) for the stream object starting at offset."""
+        start = self._index(b"<<", offset)
+        s = self._index(b"stream", start)
+        d = self.data[start:s]
+        length = _dict_int(d, "Length")
+        if length is None:
+            length_ref = _dict_ref(d, "Length")
+            length = int(self.raw_object(length_ref).strip())
+        body_start = s + 6
+        if self.data[body_start:body_start + 2] == b"\r\n":
+            body_start += 2
+        elif self.data[body_start:body_start + 1] in (b"\n", b"\r"):
+            body_start += 1
+        raw = self.data[body_start:body_start + length]
+        if b"/FlateDecode" in d:
+            raw = zlib.decompress(raw)
+            predictor = _dict_int(d, "Predictor")
+            if predictor and predictor >= 10:
+                cols = _dict_int(d, "Columns") or 1
+                rows = len(raw) // (cols + 1)
+                raw = bytes(_png_unfilter(raw, cols, rows, 1))
+        return d, raw
+
+    def raw_object(self, num: int) -> bytes:
+        """Body of object `num` (between 'obj' and 'endobj', or its slot in an object stream)."""
+        kind, a, b = self.entry(num)
+        if kind == 1:
+            start = self._index(b"obj", a) + 3
+            end = self._index(b"endobj", start)
+            return self.data[start:end]
+        objs = self._objstm_cache.get(a)
+        if objs is None:
+            d, raw = self._stream_at(self.entry(a)[1])
+            n, first = _dict_int(d, "N"), _dict_int(d, "First")
+            header = [int(x) for x in raw[:first].split()]
+            objs = {}
+            for i in range(n):
+                onum, off = header[2 * i], header[2 * i + 1]
+                nxt = header[2 * i + 3] if i + 1 < n else len(raw) - first
+                objs[onum] = raw[first + off:first + nxt]
+            self._objstm_cache[a] = objs
+        return objs[num]
+
+
+def stamp_signature_page(src_pdf: str, dest_pdf: str, image_path: Optional[str],
+                         caption_lines: List[str]) -> str:
+    """
+    Copy src_pdf to dest_pdf and append a page carrying the caption and signature
+    image. Parses only the xref sections holding the catalog and page tree
+    root, so earlier stamps cost nothing; the byte copy is left to the OS.
+    """
+    with open(src_pdf, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        revision = _stamp_revision(reader, image_path, caption_lines, len(data), data[-1:] == b"\n")
+
+    tmp = f"{dest_pdf}.{os.getpid()}.{threading.get_ident()}.tmp"  # render workers are threads
+    shutil.copyfile(src_pdf, tmp)
+    with open(tmp, "ab") as fh:
+        fh.write(revision)
+    os.replace(tmp, dest_pdf)
+    return dest_pdf
+
+
+def _stamp_revision(reader: PdfReader, image_path: Optional[str], caption_lines: List[str],
+                    src_len: int, ends_with_newline: bool) -> bytes:
+    """The incremental update (objects, xref, trailer) to append to a PDF of src_len bytes."""
+    root_num = _dict_ref(reader.trailer, "Root")
+    catalog = reader.raw_object(root_num)
+    old_pages = _dict_ref(catalog, "Pages")
+    old_count = _dict_int(reader.raw_object(old_pages), "Count") or 0
+    next_num = reader.size()
+
+    objects: List[Tuple[int, bytes]] = []
+
+    def add(body: bytes) -> int:
+        nonlocal next_num
+        num = next_num
+        next_num += 1
+        objects.append((num, body))
+        return num
+
+    ops: List[bytes] = []
+    y = PAGE_H - MARGIN
+    for i, line in enumerate(caption_lines):
+        size = 14 if i == 0 else 11
+        for part in _wrap(line, size, PAGE_W - 2 * MARGIN):
+            y -= size * 1.4
+            ops.append(b"BT /F1 %g Tf %g %g Td " % (size, MARGIN, y) + _pdf_string(part) + b" Tj ET")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    xobjects = b""
+    img = _load_image(image_path) if image_path else None
+    if img:
+        width = 0.35 * (PAGE_W - 2 * MARGIN)
+        height = width * img["h"] / img["w"]
+        y -= height + 12
+        im = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d " % (img["w"], img["h"])
+                 + img["dict"].encode("ascii")
+                 + b" /Length %d >>\nstream\n" % len(img["data"]) + img["data"] + b"\nendstream")
+        ops.append(b"q %g 0 0 %g %g %g cm /Sig Do Q" % (width, height, MARGIN, y))
+        xobjects = b" /XObject << /Sig %d 0 R >>" % im
+    content = zlib.compress(b"\n".join(ops))
+    content_id = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    # New page tree root over [old tree, new page]; the catalog and old root are re-issued
+    new_pages = next_num + 1
+    page = add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R >>"
+               % (new_pages, PAGE_W, PAGE_H, font) + xobjects + b" >> /Contents %d 0 R >>" % content_id)
+    add(b"<< /Type /Pages /Kids [%d 0 R %d 0 R] /Count %d >>" % (old_pages, page, old_count + 1))
+    old_root_body = re.sub(rb"/Parent\s+\d+\s+\d+\s+R", b"", reader.raw_object(old_pages).strip(), count=1)
+    objects.append((old_pages, old_root_body[:2] + b" /Parent %d 0 R" % new_pages + old_root_body[2:]))
+    objects.append((root_num, re.sub((_REF_RE % "Pages").encode(), b"/Pages %d 0 R" % new_pages,
+                                     catalog.strip(), count=1)))
+
+    out = bytearray(b"" if ends_with_newline else b"\n")
+    offsets = {}
+    for num, body in objects:
+        offsets[num] = src_len + len(out)
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = src_len + len(out)
+    out += b"xref\n"
+    nums = sorted(offsets)
+    run_start = 0
+    for i in range(1, len(nums) + 1):
+        if i == len(nums) or nums[i] != nums[i - 1] + 1:
+            out += b"%d %d\n" % (nums[run_start], i - run_start)
+            for num in nums[run_start:i]:
+                out += b"%010d 00000 n \n" % offsets[num]
+            run_start = i
+    trailer = b"<< /Size %d /Root %d 0 R /Prev %d" % (next_num, root_num, reader.startxref)
+    id_match = re.search(rb"/ID\s*\[[^\]]*\]", reader.trailer)
+    if id_match:
+        trailer += b" " + id_match.group(0)
+    out += b"trailer\n" + trailer + b" >>\nstartxref\n%d\n%%%%EOF\n" % xref
+    return bytes(out)
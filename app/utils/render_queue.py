@@ -0,0 +1,253 @@
+# app/utils/render_queue.py
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.models import db, Request, ApprovalStep, PdfRenderJob, Signature
+from app.utils.pdf_direct import UnencodableTextError
+from app.utils.pdf_generator import generate_request_pdf, stamp_step_pdf
+
+def signature_paths_for_step(req_obj: Request, step: ApprovalStep) -> List[str]:
+    """Signature images of every approved step plus `step`, in approval order."""
+    approver_ids = [s.approver_id for s in sorted(req_obj.approval_steps, key=lambda x: x.order_key)
+                    if s.status == "approved" or s.id == step.id]
+    if not approver_ids:
+        return []
+    sigs = {sig.user_id: sig.image_path
+            for sig in Signature.query.filter(Signature.user_id.in_(approver_ids)).all()}
+    return [sigs[uid] for uid in approver_ids if sigs.get(uid)]
+
+
+def enqueue_step_render(step: ApprovalStep, signature_paths: List[str]) -> PdfRenderJob:
+    """
+    Queue a PDF render for an approval step: a stamp onto the previous PDF,
+    or a full render when PDF_INCREMENTAL_STAMPING is off.
+
+    The job is added to the current session; the caller commits it together
+    with the step change so the two land atomically.
+    """
+    job = PdfRenderJob(request_id=step.request_id, step_id=step.id,
+                       kind="stamp" if current_app.config["PDF_INCREMENTAL_STAMPING"] else "full",
+                       status="queued", signature_paths=list(signature_paths or []))
+    db.session.add(job)
+    step.pdf_status = "rendering"
+    return job
+
+
+def enqueue_base_render(req_obj: Request) -> Optional[PdfRenderJob]:
+    """
+    Queue the unsigned base PDF that approval steps are stamped onto (req_obj
+    must have an id). Nothing is queued when PDF_INCREMENTAL_STAMPING is off.
+    """
+    req_obj.base_pdf_path = None
+    if not current_app.config["PDF_INCREMENTAL_STAMPING"]:
+        return None
+    job = PdfRenderJob(request_id=req_obj.id, step_id=None, kind="base",
+                       status="queued", signature_paths=[])
+    db.session.add(job)
+    return job
+
+
+def _claim_next_job() -> Optional[int]:
+    """Atomically move the oldest queued job to 'rendering' and return its id."""
+    while True:
+        job_id = (db.session.query(PdfRenderJob.id)
+                  .filter(PdfRenderJob.status == "queued")
+                  .order_by(PdfRenderJob.id)
+                  .limit(1)
+                  .scalar())
+        if job_id is None:
+            return None
+        claimed = (PdfRenderJob.query
+                   .filter(PdfRenderJob.id == job_id, PdfRenderJob.status == "queued")
+                   .update({"status": "rendering",
+                            "started_at": datetime.utcnow(),
+                            "attempts": PdfRenderJob.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed:
+            return job_id
+        # another worker took it first; try the next one
+
+
+def _stamp_source(req_obj: Request, step: ApprovalStep) -> Optional[str]:
+    """
+    PDF the step's signature page should be appended to: the PDF of the
+    approval just before it (an earlier stage, or a parallel sibling that
+    approved first), or the base PDF for the first approval. None when that
+    PDF is not ready, in which case the caller does a full render.
+    """
+    earlier = [s for s in req_obj.approval_steps
+               if s.status == "approved" and s.id != step.id and s.order_key < step.order_key]
+    if earlier:
+        prev = max(earlier, key=lambda s: s.order_key)
+        if prev.pdf_status in (None, "rendered") and prev.signed_pdf_path:
+            return prev.signed_pdf_path
+        return None
+    return req_obj.base_pdf_path
+
+
+def _render(job: PdfRenderJob, req_obj: Request, step: Optional[ApprovalStep]) -> str:
+    if job.kind == "base":
+        return generate_request_pdf(req_obj, [], suffix="_base")
+    if job.kind == "stamp":
+        source = _stamp_source(req_obj, step)
+        if source:
+            repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+            if os.path.exists(os.path.join(repo_root, source)):
+                sig = Signature.query.filter_by(user_id=step.approver_id).first()
+                try:
+                    return stamp_step_pdf(req_obj, source, step, sig.image_path if sig else None)
+                except UnencodableTextError:
+                    pass  # e.g. an approver name outside WinAnsi: the full render can draw it
+    return generate_request_pdf(req_obj, job.signature_paths or [])
+
+
+def _run_job(job_id: int) -> None:
+    job = db.session.get(PdfRenderJob, job_id)
+    step = db.session.get(ApprovalStep, job.step_id) if job and job.step_id else None
+    req_obj = db.session.get(Request, job.request_id) if job else None
+    if not job or not req_obj or (job.kind != "base" and not step):
+        if job:
+            job.status = "failed"
+            job.error = "Request or approval step no longer exists"
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        return
+
+    try:
+        pdf_rel_path = _render(job, req_obj, step)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(PdfRenderJob, job_id)
+        step = db.session.get(ApprovalStep, job.step_id) if job.step_id else None
+        job.status = "failed"
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        if step and step.status == "approved":
+            step.pdf_status = "failed"
+        db.session.commit()
+        return
+
+    job.status = "rendered"
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    if job.kind == "base":
+        newer = (db.session.query(PdfRenderJob.id)
+                 .filter(PdfRenderJob.request_id == req_obj.id, PdfRenderJob.kind == "base",
+                         PdfRenderJob.id > job.id)
+                 .first())
+        if not newer:
+            req_obj.base_pdf_path = pdf_rel_path
+        db.session.commit()
+        return
+
+    # A newer job for the same step (e.g. re-approval after a return) wins,
+    # and a step that was reset by a return no longer wants this PDF
+    newer = (db.session.query(PdfRenderJob.id)
+             .filter(PdfRenderJob.step_id == step.id, PdfRenderJob.id > job.id)
+             .first())
+    if not newer and step.status == "approved":
+        step.signed_pdf_path = pdf_rel_path
+        step.pdf_status = "rendered"
+    db.session.commit()
+
+
+def drain_render_queue(max_jobs: Optional[int] = None) -> int:
+    """Render queued jobs in the current app context. Returns the number processed."""
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job_id = _claim_next_job()
+        if job_id is None:
+            break
+        _run_job(job_id)
+        done += 1
+    return done
+
+
+def requeue_stale_jobs(older_than: float = 600.0) -> int:
+    """
+    Put jobs left in 'rendering' by a crashed process back on the queue.
+    Only jobs started more than `older_than` seconds ago count as stale:
+    every process runs this at startup, and a younger job may still be
+    rendering in another live process.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    count = (PdfRenderJob.query
+             .filter(PdfRenderJob.status == "rendering",
+                     or_(PdfRenderJob.started_at.is_(None), PdfRenderJob.started_at < cutoff))
+             .update({"status": "queued", "started_at": None}, synchronize_session=False))
+    db.session.commit()
+    return count
+
+
+class RenderWorkerPool:
+    """Background threads that drain the pdf_render_jobs table."""
+
+    def __init__(self, app, workers: int = 2, poll_interval: float = 2.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()  # a stopped pool can be started again
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"pdf-render-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def notify(self) -> None:
+        """Wake idle workers after a job was committed."""
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    processed = drain_render_queue()
+                except Exception:
+                    self.app.logger.exception("PDF render worker failed")
+                    db.session.rollback()
+                    processed = 0
+                finally:
+                    db.session.remove()
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+def init_render_queue(app, start: bool = True) -> Optional[RenderWorkerPool]:
+    """Set up (and unless start=False, start) the worker pool configured by RENDER_WORKERS (0 disables it)."""
+    workers = int(app.config.get("RENDER_WORKERS", 2))
+    with app.app_context():
+        requeue_stale_jobs(float(app.config.get("RENDER_JOB_TIMEOUT", 600)))
+    if workers <= 0:
+        return None
+    pool = RenderWorkerPool(app, workers=workers,
+                            poll_interval=float(app.config.get("RENDER_POLL_INTERVAL", 2.0)))
+    if start:
+        pool.start()
+    app.extensions["render_queue"] = pool
+    return pool
+
+
+def notify_render_workers(app) -> None:
+    pool = app.extensions.get("render_queue")
+    if pool:
+        pool.notify()
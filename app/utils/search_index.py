@@ -0,0 +1,184 @@
+# app/utils/search_index.py
+"""
+Full-text search over requests, backed by an SQLite FTS5 table.
+
+One row per request (rowid = request id) holding the requester, the form name
+and every value from form_data_json. Routes that write a request call
+index_request() before committing so the row lands in the same transaction.
+Databases without FTS5 fall back to a LIKE scan over the same columns.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import String, cast, column, func, literal_column, or_, table, text
+from sqlalchemy.orm import aliased, joinedload
+
+from app.models import db, Request, ApprovalStep, FormTemplate, User
+
+FTS_TABLE = "request_search"
+SEARCH_PAGE_SIZE = 25
+
+search_table = table(FTS_TABLE, column("rowid"), column("requester"), column("form_name"), column("body"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_available(conn) -> bool:
+    """True if the connection is SQLite with the request_search table present."""
+    if conn.dialect.name != "sqlite":
+        return False
+    row = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"),
+                       {"n": FTS_TABLE}).first()
+    return row is not None
+
+
+def create_fts_table(conn) -> bool:
+    """Create the FTS5 table; returns False when SQLite was built without FTS5."""
+    if conn.dialect.name != "sqlite":
+        return False
+    options = [r[0] for r in conn.execute(text("PRAGMA compile_options"))]
+    if "ENABLE_FTS5" not in options:
+        return False
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "requester, form_name, body, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    return True
+
+
+def _flatten(value: Any) -> Iterable[str]:
+    if value is None:
+        return
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _flatten(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _flatten(v)
+    else:
+        s = str(value).strip()
+        if s:
+            yield s
+
+
+def document_for(req_obj: Request) -> Dict[str, str]:
+    """The searchable text for a request."""
+    return {
+        "requester": (req_obj.requester.name or "") + " " + (req_obj.requester.email or "")
+        if req_obj.requester else "",
+        "form_name": req_obj.form_template.name if req_obj.form_template else "",
+        "body": "\n".join(_flatten(req_obj.form_data_json)),
+    }
+
+
+def _upsert(conn, request_id: int, doc: Dict[str, str]) -> None:
+    conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": request_id})
+    conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, requester, form_name, body) "
+                      "VALUES (:id, :requester, :form_name, :body)"), {"id": request_id, **doc})
+
+
+def index_request(req_obj: Request) -> None:
+    """(Re)index one request inside the current session's transaction; req_obj must have an id."""
+    conn = db.session.connection()
+    if fts_available(conn):
+        _upsert(conn, req_obj.id, document_for(req_obj))
+
+
+def remove_requests(request_ids: Iterable[int]) -> None:
+    """Drop deleted requests from the index inside the current session's transaction."""
+    request_ids = list(request_ids)
+    conn = db.session.connection()
+    if request_ids and fts_available(conn):
+        conn.execute(search_table.delete().where(search_table.c.rowid.in_(request_ids)))
+
+
+def rebuild_index(conn, batch_size: int = 500) -> int:
+    """Drop and repopulate every row from the requests table; returns how many were indexed."""
+    if not fts_available(conn):
+        return 0
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    requester = User.__table__
+    forms = FormTemplate.__table__
+    reqs = Request.__table__
+    rows = conn.execute(
+        reqs.select()
+        .with_only_columns(reqs.c.id, reqs.c.form_data_json, requester.c.name, requester.c.email, forms.c.name)
+        .select_from(reqs.outerjoin(requester, reqs.c.requester_id == requester.c.id)
+                         .outerjoin(forms, reqs.c.form_template_id == forms.c.id))
+        .order_by(reqs.c.id)
+        .execution_options(yield_per=batch_size))
+    count = 0
+    for req_id, form_data, name, email, form_name in rows:
+        _upsert(conn, req_id, {"requester": f"{name or ''} {email or ''}".strip(),
+                               "form_name": form_name or "",
+                               "body": "\n".join(_flatten(form_data))})
+        count += 1
+    return count
+
+
+def fts_query(q: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match,
+    the last one as a prefix. Quoting each term keeps user input from being
+    read as FTS syntax (e.g. '-', ':' or AND/OR).
+    """
+    terms = _TOKEN_RE.findall(q or "")
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _visible_to(query, user: User):
+    """Admins see every request; anyone else only requests they have an approval step on."""
+    if user.role == "admin":
+        return query
+    return query.filter(Request.id.in_(
+        db.session.query(ApprovalStep.request_id).filter(ApprovalStep.approver_id == user.id)))
+
+
+def search_requests(q: str, user: User, page: int = 1,
+                    per_page: int = SEARCH_PAGE_SIZE) -> Tuple[List[Tuple[Request, Optional[str]]], int]:
+    """
+    Ranked search. Returns ([(request, snippet)], total) for one page; the
+    best bm25 matches come first, with the newest request breaking ties.
+    """
+    page = max(page, 1)
+    conn = db.session.connection()
+    match = fts_query(q)
+    if not match:
+        return [], 0
+
+    if fts_available(conn):
+        fts = literal_column(FTS_TABLE)
+        # column weights: requester and form name count double against the form body
+        rank = func.bm25(fts, 2.0, 2.0, 1.0).label("rank")
+        snippet = func.snippet(fts, 2, "[", "]", "…", 12).label("snippet")
+        hits = (db.session.query(Request, rank, snippet)
+                .join(search_table, search_table.c.rowid == Request.id)
+                .filter(fts.op("MATCH")(match)))
+        hits = _visible_to(hits, user)
+        total = hits.order_by(None).count()
+        rows = (hits.options(joinedload(Request.requester), joinedload(Request.form_template),
+                             joinedload(Request.current_approver))
+                .order_by(rank, Request.id.desc())
+                .offset((page - 1) * per_page).limit(per_page).all())
+        return [(r, snip) for r, _rank, snip in rows], total
+
+    # No FTS5: substring match on each term, newest first
+    requester = aliased(User)
+    hits = (Request.query
+            .join(requester, Request.requester_id == requester.id)
+            .join(FormTemplate, Request.form_template_id == FormTemplate.id))
+    for term in _TOKEN_RE.findall(q):
+        pattern = "%" + term.lower().replace("_", "\\_") + "%"
+        hits = hits.filter(or_(func.lower(cast(Request.form_data_json, String)).like(pattern, escape="\\"),
+                               func.lower(requester.name).like(pattern, escape="\\"),
+                               func.lower(FormTemplate.name).like(pattern, escape="\\")))
+    hits = _visible_to(hits, user)
+    total = hits.order_by(None).count()
+    rows = (hits.options(joinedload(Request.requester), joinedload(Request.form_template),
+                             joinedload(Request.current_approver))
+            .order_by(Request.id.desc()).offset((page - 1) * per_page).limit(per_page).all())
+    return [(r, None) for r in rows], total
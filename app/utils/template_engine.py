@@ -0,0 +1,111 @@
+# app/utils/template_engine.py
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Placeholders look like <<field_name>> so they never clash with LaTeX braces
+PLACEHOLDER_RE = re.compile(r"<<\s*([A-Za-z_][A-Za-z0-9_]*)\s*>>")
+
+RenderFn = Callable[[Dict[str, Any]], str]
+
+
+class LatexRaw(str):
+    """A context value that is already LaTeX and must not be escaped."""
+
+
+def latex_escape(s: str) -> str:
+    # Minimal LaTeX escaping
+    replacements = {
+        "\\": r"\textbackslash{}",
+        "{": r"\{",
+        "}": r"\}",
+        "#": r"\#",
+        "$": r"\$",
+        "%": r"\%",
+        "&": r"\&",
+        "_": r"\_",
+        "~": r"\textasciitilde{}",
+        "^": r"\textasciicircum{}",
+    }
+    out = []
+    for ch in s:
+        out.append(replacements.get(ch, ch))
+    return "".join(out)
+
+
+def _format_value(v: Any) -> str:
+    if isinstance(v, LatexRaw):
+        return v
+    if v is None:
+        return ""
+    if isinstance(v, list):
+        return latex_escape(", ".join(str(x) for x in v))
+    if isinstance(v, dict):
+        return latex_escape(json.dumps(v))
+    return latex_escape(str(v))
+
+
+def compile_template(source: str) -> RenderFn:
+    """
+    Parse a .tex template once into a render function.
+
+    The source is split into literal chunks and placeholder names up front, so
+    rendering is a single pass over a precomputed list.
+    """
+    parts: List[Tuple[bool, str]] = []  # (is_placeholder, literal text or field name)
+    pos = 0
+    for m in PLACEHOLDER_RE.finditer(source):
+        if m.start() > pos:
+            parts.append((False, source[pos:m.start()]))
+        parts.append((True, m.group(1)))
+        pos = m.end()
+    if pos < len(source):
+        parts.append((False, source[pos:]))
+    compiled = tuple(parts)
+
+    def render(context: Dict[str, Any]) -> str:
+        return "".join(_format_value(context.get(text)) if is_field else text
+                       for is_field, text in compiled)
+
+    render.fields = tuple(text for is_field, text in compiled if is_field)
+    return render
+
+
+class TemplateEngine:
+    """In-memory cache of compiled templates, reloaded when the file's mtime changes."""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._cache: Dict[str, Tuple[float, RenderFn]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, template_path: str) -> str:
+        return template_path if os.path.isabs(template_path) else os.path.join(self.base_dir, template_path)
+
+    def get(self, template_path: Optional[str]) -> Optional[RenderFn]:
+        """Return the compiled template, or None if there is no such file."""
+        if not template_path:
+            return None
+        path = self.resolve(template_path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as fh:
+            render = compile_template(fh.read())
+        with self._lock:
+            self._cache[path] = (mtime, render)
+        return render
+
+    def warm(self, template_paths: Iterable[str]) -> int:
+        """Precompile every template that exists; returns how many were loaded."""
+        return sum(1 for p in template_paths if self.get(p) is not None)
+
+
+_repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+template_engine = TemplateEngine(_repo_root)
@@ -0,0 +1,65 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings for `gunicorn wsgi:app`, read from the environment (.env
+included) so deployments don't edit this file:
+
+    WEB_BIND              address to listen on            (0.0.0.0:5001)
+    WEB_WORKERS           worker processes                (2 x CPUs + 1, at most 8)
+    WEB_THREADS           threads per worker              (4; 1 = sync workers)
+    WEB_KEEPALIVE         seconds to hold an idle keep-alive connection (5)
+    WEB_TIMEOUT           seconds a silent worker may take before it is killed (30)
+    WEB_GRACEFUL_TIMEOUT  seconds to drain in-flight requests on SIGTERM (30)
+    WEB_MAX_REQUESTS      recycle a worker after this many requests (0 = never)
+    WEB_PRELOAD           load the app once in the master before forking (1)
+    WEB_ACCESS_LOG        access log file, '-' for stdout, empty to disable (-)
+
+SIGTERM (or SIGINT) stops accepting connections, lets in-flight requests
+finish within WEB_GRACEFUL_TIMEOUT, then stops each worker's background
+threads. SIGHUP reloads the workers the same way.
+"""
+import os
+
+from dotenv import load_dotenv
+from flask import Flask
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_WORKERS", str(min(2 * (os.cpu_count() or 1) + 1, 8))))
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+# migrations, form template seeding and LaTeX template warm-up run once, shared copy-on-write
+preload_app = os.getenv("WEB_PRELOAD", "1") not in ("0", "false", "no")
+accesslog = os.getenv("WEB_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """In each worker once the app is loaded: drop inherited DB connections, start the background threads."""
+    from app import start_background_workers
+    from app.models import db
+
+    flask_app = getattr(worker, "wsgi", None)
+    if not isinstance(flask_app, Flask):  # the app failed to load; gunicorn serves its error page
+        return
+    with flask_app.app_context():
+        db.engine.dispose(close=False)  # pooled connections opened by the master belong to it
+    start_background_workers(flask_app)
+
+
+def worker_exit(server, worker):
+    """After the worker stopped serving: let background jobs finish within the graceful timeout."""
+    from app import stop_background_workers
+    from app.models import db
+
+    flask_app = getattr(worker, "wsgi", None)
+    if not isinstance(flask_app, Flask):
+        return
+    stop_background_workers(flask_app, timeout=graceful_timeout)
+    with flask_app.app_context():
+        db.engine.dispose()
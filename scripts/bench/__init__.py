@@ -0,0 +1,41 @@
+# scripts/bench/__init__.py
+"""
+Benchmarks against scratch databases, run from the repository root with
+`python -m scripts.bench <name>` (`--help` lists them). They are developer
+tools, not part of the app's `flask` commands.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+import click
+
+from app import create_app
+from app.models import db
+
+
+@click.group()
+def cli():
+    """Benchmarks on scratch databases."""
+
+
+@contextmanager
+def scratch_app(**config):
+    """
+    App on an empty SQLite database in a temporary directory, without
+    background threads. `config` overrides app settings; nothing is read from
+    or written to the process environment beyond what create_app loads.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(start_workers=False, config=dict({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "RENDER_WORKERS": 0,
+            "SESSION_PURGE_INTERVAL": 0,
+            "SECRET_KEY": "bench",
+        }, **config))
+        try:
+            yield app
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
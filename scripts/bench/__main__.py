@@ -0,0 +1,23 @@
+# scripts/bench/__main__.py
+from scripts.bench import cli
+from scripts.bench.dashboard import dashboard_command
+from scripts.bench.email_lookup import email_lookup_command
+from scripts.bench.latex_format import latex_format_command
+from scripts.bench.load_test import load_test_command
+from scripts.bench.msal_login import msal_login_command
+from scripts.bench.my_requests import my_requests_command
+from scripts.bench.pdf_backends import pdf_backends_command
+from scripts.bench.sessions import sessions_command
+from scripts.bench.user_import import user_import_command
+
+cli.add_command(dashboard_command)
+cli.add_command(email_lookup_command)
+cli.add_command(latex_format_command)
+cli.add_command(load_test_command)
+cli.add_command(msal_login_command)
+cli.add_command(my_requests_command)
+cli.add_command(pdf_backends_command)
+cli.add_command(sessions_command)
+cli.add_command(user_import_command)
+
+cli()
@@ -0,0 +1,74 @@
+# scripts/bench/dashboard.py
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy.orm import joinedload
+
+from app.approvals.routes import _approver_dashboard_page
+from app.approvals.workflow import sync_progress
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+from scripts.bench import scratch_app
+
+
+@click.command("dashboard")
+@click.option("--requests", "n_requests", type=int, default=20_000, show_default=True)
+@click.option("--runs", type=int, default=20, show_default=True)
+def dashboard_command(n_requests, runs):
+    """Compare the approver dashboard's Python-filtered and SQL keyset queries."""
+    with scratch_app() as bench_app, bench_app.app_context():
+        approver = User(name="Approver", email="approver@example.edu", role="admin")
+        students = [User(name=f"Student {i}", email=f"s{i}@example.edu") for i in range(500)]
+        db.session.add_all([approver] + students)
+        db.session.flush()
+        forms = FormTemplate.query.all()
+        now = datetime.utcnow()
+        statuses = ["pending", "approved", "returned", "rejected"]
+        reqs = [Request(form_template_id=random.choice(forms).id,
+                        requester_id=random.choice(students).id, form_data_json={},
+                        status=random.choice(statuses),
+                        updated_at=now - timedelta(minutes=i)) for i in range(n_requests)]
+        db.session.add_all(reqs)
+        db.session.flush()
+        db.session.add_all([ApprovalStep(request_id=r.id, approver_id=approver.id, sequence=1,
+                                         status="pending" if r.status == "pending" else "approved")
+                            for r in reqs])
+        db.session.flush()
+        sync_progress(touch=False)
+        db.session.commit()
+        approver_id = approver.id
+
+        def legacy(state, q):
+            steps_q = (ApprovalStep.query
+                       .filter(ApprovalStep.approver_id == approver_id)
+                       .join(Request, ApprovalStep.request_id == Request.id)
+                       .options(joinedload(ApprovalStep.request).joinedload(Request.form_template),
+                                joinedload(ApprovalStep.request).joinedload(Request.requester))
+                       .order_by(Request.updated_at.desc()))
+            rows = []
+            for s in steps_q.limit(200).all():
+                req = s.request
+                if (req.status != state) if state else (s.status != "pending"):
+                    continue
+                if q and (q not in str(req.id).lower()
+                          and q not in (req.requester.name or "").lower()
+                          and q not in (req.form_template.name or "").lower()):
+                    continue
+                rows.append(s)
+            return rows
+
+        def keyset(state, q):
+            return _approver_dashboard_page(approver_id, state, q)[0]
+
+        for state, q in (("", ""), ("approved", ""), ("", "student 42")):
+            for label, fn in (("python", legacy), ("sql", keyset)):
+                timings = []
+                for _ in range(runs):
+                    db.session.expunge_all()
+                    started = time.perf_counter()
+                    n = len(fn(state, q))
+                    timings.append(time.perf_counter() - started)
+                click.echo(f"state={state or '(pending)':<9} q={q!r:<13} {label:>6}: "
+                           f"median {statistics.median(timings) * 1000:.1f} ms, {n} rows")
@@ -0,0 +1,45 @@
+# scripts/bench/email_lookup.py
+import os
+import random
+import tempfile
+import time
+
+import click
+from sqlalchemy import create_engine, text
+
+from app.models import User
+
+
+@click.command("email-lookup")
+@click.option("--users", "n_users", type=int, default=100_000, show_default=True)
+@click.option("--lookups", type=int, default=2_000, show_default=True)
+def email_lookup_command(n_users, lookups):
+    """Time case-insensitive email lookups with and without the lower(email) index."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        User.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {"name": f"User {i}", "email": f"User{i}@Example.edu", "role": "basicuser",
+                 "status": "active"} for i in range(n_users)])
+        emails = [f"user{random.randrange(n_users)}@example.edu" for _ in range(lookups)]
+        sql = "SELECT id FROM users WHERE lower(email) = :e"
+        query = text(sql)
+
+        def run(label):
+            with engine.connect() as conn:
+                plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), {"e": emails[0]}).fetchall()
+                started = time.perf_counter()
+                for e in emails:
+                    conn.execute(query, {"e": e}).first()
+                elapsed = time.perf_counter() - started
+            click.echo(f"{label:>10}: {elapsed / lookups * 1e6:.0f} us/lookup over {n_users} users "
+                       f"({plan[-1][-1]})")
+
+        for idx in User.__table__.indexes:
+            idx.drop(engine)
+        run("no index")
+        for idx in User.__table__.indexes:
+            idx.create(engine)
+        run("indexed")
+        engine.dispose()
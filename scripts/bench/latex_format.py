@@ -0,0 +1,28 @@
+# scripts/bench/latex_format.py
+import os
+import statistics
+import tempfile
+import time
+
+import click
+
+from app.utils.latex_format import ensure_format
+from app.utils.pdf_generator import compile_latex, _render_default
+
+
+@click.command("latex-format")
+@click.option("--runs", type=int, default=10, show_default=True, help="PDFs compiled per variant.")
+def latex_format_command(runs):
+    """Compile a sample form cold and with a precompiled pdflatex format."""
+    sample = _render_default({"title": "BENCHMARK", "submitted_date": "2025-01-01 00:00 UTC",
+                              "submitter_name": "Benchmark"})
+    with tempfile.TemporaryDirectory() as tmp:
+        ensure_format(tmp, sample)  # keep the one-off dump out of the timings
+        for label, use_format in (("cold", False), ("precompiled", True)):
+            timings = []
+            for i in range(runs):
+                started = time.perf_counter()
+                compile_latex(sample, f"bench_{i}", os.path.join(tmp, f"bench_{i}.pdf"), use_format=use_format)
+                timings.append(time.perf_counter() - started)
+            click.echo(f"{label:>12}: mean {statistics.mean(timings) * 1000:.0f} ms, "
+                       f"median {statistics.median(timings) * 1000:.0f} ms over {runs} PDFs")
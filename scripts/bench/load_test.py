@@ -0,0 +1,250 @@
+# scripts/bench/load_test.py
+import http.client
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import click
+from flask import request as flask_request
+
+from app import create_app
+from app.approvals.workflow import sync_progress
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+from app.utils.search_index import create_fts_table, rebuild_index
+from scripts.bench import scratch_app
+
+
+LOAD_TEST_ROUTES = (
+    ("home", "/"),
+    ("my_requests", "/approvals/my_requests"),
+    ("dashboard", "/approvals/approver/dashboard"),
+    ("search", "/approvals/approver/search?q=student"),
+    ("detail", "/approvals/approver/requests/{request_id}"),
+    ("users_api", "/users/api?limit=100"),
+)
+
+
+def _session_cookie(app, email: str) -> str:
+    """'name=value' of a session signed in as `email`, minted through the app's own session interface."""
+    interface = app.session_interface
+    with app.test_request_context():
+        sess = interface.open_session(app, flask_request)
+        sess["user"] = {"preferred_username": email, "name": email}
+        response = app.response_class()
+        interface.save_session(app, sess, response)
+    return response.headers["Set-Cookie"].split(";", 1)[0]
+
+
+def _seed_load_test(n_requests: int) -> tuple:
+    """An admin who is both requester and approver of n_requests requests; returns (email, a request id)."""
+    admin = User(name="Load Tester", email="loadtest@example.edu", role="admin")
+    students = [User(name=f"Student {i}", email=f"s{i}@example.edu") for i in range(200)]
+    db.session.add_all([admin] + students)
+    db.session.flush()
+    forms = FormTemplate.query.all()
+    now = datetime.utcnow()
+    reqs = [Request(form_template_id=random.choice(forms).id,
+                    requester_id=admin.id if i % 10 == 0 else random.choice(students).id,
+                    form_data_json={"student_name": f"Student {i}", "comments": "load test"},
+                    status=random.choice(["pending", "pending", "approved", "returned"]),
+                    submitted_at=now - timedelta(minutes=i), updated_at=now - timedelta(minutes=i))
+            for i in range(n_requests)]
+    db.session.add_all(reqs)
+    db.session.flush()
+    db.session.add_all([ApprovalStep(request_id=r.id, approver_id=admin.id, sequence=1,
+                                     status="pending" if r.status == "pending" else "approved")
+                        for r in reqs])
+    db.session.flush()
+    sync_progress(touch=False)
+    db.session.commit()
+    with db.engine.begin() as conn:
+        if create_fts_table(conn):
+            rebuild_index(conn)
+    return admin.email, reqs[0].id
+
+
+def _wait_for_server(host: str, port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise click.ClickException(f"server on {host}:{port} did not come up within {timeout:.0f}s")
+            time.sleep(0.2)
+
+
+def _run_load(host: str, port: int, paths: list, cookie: str, concurrency: int, duration: float) -> tuple:
+    """Each thread cycles through the routes on one keep-alive connection; returns (per-route results, elapsed)."""
+    results = defaultdict(list)  # route -> [(status, seconds)]
+    lock = threading.Lock()
+    start_gate = threading.Barrier(concurrency + 1)
+    stop_at = []
+
+    def worker(offset):
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        mine = defaultdict(list)
+        start_gate.wait()
+        i = offset
+        while time.perf_counter() < stop_at[0]:
+            name, path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"Cookie": cookie})
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                status = 0
+            mine[name].append((status, time.perf_counter() - started))
+        conn.close()
+        with lock:
+            for name, rows in mine.items():
+                results[name].extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    started = time.perf_counter()
+    stop_at.append(started + duration)
+    start_gate.wait()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - started
+
+
+def _report_load(results: dict, elapsed: float) -> int:
+    """Print requests/sec and p50/p99 per route; returns the number of non-200 responses."""
+    def line(label, rows):
+        timings = sorted(t for _, t in rows)
+        pct = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        failed = sum(1 for status, _ in rows if status != 200)
+        click.echo(f"{label:<12} {len(rows):>7} {len(rows) / elapsed:>9.1f} {pct[49] * 1000:>8.1f} "
+                   f"{pct[98] * 1000:>8.1f} {failed:>7}")
+        return failed
+
+    click.echo(f"{'route':<12} {'requests':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'non-200':>7}")
+    failed = sum(line(name, rows) for name, rows in results.items())
+    line("all", [r for rows in results.values() for r in rows])
+    return failed
+
+
+def _check_drain(proc, host: str, port: int, cookie: str, path: str, in_flight: int) -> None:
+    """Send requests, SIGTERM the server while they are in flight, and check they all complete."""
+    conns = []
+    for _ in range(in_flight):
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        conn.request("GET", path, headers={"Cookie": cookie})
+        conns.append(conn)
+    time.sleep(0.05)  # let the workers accept them
+    started = time.perf_counter()
+    proc.send_signal(signal.SIGTERM)
+    statuses = []
+    for conn in conns:
+        try:
+            resp = conn.getresponse()
+            resp.read()
+            statuses.append(resp.status)
+        except (OSError, http.client.HTTPException):
+            statuses.append(0)
+        conn.close()
+    code = proc.wait(timeout=120)
+    completed = sum(1 for s in statuses if s == 200)
+    click.echo(f"SIGTERM with {in_flight} requests in flight: {completed} completed, server exited {code} "
+               f"after {time.perf_counter() - started:.2f}s")
+    if completed != in_flight or code != 0:
+        raise click.ClickException("graceful shutdown dropped requests or exited uncleanly")
+
+
+@click.command("load-test")
+@click.option("--url", default=None,
+              help="Server to load (e.g. http://127.0.0.1:5001) sharing the configured database; "
+                   "default: start gunicorn on a scratch DB.")
+@click.option("--user", "email", default=None, help="Sign in as this user (--url only; default: first admin).")
+@click.option("--duration", type=float, default=10.0, show_default=True, help="Seconds of load.")
+@click.option("--concurrency", type=int, default=16, show_default=True, help="Client threads.")
+@click.option("--workers", type=int, default=None, help="WEB_WORKERS for the started server.")
+@click.option("--threads", type=int, default=None, help="WEB_THREADS for the started server.")
+@click.option("--requests", "n_requests", type=int, default=5000, show_default=True,
+              help="Requests seeded into the scratch DB.")
+def load_test_command(url, email, duration, concurrency, workers, threads, n_requests):
+    """Load the main routes over HTTP and report requests/sec and p50/p99 per route."""
+    if url:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        app = create_app(start_workers=False)
+        with app.app_context():
+            user = (User.query.filter_by(email=email).first() if email
+                    else User.query.filter_by(role="admin", status="active").order_by(User.id).first())
+            if user is None:
+                raise click.ClickException("no such user to sign in as")
+            request_id = db.session.scalar(db.select(Request.id).order_by(Request.id.desc()).limit(1)) or 0
+            email = user.email
+            db.session.remove()
+        cookie = _session_cookie(app, email)
+        paths = [(name, path.format(request_id=request_id)) for name, path in LOAD_TEST_ROUTES]
+        _wait_for_server(host, port, 5)
+        results, elapsed = _run_load(host, port, paths, cookie, concurrency, duration)
+        if _report_load(results, elapsed):
+            raise SystemExit(1)
+        return
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+    with scratch_app() as load_app:
+        with load_app.app_context():
+            email, request_id = _seed_load_test(n_requests)
+            db.session.remove()
+            db.engine.dispose()
+        cookie = _session_cookie(load_app, email)
+        paths = [(name, path.format(request_id=request_id)) for name, path in LOAD_TEST_ROUTES]
+
+        # the server gets the scratch app's settings through its own environment
+        env = dict(os.environ, DATABASE_URL=load_app.config["SQLALCHEMY_DATABASE_URI"], RENDER_WORKERS="0",
+                   FLASK_SECRET_KEY=load_app.secret_key, WEB_ACCESS_LOG="")
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            host, port = sock.getsockname()
+        env["WEB_BIND"] = f"{host}:{port}"
+        if workers:
+            env["WEB_WORKERS"] = str(workers)
+        if threads:
+            env["WEB_THREADS"] = str(threads)
+        server_log = tempfile.TemporaryFile("w+")
+        proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                cwd=root, env=env, stdout=server_log, stderr=subprocess.STDOUT)
+        try:
+            try:
+                _wait_for_server(host, port, 60)
+            except click.ClickException:
+                server_log.seek(0)
+                click.echo(server_log.read()[-2000:], err=True)
+                raise
+            click.echo(f"gunicorn on {host}:{port}: {env.get('WEB_WORKERS', 'default')} workers x "
+                       f"{env.get('WEB_THREADS', 'default')} threads, {concurrency} clients, {duration:.0f}s")
+            results, elapsed = _run_load(host, port, paths, cookie, concurrency, duration)
+            failed = _report_load(results, elapsed)
+            _check_drain(proc, host, port, cookie, paths[2][1], in_flight=min(concurrency, 8))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            server_log.close()
+        if failed:
+            raise click.ClickException(f"{failed} requests did not answer 200")
@@ -0,0 +1,129 @@
+# scripts/bench/msal_login.py
+import base64
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import click
+import requests
+
+from app.auth import msal_client as shared_msal
+from scripts.bench import scratch_app
+
+
+def _stub_authority(tmp: str, latency_ms: float):
+    """
+    HTTPS server standing in for login.microsoftonline.com: OpenID discovery,
+    and a token endpoint issuing unsigned ID tokens. Each response is delayed
+    by latency_ms to approximate a real network round trip.
+    """
+    cert, key = os.path.join(tmp, "stub.crt"), os.path.join(tmp, "stub.key")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+                        "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise click.ClickException(f"openssl is needed for the stub authority's certificate: {e}")
+
+    def b64(obj) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+
+    stats = {"discovery": 0, "token": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, body):
+            time.sleep(latency_ms / 1000)
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            stats["discovery"] += 1
+            base = f"https://{self.headers['Host']}/stub-tenant"
+            self._reply({"authorization_endpoint": f"{base}/oauth2/v2.0/authorize",
+                         "token_endpoint": f"{base}/oauth2/v2.0/token",
+                         "device_authorization_endpoint": f"{base}/oauth2/v2.0/devicecode",
+                         "issuer": f"{base}/v2.0"})
+
+        def do_POST(self):
+            stats["token"] += 1
+            form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+            now = int(time.time())
+            body = {"access_token": f"at-{now}", "token_type": "Bearer", "expires_in": 3600}
+            if form.get("grant_type") == ["authorization_code"]:
+                uid = form["code"][0]
+                body.update(refresh_token="rt", client_info=b64({"uid": uid, "utid": "stub-tenant"}),
+                            id_token=b64({"alg": "none"}) + "." + b64({
+                                "aud": form.get("client_id", ["stub-client"])[0], "oid": uid,
+                                "iss": f"https://{self.headers['Host']}/stub-tenant/v2.0",
+                                "tid": "stub-tenant", "sub": uid, "iat": now, "exp": now + 3600,
+                                "name": f"Stub {uid}", "preferred_username": f"{uid}@example.edu"}) + ".")
+            self._reply(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"https://127.0.0.1:{server.server_port}/stub-tenant", cert, stats
+
+
+@click.command("msal-login")
+@click.option("--logins", type=int, default=50, show_default=True)
+@click.option("--latency-ms", type=float, default=20.0, show_default=True,
+              help="Delay the stub authority adds to every response.")
+def msal_login_command(logins, latency_ms):
+    """Time /auth/login + /auth/callback with a per-request vs shared MSAL client (stub authority)."""
+    with tempfile.TemporaryDirectory() as tmp, scratch_app() as bench_app:
+        server, authority, cert, stats = _stub_authority(tmp, latency_ms)
+
+        def make_client():
+            session = requests.Session()
+            session.trust_env = False  # ignore REQUESTS_CA_BUNDLE so the stub's cert is used
+            session.verify = cert
+            return shared_msal.init_msal_client(bench_app, client_id="stub-client", client_secret="stub-secret",
+                                                authority=authority, http_client=session,
+                                                instance_discovery=False)
+
+        def login(client, n, per_request):
+            # per_request reproduces the old routes: a fresh app (discovery, empty cache) in each view
+            if per_request:
+                make_client()
+            client.get("/auth/login")
+            if per_request:
+                make_client()
+            resp = client.get(f"/auth/callback?code=user{n % 10}")
+            assert resp.status_code == 302, resp.data[:200]
+
+        for label, per_request in (("per-request client", True), ("shared client", False)):
+            shared = make_client()
+            stats.update(discovery=0, token=0)
+            client = bench_app.test_client()
+            timings = []
+            for n in range(logins):
+                started = time.perf_counter()
+                login(client, n, per_request)
+                timings.append(time.perf_counter() - started)
+            click.echo(f"{label:>18}: median {statistics.median(timings) * 1000:.1f} ms/login, "
+                       f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:.1f} ms, "
+                       f"{stats['discovery']} discovery + {stats['token']} token calls for {logins} logins")
+        # sign-ins must leave no user tokens behind, in the persistent store or in memory
+        kept = json.loads(shared.store.load() or "{}")
+        with shared_msal.msal_login_client() as login_client:
+            lingering = login_client.get_accounts()
+        if kept.get("RefreshToken") or kept.get("Account") or lingering:
+            raise click.ClickException("user tokens were kept after sign-in")
+        server.shutdown()
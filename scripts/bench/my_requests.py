@@ -0,0 +1,62 @@
+# scripts/bench/my_requests.py
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from app.approvals.workflow import sync_progress
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+from scripts.bench import scratch_app
+
+
+@click.command("my-requests")
+@click.option("--requests", "n_requests", type=int, default=2000, show_default=True)
+@click.option("--runs", type=int, default=20, show_default=True)
+def my_requests_command(n_requests, runs):
+    """Time the My Requests page against loading the requester's full ORM rows."""
+    with scratch_app(SESSION_BACKEND="cookie") as bench_app:
+        with bench_app.app_context():
+            requester = User(name="Requester", email="requester@example.edu")
+            approver = User(name="Approver", email="approver@example.edu", role="admin")
+            db.session.add_all([requester, approver])
+            db.session.flush()
+            forms = FormTemplate.query.all()
+            now = datetime.utcnow()
+            blob = {f"field_{i}": "x" * 200 for i in range(20)}  # a realistically sized form_data_json
+            reqs = [Request(form_template_id=random.choice(forms).id, requester_id=requester.id,
+                            form_data_json=blob, status=random.choice(["draft", "pending", "approved", "returned"]),
+                            created_at=now - timedelta(minutes=i), updated_at=now - timedelta(minutes=i))
+                    for i in range(n_requests)]
+            db.session.add_all(reqs)
+            db.session.flush()
+            db.session.add_all([ApprovalStep(request_id=r.id, approver_id=approver.id, sequence=1, status="pending")
+                                for r in reqs if r.status == "pending"])
+            db.session.flush()
+            sync_progress(touch=False)
+            db.session.commit()
+            email, requester_id = requester.email, requester.id
+            db.session.remove()
+
+        client = bench_app.test_client()
+        with client.session_transaction() as sess:
+            sess["user"] = {"preferred_username": email, "name": "Requester"}
+        client.get("/approvals/my_requests")  # warm caches
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            client.get("/approvals/my_requests")
+            timings.append(time.perf_counter() - started)
+        click.echo(f"page (projected, keyset): median {statistics.median(timings) * 1000:.1f} ms")
+
+        with bench_app.app_context():
+            timings = []
+            for _ in range(runs):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                rows = Request.query.filter_by(requester_id=requester_id).order_by(Request.created_at.desc()).all()
+                [r.form_template.name for r in rows]
+                timings.append(time.perf_counter() - started)
+            click.echo(f"previous query (full rows, lazy form_template): median "
+                       f"{statistics.median(timings) * 1000:.1f} ms")
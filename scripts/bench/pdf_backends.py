@@ -0,0 +1,56 @@
+# scripts/bench/pdf_backends.py
+import os
+import resource
+import statistics
+import time
+import tracemalloc
+
+import click
+
+from app import create_app
+from app.models import db, FormTemplate, Request
+from app.utils import pdf_generator
+from app.utils.render_queue import signature_paths_for_step
+
+
+@click.command("pdf-backends")
+@click.option("--limit", type=int, default=20, show_default=True, help="Number of requests to render.")
+@click.option("--form-code", multiple=True, help="Only requests for these form codes (repeatable).")
+def pdf_backends_command(limit, form_code):
+    """Render the configured database's latest requests with every PDF backend; compare latency, CPU and memory."""
+    app = create_app(start_workers=False)
+    with app.app_context():
+        q = Request.query.join(FormTemplate, Request.form_template_id == FormTemplate.id)
+        if form_code:
+            q = q.filter(FormTemplate.form_code.in_(form_code))
+        reqs = q.order_by(Request.id.desc()).limit(limit).all()
+        if not reqs:
+            click.echo("No requests to benchmark.")
+            return
+        jobs = []
+        for r in reqs:
+            last = r.approval_steps[-1] if r.approval_steps else None
+            jobs.append((r, signature_paths_for_step(r, last) if last else []))
+
+        pdf_generator.RENDER_CACHE_ENABLED = False  # measure real renders, not cache hits
+        for name in pdf_generator.PDF_BACKENDS:
+            timings = []
+            cpu_before = os.times()
+            tracemalloc.start()
+            for r, sigs in jobs:
+                started = time.perf_counter()
+                pdf_generator.generate_request_pdf(r, sigs, backend=name)
+                timings.append(time.perf_counter() - started)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            cpu_after = os.times()
+            cpu = sum(cpu_after[i] - cpu_before[i] for i in range(4))  # self + children, user + sys
+            timings.sort()
+            click.echo(f"{name:>8}: mean {statistics.mean(timings) * 1000:.1f} ms, "
+                       f"p50 {timings[len(timings) // 2] * 1000:.1f} ms, "
+                       f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000:.1f} ms, "
+                       f"cpu {cpu / len(timings) * 1000:.1f} ms/pdf, "
+                       f"py peak {peak / 1024:.0f} KiB, "
+                       f"child maxrss {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss} KiB "
+                       f"({len(timings)} PDFs)")
+        db.session.remove()
@@ -0,0 +1,33 @@
+# scripts/bench/sessions.py
+import statistics
+import time
+
+import click
+
+from scripts.bench import scratch_app
+
+
+@click.command("sessions")
+@click.option("--requests", "n_requests", type=int, default=500, show_default=True)
+def sessions_command(n_requests):
+    """Compare cookie size and per-request time of cookie vs server-side sessions."""
+    claims = {  # shape of a real Entra ID id_token_claims payload
+        "aud": "00000000-0000-0000-0000-000000000000", "iss": "https://login.microsoftonline.com/"
+        "11111111-1111-1111-1111-111111111111/v2.0", "iat": 1700000000, "nbf": 1700000000, "exp": 1700003600,
+        "aio": "A" * 180, "name": "Bench User", "nonce": "n" * 32, "oid": "22222222-2222-2222-2222-222222222222",
+        "preferred_username": "bench.user@example.edu", "rh": "0.A" + "r" * 80, "sid": "s" * 36,
+        "sub": "x" * 43, "tid": "11111111-1111-1111-1111-111111111111", "uti": "u" * 22, "ver": "2.0",
+    }
+    for backend in ("cookie", "db"):
+        with scratch_app(SESSION_BACKEND=backend) as bench_app:
+            client = bench_app.test_client()
+            with client.session_transaction() as sess:
+                sess["user"] = claims
+            cookie = client.get_cookie(bench_app.config["SESSION_COOKIE_NAME"])
+            timings = []
+            for _ in range(n_requests):
+                started = time.perf_counter()
+                client.get("/auth/profile")
+                timings.append(time.perf_counter() - started)
+            click.echo(f"{backend:>6}: cookie {len(cookie.value)} bytes, median "
+                       f"{statistics.median(timings) * 1e6:.0f} us/request over {n_requests} requests")
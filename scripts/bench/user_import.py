@@ -0,0 +1,38 @@
+# scripts/bench/user_import.py
+import time
+
+import click
+from sqlalchemy import func
+
+from app.models import db, User
+from app.users.importer import import_users
+from scripts.bench import scratch_app
+
+
+@click.command("user-import")
+@click.option("--rows", "n_rows", type=int, default=50_000, show_default=True)
+@click.option("--batch-size", type=int, default=1000, show_default=True)
+@click.option("--single-rows", type=int, default=2_000, show_default=True,
+              help="Rows to time through the one-user-per-call path for comparison.")
+def user_import_command(n_rows, batch_size, single_rows):
+    """Time a bulk import of generated users (insert, then re-run as an update)."""
+    with scratch_app() as bench_app, bench_app.app_context():
+        rows = [{"name": f"Student {i}", "email": f"Student{i}@Example.edu",
+                 "role": "basicuser", "status": "active", "oid": f"oid-{i}"} for i in range(n_rows)]
+        for label in ("insert", "update"):
+            started = time.perf_counter()
+            report = import_users(rows, batch_size)
+            elapsed = time.perf_counter() - started
+            click.echo(f"bulk {label}: {n_rows} rows in {elapsed:.2f}s "
+                       f"({n_rows / elapsed:,.0f} rows/s) {report.counts}")
+            rows = [dict(r, status="deactivated") for r in rows]
+
+        # Baseline: what create_user_api does per call (duplicate check + insert + commit)
+        started = time.perf_counter()
+        for i in range(single_rows):
+            email = f"single{i}@example.edu"
+            if not User.query.filter(func.lower(User.email) == email.lower()).first():
+                db.session.add(User(name=f"Single {i}", email=email, role="basicuser", status="active"))
+                db.session.commit()
+        elapsed = time.perf_counter() - started
+        click.echo(f"per-row  : {single_rows} rows in {elapsed:.2f}s ({single_rows / elapsed:,.0f} rows/s)")
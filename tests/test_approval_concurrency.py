@@ -0,0 +1,117 @@
+"""Parallel, double-clicked approvals of one request must leave a consistent final state."""
+import threading
+import uuid
+from collections import Counter
+
+import pytest
+
+from app import create_app
+from app.approvals.events import request_timeline
+from app.approvals.routing import route_request
+from app.approvals.workflow import needed_approvals, progress_mismatches
+from app.models import db, FormTemplate, PdfRenderJob, Request, Signature, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'stress.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _routed_request(app):
+    """A pending request routed through a quorum-2 stage of 5, an all-of-3 stage and a single approver."""
+    with app.app_context():
+        student = User(name="Student", email="student@example.edu")
+        approvers = [User(name=f"Approver {i}", email=f"a{i}@example.edu", role="admin") for i in range(9)]
+        db.session.add_all([student] + approvers)
+        db.session.flush()
+        db.session.add_all([Signature(user_id=a.id, image_path="uploads/signatures/stress.png") for a in approvers])
+        form = FormTemplate.query.first()
+        form.routing_json = [{"steps": [
+            {"parallel": [{"user": a.email} for a in approvers[:5]], "quorum": 2},
+            {"parallel": [{"user": a.email} for a in approvers[5:8]], "quorum": "all"},
+            {"user": approvers[8].email},
+        ]}]
+        req_obj = Request(form_template_id=form.id, requester_id=student.id, form_data_json={}, status="pending")
+        db.session.add(req_obj)
+        db.session.flush()
+        route_request(req_obj)
+        db.session.commit()
+        stages = {}
+        for s in req_obj.approval_steps:
+            stages.setdefault(s.sequence, []).append(s)
+        needed = {sequence: needed_approvals(steps[0].quorum, len(steps)) for sequence, steps in stages.items()}
+        request_id, emails = req_obj.id, [a.email for a in approvers]
+        db.session.remove()
+    return request_id, emails, needed
+
+
+def test_parallel_double_clicked_approvals(app):
+    request_id, emails, needed = _routed_request(app)
+    results = []  # (email, key, status code, json)
+    lock = threading.Lock()
+
+    def click_approve(email, key, version, barrier):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user"] = {"preferred_username": email}
+        barrier.wait()
+        body = {"idempotency_key": key}
+        if version is not None:
+            body["version"] = version
+        resp = client.post(f"/approvals/approver/requests/{request_id}/approve", json=body)
+        with lock:
+            results.append((email, key, resp.status_code, resp.get_json()))
+
+    # every round applies at least one approval, so this many rounds always finish the request
+    for _ in range(sum(needed.values())):
+        with app.app_context():
+            req_obj = db.session.get(Request, request_id)
+            status, version = req_obj.status, req_obj.version
+            db.session.remove()
+        if status != "pending":
+            break
+        # every approver double-clicks; half of them send the version they saw, half none
+        barrier = threading.Barrier(2 * len(emails))
+        threads = []
+        for i, email in enumerate(emails):
+            key = uuid.uuid4().hex
+            for _ in range(2):
+                threads.append(threading.Thread(target=click_approve,
+                                                args=(email, key, version if i % 2 else None, barrier)))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert {r[2] for r in results} <= {200, 409}
+    acted = [r for r in results if r[2] == 200 and not r[3]["replayed"]]
+    replays = [r for r in results if r[2] == 200 and r[3]["replayed"]]
+    outcome_by_key = {r[1]: r[3]["outcome"] for r in acted}
+    assert len(outcome_by_key) == len(acted), "one idempotency key acted more than once"
+    assert all(outcome_by_key.get(r[1]) == r[3]["outcome"] for r in replays)
+
+    with app.app_context():
+        req_obj = db.session.get(Request, request_id)
+        steps = req_obj.approval_steps
+        assert req_obj.status == "approved"
+        for sequence, count in needed.items():
+            stage = Counter(s.status for s in steps if s.sequence == sequence)
+            assert stage["approved"] == count and not stage["pending"], (sequence, dict(stage))
+        approved = sum(1 for s in steps if s.status == "approved")
+        assert approved == len(acted)
+        assert req_obj.version == 1 + len(acted)
+        assert PdfRenderJob.query.filter_by(request_id=request_id).count() == approved
+        assert progress_mismatches() == []
+        events = Counter(e.event for e in request_timeline(request_id))
+        assert dict(events) == {"approved": approved, "skipped": sum(1 for s in steps if s.status == "skipped"),
+                                "completed": 1}
+        db.session.remove()
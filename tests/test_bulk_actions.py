@@ -0,0 +1,138 @@
+"""Bulk user actions: outcomes, session revocation, and what deleting an approver does to requests."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app
+from app.approvals.events import request_timeline
+from app.approvals.routing import route_request
+from app.approvals.workflow import progress_mismatches
+from app.models import db, ApprovalStep, FormTemplate, PdfRenderJob, Request, Signature, User, UserSession
+from app.users.bulk_actions import run_bulk_action
+from app.utils.search_index import FTS_TABLE, index_request
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'bulk.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_PURGE_INTERVAL": 0,
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _users(*specs):
+    users = [User(name=name, email=f"{name.lower()}@x.edu", role=role) for name, role in specs]
+    db.session.add_all(users)
+    db.session.flush()
+    return users
+
+
+def _log_in_everywhere(*users):
+    db.session.add_all([UserSession(id=f"{u.id}-{n}", user_email=u.email, data="{}",
+                                    expires_at=datetime.utcnow() + timedelta(hours=1))
+                        for u in users for n in range(2)])
+    db.session.commit()
+
+
+def _sessions():
+    return sorted({s.user_email for s in UserSession.query})
+
+
+def _request(requester, steps):
+    form = FormTemplate.query.first()
+    form.routing_json = [{"steps": steps}]
+    req_obj = Request(form_template_id=form.id, requester_id=requester.id, status="pending",
+                      form_data_json={"comments": f"request by {requester.name}"})
+    db.session.add(req_obj)
+    db.session.flush()
+    route_request(req_obj)
+    index_request(req_obj)
+    return req_obj
+
+
+def test_deactivate_reports_outcomes_and_revokes_sessions(app):
+    admin, ann, bob = _users(("Admin", "admin"), ("Ann", "basicuser"), ("Bob", "basicuser"))
+    bob.status = "deactivated"
+    _log_in_everywhere(admin, ann, bob)
+
+    results = run_bulk_action("deactivate", [ann.id, bob.id, admin.id, 999, ann.id], admin.id)
+    assert results == {ann.id: "deactivated", bob.id: "unchanged", admin.id: "skipped_self", 999: "not_found"}
+    assert (ann.status, admin.status) == ("deactivated", "active")
+    assert _sessions() == ["admin@x.edu", "bob@x.edu"]
+
+    assert run_bulk_action("reactivate", [ann.id, bob.id], admin.id) == {ann.id: "reactivated",
+                                                                         bob.id: "reactivated"}
+    assert run_bulk_action("set_role", [ann.id, admin.id], admin.id, "admin") == {ann.id: "role_changed",
+                                                                                  admin.id: "unchanged"}
+    assert run_bulk_action("set_role", [admin.id], admin.id, "basicuser") == {admin.id: "skipped_self"}
+    with pytest.raises(ValueError):
+        run_bulk_action("set_role", [ann.id], admin.id, "owner")
+    with pytest.raises(ValueError):
+        run_bulk_action("archive", [ann.id], admin.id)
+
+
+def test_delete_clears_dependents_and_returns_stranded_requests(app):
+    admin, student, ann, bob = _users(("Admin", "admin"), ("Student", "basicuser"),
+                                      ("Ann", "basicuser"), ("Bob", "basicuser"))
+    db.session.add(Signature(user_id=ann.id, image_path="uploads/signatures/ann.png"))
+    only_ann = _request(student, [{"user": "ann@x.edu"}])
+    ann_then_bob = _request(student, [{"user": "ann@x.edu"}, {"user": "bob@x.edu"}])
+    by_ann = _request(ann, [{"user": "bob@x.edu"}])
+    db.session.add(PdfRenderJob(request_id=by_ann.id, kind="base", status="queued", signature_paths=[]))
+    db.session.commit()
+    _log_in_everywhere(ann, bob)
+    ids = only_ann.id, ann_then_bob.id, by_ann.id
+    ann_id = ann.id
+
+    assert run_bulk_action("delete", [ann_id], admin.id) == {ann_id: "deleted"}
+    db.session.expire_all()
+    only_ann, ann_then_bob = db.session.get(Request, ids[0]), db.session.get(Request, ids[1])
+
+    # the approver's own request and everything hanging off them are gone
+    assert db.session.get(Request, ids[2]) is None
+    assert ApprovalStep.query.filter_by(request_id=ids[2]).count() == 0
+    assert PdfRenderJob.query.filter_by(request_id=ids[2]).count() == 0
+    assert Signature.query.count() == 0
+    assert _sessions() == ["bob@x.edu"]
+    fts_ids = {r[0] for r in db.session.execute(text(f"SELECT rowid FROM {FTS_TABLE}"))}
+    assert fts_ids == {ids[0], ids[1]}
+
+    # nobody is left to act on the first request: it goes back to the student
+    assert (only_ann.status, only_ann.steps_total, only_ann.current_stage) == ("returned", 0, None)
+    assert [(e.event, e.actor_id) for e in request_timeline(ids[0])] == [("returned", None)]
+    # the second one still has Bob's stage and moves on to it
+    assert (ann_then_bob.status, ann_then_bob.current_approver_id) == ("pending", bob.id)
+    assert request_timeline(ids[1]) == []
+    assert progress_mismatches() == []
+
+
+def test_single_delete_endpoint_returns_stranded_requests(app):
+    admin, student, ann = _users(("Admin", "admin"), ("Student", "basicuser"), ("Ann", "basicuser"))
+    req_obj = _request(student, [{"parallel": [{"user": "ann@x.edu"}, {"user": "admin@x.edu"}], "quorum": "all"}])
+    only_ann = _request(student, [{"user": "ann@x.edu"}])
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = {"preferred_username": "admin@x.edu"}
+
+    assert client.delete(f"/users/api/{ann.id}").get_json() == {"ok": True}
+    db.session.expire_all()
+    assert (req_obj.status, req_obj.current_approver_id) == ("pending", admin.id)  # admin's step remains
+    assert only_ann.status == "returned"
+    assert [e.event for e in request_timeline(only_ann.id)] == ["returned"]
+    assert progress_mismatches() == []
+
+    assert client.post("/users/api/batch", json={"action": "delete", "ids": [admin.id]}).get_json()["counts"] == {
+        "skipped_self": 1}
+    other_id = _users(("Other", "admin"))[0].id
+    db.session.commit()
+    assert client.post("/users/api/batch", json={"action": "delete", "filter": {"q": "other"}}).get_json()[
+        "results"] == {str(other_id): "deleted"}
+    assert client.delete(f"/users/api/{other_id}").status_code == 404
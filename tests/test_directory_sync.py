@@ -0,0 +1,159 @@
+"""Directory sync against a stub Graph /users/delta endpoint."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.auth import directory_sync
+from app.auth.directory_sync import DirectorySync, get_sync_state
+from app.models import db, User
+
+
+class StubGraph:
+    """
+    /users/delta over plain HTTP. Full listings and delta links are paged by
+    the Prefer: odata.maxpagesize header; a delta link returns the latest
+    change of each user since its version. `throttle` answers that many
+    requests with 429, and after expire_links() every delta link gets 410.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.changes = []  # (version, item)
+        self.version = 0
+        self.oldest_link = 0
+        self.throttle = 0
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests.append(self.path)
+                status, headers, body = stub.respond(self.path, self.headers)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in dict(headers, **{"Content-Type": "application/json"}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1.0"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def put(self, oid, **fields):
+        item = dict(self.users.get(oid, {"id": oid}), **fields)
+        self.users[oid] = item
+        self.version += 1
+        self.changes.append((self.version, item))
+
+    def remove(self, oid):
+        self.users.pop(oid)
+        self.version += 1
+        self.changes.append((self.version, {"id": oid, "@removed": {"reason": "deleted"}}))
+
+    def expire_links(self):
+        self.oldest_link = self.version + 1
+
+    def respond(self, path, headers):
+        if self.throttle:
+            self.throttle -= 1
+            return 429, {"Retry-After": "7"}, {"error": {"code": "TooManyRequests"}}
+        query = {k: v[0] for k, v in parse_qs(urlparse(path).query).items()}
+        if "token" in query:
+            since = int(query["token"])
+            if since < self.oldest_link:
+                return 410, {}, {"error": {"code": "syncStateNotFound"}}
+            latest = {item["id"]: item for version, item in self.changes if version > since}
+            items = list(latest.values())
+        else:
+            items = list(self.users.values())
+        page_size = int(headers["Prefer"].split("=")[1])
+        skip = int(query.get("skip", 0))
+        body = {"value": items[skip:skip + page_size]}
+        if skip + page_size < len(items):
+            params = dict(query, skip=skip + page_size)
+            body["@odata.nextLink"] = f"{self.base_url}/users/delta?" + "&".join(f"{k}={v}" for k, v in params.items())
+        else:
+            body["@odata.deltaLink"] = f"{self.base_url}/users/delta?token={self.version}"
+        return 200, {}, body
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    stub = StubGraph()
+    monkeypatch.setenv("GRAPH_BASE_URL", stub.base_url)
+    monkeypatch.setenv("GRAPH_ACCESS_TOKEN", "stub-token")
+    yield stub
+    stub.server.shutdown()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'sync.db'}")
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    monkeypatch.setenv("RENDER_WORKERS", "0")
+    from app import create_app
+    app = create_app(start_workers=False)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _user(oid):
+    db.session.expire_all()
+    return User.query.filter_by(oid=oid).one()
+
+
+def test_delta_sync_against_stub_graph(app, graph, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(directory_sync.time, "sleep", sleeps.append)
+    # created at first login, before the directory knew about it
+    db.session.add(User(name="Ann", email="ann@uh.edu", role="admin", status="active"))
+    db.session.commit()
+    for n, name in enumerate(("ann", "bob", "cat", "dan", "eve"), 1):
+        graph.put(f"oid-{n}", displayName=name.title(), mail=f"{name}@uh.edu", accountEnabled=name != "eve")
+
+    # full sync, paged two users at a time
+    metrics = DirectorySync(page_size=2).run()
+    assert graph.requests[0].startswith("/v1.0/users/delta?")  # GRAPH_BASE_URL read when the sync is built
+    assert (metrics["mode"], metrics["pages"], metrics["created"], metrics["updated"]) == ("full", 3, 4, 1)
+    assert _user("oid-1").role == "admin"
+    assert (_user("oid-5").status, _user("oid-5").deactivated_by) == ("deactivated", "directory")
+    assert get_sync_state().delta_link.endswith(f"token={graph.version}")
+
+    # an admin deactivates bob; the directory changes, and throttles once
+    bob = _user("oid-2")
+    bob.status = "deactivated"
+    db.session.commit()
+    graph.put("oid-2", displayName="Bobby", accountEnabled=True)
+    graph.put("oid-3", accountEnabled=False)
+    graph.put("oid-5", accountEnabled=True)
+    graph.remove("oid-4")
+    graph.throttle = 1
+    requests_before = len(graph.requests)
+    metrics = DirectorySync(page_size=2).run()
+    assert sleeps == [7.0]
+    assert "token=" in graph.requests[requests_before]  # resumed from the stored delta link
+    assert (metrics["mode"], metrics["pages"], metrics["received"]) == ("delta", 2, 4)
+    assert (metrics["deactivated"], metrics["reactivated"]) == (2, 1)
+    assert (_user("oid-2").name, _user("oid-2").status) == ("Bobby", "deactivated")
+    assert (_user("oid-3").status, _user("oid-4").status) == ("deactivated", "deactivated")
+    assert (_user("oid-5").status, _user("oid-5").deactivated_by) == ("active", None)
+
+    # the delta link expires: the sync falls back to a full read, which also
+    # catches a user the directory dropped without a delta entry
+    graph.users.pop("oid-1")
+    graph.expire_links()
+    metrics = DirectorySync(page_size=2).run()
+    assert metrics["mode"] == "full (delta link expired)"
+    assert _user("oid-1").status == "deactivated"
+    assert get_sync_state().last_full_sync_at is not None
+    assert get_sync_state().delta_link.endswith(f"token={graph.version}")
@@ -0,0 +1,75 @@
+"""Upgrading an existing database must leave its foreign keys intact."""
+from sqlalchemy import create_engine, text
+
+from app.migrations import MIGRATIONS, upgrade
+
+# Schema created by db.create_all() before versioned migrations existed
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, oid VARCHAR(100), name VARCHAR(120) NOT NULL, email VARCHAR(180) NOT NULL,
+        role VARCHAR(40) NOT NULL, status VARCHAR(40) NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (oid), UNIQUE (email))""",
+    """CREATE TABLE form_templates (
+        id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, form_code VARCHAR(50) NOT NULL,
+        latex_template_path VARCHAR(255) NOT NULL, fields_json JSON NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (form_code))""",
+    """CREATE TABLE signatures (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, image_path VARCHAR(255) NOT NULL, uploaded_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE requests (
+        id INTEGER NOT NULL, form_template_id INTEGER NOT NULL, requester_id INTEGER NOT NULL,
+        status VARCHAR(8) NOT NULL, form_data_json JSON NOT NULL, created_at DATETIME, updated_at DATETIME,
+        submitted_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(form_template_id) REFERENCES form_templates (id),
+        FOREIGN KEY(requester_id) REFERENCES users (id))""",
+    """CREATE TABLE approval_steps (
+        id INTEGER NOT NULL, request_id INTEGER NOT NULL, approver_id INTEGER NOT NULL, sequence INTEGER NOT NULL,
+        status VARCHAR(8) NOT NULL, comments TEXT, signed_pdf_path VARCHAR(255), actioned_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(request_id) REFERENCES requests (id),
+        FOREIGN KEY(approver_id) REFERENCES users (id))""",
+]
+
+BASELINE_ROWS = [
+    "INSERT INTO users (id, name, email, role, status) VALUES (1, 'Stu', 'stu@uh.edu', 'basicuser', 'active'), "
+    "(2, 'Ada', 'ada@uh.edu', 'admin', 'active')",
+    "INSERT INTO form_templates (id, name, form_code, latex_template_path, fields_json) "
+    "VALUES (1, 'FERPA', 'ferpa_auth', 'latex/ferpa.tex', '{}')",
+    "INSERT INTO requests (id, form_template_id, requester_id, status, form_data_json, submitted_at) "
+    "VALUES (1, 1, 1, 'approved', '{}', '2024-01-01 00:00:00')",
+    "INSERT INTO approval_steps (id, request_id, approver_id, sequence, status, actioned_at) "
+    "VALUES (1, 1, 2, 1, 'approved', '2024-01-02 00:00:00')",
+]
+
+
+def _baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for stmt in BASELINE_SCHEMA + BASELINE_ROWS:
+            conn.execute(text(stmt))
+    return engine
+
+
+def _assert_foreign_keys_intact(engine):
+    with engine.connect() as conn:
+        stale = conn.execute(text("SELECT name FROM sqlite_master WHERE instr(sql, 'new_') > 0")).scalars().all()
+        assert stale == []
+        assert conn.execute(text("PRAGMA foreign_key_check")).all() == []
+        conn.execute(text("PRAGMA foreign_keys = ON"))
+        conn.execute(text("INSERT INTO approval_steps (request_id, approver_id, sequence, status, version) "
+                          "VALUES (1, 2, 2, 'pending', 1)"))
+        conn.execute(text("INSERT INTO pdf_render_jobs (request_id, step_id, kind, status, signature_paths, attempts) "
+                          "VALUES (1, 1, 'stamp', 'queued', '[]', 0)"))
+        conn.rollback()
+
+
+def test_upgrade_from_baseline_keeps_foreign_keys(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    assert upgrade(engine) == [v for v, _, _ in MIGRATIONS]
+    _assert_foreign_keys_intact(engine)
+    with engine.connect() as conn:
+        requests_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'requests'")).scalar()
+        assert "AUTOINCREMENT" in requests_sql
+        assert conn.execute(text("SELECT count(*) FROM approval_steps")).scalar() == 1
+        assert conn.execute(text("SELECT pdf_backend FROM form_templates WHERE form_code = 'ferpa_auth'")).scalar() \
+            == "latex"
+
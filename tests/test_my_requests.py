@@ -0,0 +1,73 @@
+"""The My Requests page must issue the same number of SQL statements however many requests it lists."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.approvals.workflow import sync_progress
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+
+STATUSES = ["draft", "pending", "approved", "returned"]
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'my_requests.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _add_requests(requester, approver, n):
+    forms = FormTemplate.query.order_by(FormTemplate.id).all()
+    now = datetime.utcnow()
+    reqs = [Request(form_template_id=forms[i % len(forms)].id, requester_id=requester.id,
+                    form_data_json={"comments": "x" * 200}, status=STATUSES[i % len(STATUSES)],
+                    created_at=now - timedelta(minutes=i)) for i in range(n)]
+    db.session.add_all(reqs)
+    db.session.flush()
+    db.session.add_all([ApprovalStep(request_id=r.id, approver_id=approver.id, sequence=1, status="pending")
+                        for r in reqs if r.status == "pending"])
+    db.session.flush()
+    sync_progress(touch=False)
+    db.session.commit()
+
+
+def _statements_for_page(app, email):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = {"preferred_username": email, "name": email}
+    client.get("/approvals/my_requests")  # warm per-process caches
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        resp = client.get("/approvals/my_requests")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert resp.status_code == 200
+    return len(statements)
+
+
+def test_my_requests_statement_count_is_constant(app):
+    student = User(name="Student", email="student@example.edu")
+    approver = User(name="Approver", email="approver@example.edu", role="admin")
+    db.session.add_all([student, approver])
+    db.session.commit()
+
+    _add_requests(student, approver, 20)
+    with_n = _statements_for_page(app, student.email)
+    _add_requests(student, approver, 20)
+    with_2n = _statements_for_page(app, student.email)
+
+    assert with_n == with_2n
@@ -0,0 +1,75 @@
+"""PdfRenderCache: hits and misses, LRU eviction, and fetches racing an eviction."""
+import os
+
+from app.utils import pdf_cache
+from app.utils.pdf_cache import PdfRenderCache, render_cache_key
+
+
+def _pdf(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b"%PDF" + name.encode().ljust(size - 4, b"."))
+    return str(path)
+
+
+def _age(cache, key, seconds_ago):
+    t = os.path.getmtime(cache._path(key)) - seconds_ago
+    os.utime(cache._path(key), (t, t))
+
+
+def test_fetch_hit_and_miss(tmp_path):
+    cache = PdfRenderCache(str(tmp_path / "cache"))
+    dest = str(tmp_path / "out.pdf")
+    assert not cache.fetch("missing", dest)
+    assert not os.path.exists(dest)
+
+    cache.put("a", _pdf(tmp_path, "a.pdf"))
+    assert cache.fetch("a", dest)
+    assert open(dest, "rb").read() == open(tmp_path / "a.pdf", "rb").read()
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "max_bytes": cache.max_bytes}
+    assert [n for n in os.listdir(tmp_path) if n.endswith(".tmp")] == []
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = PdfRenderCache(str(tmp_path / "cache"), max_bytes=300)
+    for age, key in ((30, "a"), (20, "b"), (10, "c")):
+        cache.put(key, _pdf(tmp_path, f"{key}.pdf"))
+        _age(cache, key, age)
+    assert cache.fetch("a", str(tmp_path / "out.pdf"))  # a becomes the most recently used
+
+    cache.put("d", _pdf(tmp_path, "d.pdf"))
+    assert sorted(os.listdir(cache.cache_dir)) == ["a.pdf", "c.pdf", "d.pdf"]
+    assert cache.stats()["evictions"] == 1
+
+    _age(cache, "d", 5)
+    cache.put("e", _pdf(tmp_path, "e.pdf", size=150))  # needs 150 bytes: c, then d, go
+    assert sorted(os.listdir(cache.cache_dir)) == ["a.pdf", "e.pdf"]
+    assert cache.stats()["evictions"] == 3
+    assert cache.evict() == 0
+
+
+def test_fetch_survives_eviction_after_open(tmp_path, monkeypatch):
+    cache = PdfRenderCache(str(tmp_path / "cache"))
+    cache.put("a", _pdf(tmp_path, "a.pdf", size=70_000))
+    real_utime = os.utime
+
+    def evict_then_touch(path, *args, **kwargs):
+        os.remove(path)  # another worker evicts the entry right after fetch opened it
+        real_utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(pdf_cache.os, "utime", evict_then_touch)
+    dest = str(tmp_path / "out.pdf")
+    assert cache.fetch("a", dest)
+    assert os.path.getsize(dest) == 70_000
+    monkeypatch.undo()
+    assert not cache.fetch("a", dest)  # gone now: a plain miss
+
+
+def test_key_covers_source_and_signature_bytes(tmp_path):
+    sig = tmp_path / "sig.png"
+    sig.write_bytes(b"one")
+    key = render_cache_key("source", [str(sig)])
+    assert key == render_cache_key("source", [str(sig)])
+    assert key != render_cache_key("other source", [str(sig)])
+    assert key != render_cache_key("source", [])
+    sig.write_bytes(b"two!")
+    assert key != render_cache_key("source", [str(sig)])
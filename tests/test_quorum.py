@@ -0,0 +1,119 @@
+"""Parallel stages: quorum completion, skipped members and stage order."""
+from collections import Counter
+
+import pytest
+
+from app import create_app
+from app.approvals.events import request_timeline
+from app.approvals.routing import route_request
+from app.approvals.workflow import (actionable_step, approve_step, progress_mismatches, quorum_label,
+                                    return_step, stage_summary)
+from app.models import db, FormTemplate, Request, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'quorum.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def routed(app):
+    """A request routed through a 2-of-3 stage, an all-of-2 stage and a single approver."""
+    student = User(name="Student", email="student@x.edu")
+    approvers = [User(name=f"Approver {i}", email=f"a{i}@x.edu", role="admin") for i in range(6)]
+    db.session.add_all([student] + approvers)
+    db.session.flush()
+    form = FormTemplate.query.first()
+    form.routing_json = [{"steps": [
+        {"parallel": [{"user": a.email} for a in approvers[:3]], "quorum": 2},
+        {"parallel": [{"user": a.email} for a in approvers[3:5]], "quorum": "all"},
+        {"user": approvers[5].email},
+    ]}]
+    req_obj = Request(form_template_id=form.id, requester_id=student.id, form_data_json={}, status="pending")
+    db.session.add(req_obj)
+    db.session.flush()
+    route_request(req_obj)
+    db.session.commit()
+    return req_obj, approvers
+
+
+def _approve(req_obj, user, expected_version=None):
+    step = actionable_step(req_obj, user.id)
+    if step is None:
+        return None
+    outcome = approve_step(req_obj, step, None, expected_version)
+    db.session.commit()
+    return outcome
+
+
+def _statuses(req_obj, sequence):
+    return Counter(s.status for s in req_obj.approval_steps if s.sequence == sequence)
+
+
+def test_quorum_completes_stage_and_skips_the_rest(routed):
+    req_obj, a = routed
+    assert [(st["quorum"], st["needed"]) for st in stage_summary(req_obj)] == [("2 of 3", 2), ("all 2", 2), ("", 1)]
+
+    later = next(s for s in req_obj.approval_steps if s.approver_id == a[3].id)
+    assert actionable_step(req_obj, a[3].id) is None
+    assert approve_step(req_obj, later, None) is None  # stage 2 isn't current yet
+    db.session.rollback()
+    assert _approve(req_obj, a[0]) == "recorded"
+    assert req_obj.current_stage == 1 and req_obj.steps_approved == 1
+    assert _approve(req_obj, a[1]) == "stage_complete"
+    assert _statuses(req_obj, 1) == {"approved": 2, "skipped": 1}
+    assert _approve(req_obj, a[2]) is None  # skipped members can't act any more
+    assert req_obj.current_stage == 2 and req_obj.current_approver_id is None
+
+    assert _approve(req_obj, a[3]) == "recorded"
+    assert _approve(req_obj, a[4]) == "stage_complete"
+    assert req_obj.current_stage == 3 and req_obj.current_approver_id == a[5].id
+    assert _approve(req_obj, a[5]) == "request_approved"
+
+    assert req_obj.status == "approved" and req_obj.current_stage is None
+    assert (req_obj.steps_total, req_obj.steps_approved) == (6, 5)
+    events = [(e.event, e.actor_email) for e in request_timeline(req_obj.id)]
+    assert events == [("approved", "a0@x.edu"), ("approved", "a1@x.edu"), ("skipped", "a2@x.edu"),
+                      ("approved", "a3@x.edu"), ("approved", "a4@x.edu"),
+                      ("approved", "a5@x.edu"), ("completed", None)]
+    assert progress_mismatches() == []
+
+
+def test_stale_version_is_a_conflict(routed):
+    req_obj, a = routed
+    seen = req_obj.version
+    assert _approve(req_obj, a[0], expected_version=seen) == "recorded"
+    assert _approve(req_obj, a[1], expected_version=seen) is None
+    db.session.rollback()
+    assert _statuses(req_obj, 1) == {"approved": 1, "pending": 2}
+    assert _approve(req_obj, a[1], expected_version=req_obj.version) == "stage_complete"
+
+
+def test_return_resets_every_stage(routed):
+    req_obj, a = routed
+    _approve(req_obj, a[0])
+    _approve(req_obj, a[1])
+    step = actionable_step(req_obj, a[3].id)
+    assert return_step(req_obj, step, "Missing transcript")
+    db.session.commit()
+
+    assert req_obj.status == "returned" and req_obj.current_stage is None
+    assert Counter(s.status for s in req_obj.approval_steps) == {"pending": 5, "returned": 1}
+    assert actionable_step(req_obj, a[0].id) is None
+    assert progress_mismatches() == []
+
+
+@pytest.mark.parametrize("quorum, members, label", [
+    (None, 1, ""), (None, 3, "all 3"), (1, 3, "any 1 of 3"), (2, 5, "2 of 5"), (4, 3, "all 3"),
+])
+def test_quorum_label(quorum, members, label):
+    assert quorum_label(quorum, members) == label
@@ -0,0 +1,124 @@
+"""Routing rules: condition matching, stage parsing and approver resolution."""
+import pytest
+
+from app import create_app
+from app.approvals.routing import CompiledRoute, RoutingError, route_request
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'routing.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _request(requester, rules, form_data=None):
+    form = FormTemplate.query.first()
+    form.routing_json = rules
+    req_obj = Request(form_template_id=form.id, requester_id=requester.id, form_data_json=form_data or {},
+                      status="pending")
+    db.session.add(req_obj)
+    db.session.flush()
+    return req_obj
+
+
+def _chain(req_obj):
+    """[(sequence, approver email, quorum)] of the request's steps."""
+    steps = ApprovalStep.query.filter_by(request_id=req_obj.id).order_by(ApprovalStep.sequence, ApprovalStep.id)
+    return [(s.sequence, s.approver.email, s.quorum) for s in steps]
+
+
+def test_first_matching_rule_supplies_the_steps():
+    route = CompiledRoute([
+        {"when": {"reason": {"startswith": ["15.", "16."]}}, "steps": [{"user": "grad@x.edu"}]},
+        {"when": {"campus": ["Clear Lake", "Victoria"], "level": {"not_in": ["PhD"]}},
+         "steps": [{"user": "regional@x.edu"}]},
+        {"steps": [{"role": "admin"}]},
+    ])
+    assert route.stages_for({"reason": "15.2 Late drop"}) == [([("user", "grad@x.edu")], None)]
+    assert route.stages_for({"campus": ["Main", "Victoria"], "level": "MS"}) == [([("user", "regional@x.edu")], None)]
+    assert route.stages_for({"campus": "Victoria", "level": "PhD"}) == [([("role", "admin")], None)]
+    assert route.stages_for({}) == [([("role", "admin")], None)]
+
+
+@pytest.mark.parametrize("rules", [
+    {"steps": [{"role": "admin"}]},  # not a list
+    [{"when": {"campus": "Main"}}],  # no steps
+    [{"when": {"campus": {"like": "M%"}}, "steps": [{"role": "admin"}]}],
+    [{"steps": [{"group": "deans"}]}],
+    [{"steps": [{"parallel": [{"role": "admin"}], "quorum": 2}]}],
+    [{"steps": [{"parallel": []}]}],
+])
+def test_malformed_rules_are_rejected(rules):
+    with pytest.raises(RoutingError):
+        CompiledRoute(rules)
+
+
+def test_roles_resolve_to_distinct_least_loaded_users_and_never_the_requester(app):
+    admins = [User(name=f"Admin {i}", email=f"admin{i}@x.edu", role="admin") for i in range(3)]
+    db.session.add_all(admins)
+    db.session.flush()
+    busy = _request(admins[2], [{"steps": [{"user": "admin0@x.edu"}]}])
+    route_request(busy)
+
+    # admin0 has a pending step and admin2 is the requester, so admin1 comes first
+    req_obj = _request(admins[2], [{"steps": [
+        {"parallel": [{"role": "admin"}, {"user": "admin1@x.edu"}], "quorum": "any"},
+    ]}])
+    with pytest.raises(RoutingError, match="not enough distinct approvers"):
+        route_request(req_obj)
+
+    req_obj.form_template.routing_json = [{"steps": [{"role": "admin"}, {"role": "admin"}]}]
+    assert route_request(req_obj) == 2
+    assert _chain(req_obj) == [(1, "admin1@x.edu", None), (2, "admin0@x.edu", None)]
+    assert req_obj.current_stage == 1 and req_obj.current_approver_id == admins[1].id
+
+
+def test_requester_and_missing_approvers_raise(app):
+    student = User(name="Student", email="student@x.edu")
+    admin = User(name="Admin", email="admin@x.edu", role="admin")
+    gone = User(name="Gone", email="gone@x.edu", role="admin", status="deactivated")
+    db.session.add_all([student, admin, gone])
+    db.session.flush()
+
+    with pytest.raises(RoutingError, match="is the requester"):
+        route_request(_request(admin, [{"steps": [{"user": "Admin@x.edu"}]}]))
+    with pytest.raises(RoutingError, match="does not exist or is deactivated"):
+        route_request(_request(student, [{"steps": [{"user": "gone@x.edu"}]}]))
+    # one active admin can't fill two stages, and the requester doesn't count
+    with pytest.raises(RoutingError, match="not enough distinct active users"):
+        route_request(_request(student, [{"steps": [{"role": "admin"}, {"role": "admin"}]}]))
+    with pytest.raises(RoutingError, match="not enough distinct active users"):
+        route_request(_request(admin, [{"steps": [{"role": "admin"}]}]))
+    with pytest.raises(RoutingError, match="no routing rule"):
+        route_request(_request(student, [{"when": {"campus": "Main"}, "steps": [{"role": "admin"}]}]))
+    assert ApprovalStep.query.count() == 0
+
+
+def test_parallel_stage_quorum_and_rerouting_changed_rules(app):
+    student = User(name="Student", email="student@x.edu")
+    admins = [User(name=f"Admin {i}", email=f"admin{i}@x.edu", role="admin") for i in range(3)]
+    db.session.add_all([student] + admins)
+    db.session.flush()
+
+    req_obj = _request(student, [{"steps": [
+        {"parallel": [{"user": "admin0@x.edu"}, {"user": "admin1@x.edu"}], "quorum": "any"},
+        {"user": "admin2@x.edu"},
+    ]}])
+    assert route_request(req_obj) == 3
+    assert _chain(req_obj) == [(1, "admin0@x.edu", 1), (1, "admin1@x.edu", 1), (2, "admin2@x.edu", None)]
+    assert req_obj.current_stage == 1 and req_obj.current_approver_id is None
+    assert route_request(req_obj) == 0  # already routed
+
+    # the compiled rules are replaced when routing_json changes
+    other = _request(student, [{"steps": [{"user": "admin2@x.edu"}]}])
+    route_request(other)
+    assert _chain(other) == [(1, "admin2@x.edu", None)]
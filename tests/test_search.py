@@ -0,0 +1,106 @@
+"""Request search: FTS query escaping, ranking, the LIKE fallback and who sees which requests."""
+import pytest
+from sqlalchemy import text
+
+from app import create_app
+from app.models import db, ApprovalStep, FormTemplate, Request, User
+from app.utils.search_index import FTS_TABLE, fts_available, fts_query, index_request, search_requests
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(start_workers=False, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'search.db'}",
+        "SECRET_KEY": "test",
+        "RENDER_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def people(app):
+    """Two requests; approver1 has a step on the first, approver2 on none."""
+    users = {
+        "student": User(name="Dana Student", email="dana@x.edu"),
+        "admin": User(name="Admin", email="admin@x.edu", role="admin"),
+        "approver1": User(name="First Approver", email="one@x.edu"),
+        "approver2": User(name="Second Approver", email="two@x.edu"),
+    }
+    db.session.add_all(users.values())
+    db.session.flush()
+    form = FormTemplate.query.first()
+    transcript = Request(form_template_id=form.id, requester_id=users["student"].id, status="pending",
+                         form_data_json={"comments": "Official transcript for course a_b", "tags": ["spring"]})
+    withdrawal = Request(form_template_id=form.id, requester_id=users["student"].id, status="pending",
+                         form_data_json={"comments": "Medical withdrawal, transfer axb credit"})
+    db.session.add_all([transcript, withdrawal])
+    db.session.flush()
+    db.session.add(ApprovalStep(request_id=transcript.id, approver_id=users["approver1"].id, sequence=1,
+                                status="pending"))
+    for r in (transcript, withdrawal):
+        index_request(r)
+    db.session.commit()
+    users["transcript"], users["withdrawal"] = transcript.id, withdrawal.id
+    return users
+
+
+def _ids(q, user):
+    hits, total = search_requests(q, user)
+    assert total == len(hits)
+    return [r.id for r, _snippet in hits]
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("transcript", '"transcript"*'),
+    ("official TRANS", '"official" "TRANS"*'),
+    ('-medical OR "x" NEAR(a b) col:val', '"medical" "OR" "x" "NEAR" "a" "b" "col" "val"*'),
+    ("  ", None),
+    ('*"()-:', None),
+])
+def test_fts_query_quotes_every_term(q, expected):
+    assert fts_query(q) == expected
+
+
+def test_search_ranks_prefixes_and_survives_fts_syntax(people):
+    assert fts_available(db.session.connection())
+    admin = people["admin"]
+    assert _ids("transcr", admin) == [people["transcript"]]
+    assert _ids("dana", admin) == [people["withdrawal"], people["transcript"]]  # newest first on a tie
+    assert _ids("spring official", admin) == [people["transcript"]]
+    assert _ids("medical -transfer", admin) == [people["withdrawal"]]  # '-' is not NOT
+    for q in ('"', "NEAR(", "AND OR NOT", "comments:spring", "*"):
+        search_requests(q, admin)  # no OperationalError from FTS syntax
+    hits, _ = search_requests("official", admin)
+    assert "[Official]" in hits[0][1]
+
+
+def test_approvers_only_see_their_requests(people):
+    assert _ids("dana", people["approver1"]) == [people["transcript"]]
+    assert _ids("dana", people["approver2"]) == []
+    assert _ids("withdrawal", people["approver1"]) == []
+
+
+def test_search_endpoint(app, people):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = {"preferred_username": "one@x.edu"}
+    body = client.get("/approvals/approver/search?q=dana").get_json()
+    assert (body["total"], [r["id"] for r in body["results"]]) == (1, [people["transcript"]])
+
+    people["approver1"].status = "deactivated"
+    db.session.commit()
+    assert client.get("/approvals/approver/search?q=dana").status_code == 403
+
+
+def test_like_fallback_escapes_wildcards_and_keeps_visibility(people):
+    db.session.execute(text(f"DROP TABLE {FTS_TABLE}"))
+    db.session.commit()
+    assert not fts_available(db.session.connection())
+    assert _ids("a_b", people["admin"]) == [people["transcript"]]  # '_' is literal, not "any character"
+    assert _ids("dana withdrawal", people["admin"]) == [people["withdrawal"]]
+    assert _ids("dana", people["approver1"]) == [people["transcript"]]
+    assert _ids("dana", people["approver2"]) == []
@@ -0,0 +1,12 @@
+"""
+Production WSGI entry point: `gunicorn wsgi:app` (settings in gunicorn.conf.py).
+
+The app is built without its background threads (PDF render pool, session
+purger, directory sync) because gunicorn may load it in the master before
+forking; gunicorn.conf.py starts them in each worker. Other WSGI servers
+should call start_background_workers(app) (from the app package) once
+per process.
+"""
+from app import create_app
+
+app = create_app(start_workers=False)